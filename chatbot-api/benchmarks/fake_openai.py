@@ -0,0 +1,179 @@
+import asyncio
+import base64
+import hashlib
+import json
+import socket
+import threading
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_REPLY_WORDS = (
+    "motion", "is", "simply", "the", "story", "of", "a", "body", "and", "the", "forces",
+    "that", "act", "on", "it", "every", "change", "needs", "a", "cause", "so", "ask", "why",
+)
+
+
+@dataclass(frozen=True)
+class FakeOpenAIProfile:
+    """Latency and size of the fake OpenAI responses.
+
+    Args:
+        time_to_first_token (float): Seconds before the first token of a completion.
+        tokens_per_second (float): Generation speed after the first token.
+        reply_tokens (int): Tokens per completion.
+        embedding_latency (float): Seconds per embedding request.
+        embedding_dimension (int): Size of the returned vectors.
+    """
+
+    time_to_first_token: float = 0.3
+    tokens_per_second: float = 60.0
+    reply_tokens: int = 80
+    embedding_latency: float = 0.05
+    embedding_dimension: int = 1536
+
+
+def fake_embedding(text: str, dimension: int) -> np.ndarray:
+    """Unit vector derived from the text, so the same text always embeds the same."""
+
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def _estimate_tokens(messages: list[dict]) -> int:
+    return sum(len(str(message.get("content") or "")) for message in messages) // 4 + 1
+
+
+def create_fake_openai_app(profile: FakeOpenAIProfile) -> FastAPI:
+    """OpenAI-compatible app serving chat completions and embeddings with `profile` latency."""
+
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "gpt-4o")
+        usage = {
+            "prompt_tokens": _estimate_tokens(body.get("messages", [])),
+            "completion_tokens": profile.reply_tokens,
+            "total_tokens": _estimate_tokens(body.get("messages", [])) + profile.reply_tokens,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        tokens = [
+            ("" if i == 0 else " ") + _REPLY_WORDS[i % len(_REPLY_WORDS)] for i in range(profile.reply_tokens)
+        ]
+
+        if not body.get("stream"):
+            await asyncio.sleep(profile.time_to_first_token + profile.reply_tokens / profile.tokens_per_second)
+            return JSONResponse(
+                {
+                    "id": "chatcmpl-benchmark",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": "".join(tokens)},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": usage,
+                }
+            )
+
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        def chunk(choices: list[dict], **extra) -> str:
+            payload = {
+                "id": "chatcmpl-benchmark",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": choices,
+                **extra,
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def stream():
+            start = time.perf_counter()
+            yield chunk([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+            for i, token in enumerate(tokens):
+                # Paced against the start time, so sleep overhead does not add up
+                delay = start + profile.time_to_first_token + i / profile.tokens_per_second - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                yield chunk([{"index": 0, "delta": {"content": token}, "finish_reason": None}])
+            yield chunk([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if include_usage:
+                yield chunk([], usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(stream(), media_type="text/event-stream")
+
+    @app.post("/v1/embeddings")
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        await asyncio.sleep(profile.embedding_latency)
+
+        data = []
+        for index, text in enumerate(inputs):
+            vector = fake_embedding(str(text), profile.embedding_dimension)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.astype("<f4").tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": index, "embedding": embedding})
+
+        return JSONResponse(
+            {
+                "object": "list",
+                "data": data,
+                "model": body.get("model", "text-embedding-3-small"),
+                "usage": {"prompt_tokens": len(inputs), "total_tokens": len(inputs)},
+            }
+        )
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class BackgroundServer:
+    """Run an ASGI app with uvicorn on its own thread and event loop.
+
+    Args:
+        app: The ASGI app.
+        port (int | None, optional): Port to listen on, a free one by default.
+    """
+
+    def __init__(self, app, port: int | None = None) -> None:
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self._server = uvicorn.Server(
+            uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", lifespan="on")
+        )
+        self._thread = threading.Thread(target=self._server.run, name=f"server-{self.port}", daemon=True)
+
+    def start(self, timeout: float = 30.0) -> "BackgroundServer":
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if not self._thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError(f"Server on port {self.port} did not start")
+            time.sleep(0.05)
+        return self
+
+    def stop(self, timeout: float = 30.0) -> None:
+        self._server.should_exit = True
+        self._thread.join(timeout)
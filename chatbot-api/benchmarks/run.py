@@ -0,0 +1,452 @@
+"""Measure latency and throughput of the conversation paths without live services.
+
+OpenAI is replaced by a local server with configurable latency and token rate,
+Pinecone by an in-memory vector store and MongoDB by an in-memory checkpointer,
+so the numbers only move when the graph, checkpointing or streaming code does.
+
+Usage:
+    PYTHONPATH=src python -m benchmarks.run --scenario all --concurrency 16 --turns 6
+    PYTHONPATH=src python -m benchmarks.run --output results.json
+    PYTHONPATH=src python -m benchmarks.run --baseline results.json --max-regression 0.2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import asdict, dataclass, field
+from typing import AsyncIterator, Awaitable, Callable
+
+from benchmarks.fake_openai import BackgroundServer, FakeOpenAIProfile, create_fake_openai_app
+
+SCENARIOS = ("direct", "chat", "chat_stream", "ws")
+
+# Greetings skip retrieval, the physics questions go through RAG
+MESSAGES = (
+    "Hello!",
+    "Why does a ball keep rolling after I stop pushing it?",
+    "What is the relation between force, mass and acceleration?",
+    "That makes sense, tell me more.",
+    "How does friction slow a moving object down?",
+    "Thanks, what would you ask me next?",
+)
+
+# Histograms of `mpdagents.infrastructure.metrics` and the label naming their stage
+STAGE_METRICS = {
+    "mpd_graph_node_duration_seconds": ("node", "node"),
+    "mpd_external_call_duration_seconds": ("call", "operation"),
+    "mpd_llm_time_to_first_token_seconds": ("llm", None),
+    "mpd_llm_generation_duration_seconds": ("llm", None),
+}
+
+# Runs one turn and returns when its first chunk arrived, or None if it was not streamed
+Turn = Callable[[str], Awaitable[float | None]]
+
+
+@dataclass
+class ScenarioResult:
+    """Latencies of one scenario, in milliseconds."""
+
+    scenario: str
+    turns: int
+    errors: int
+    turns_per_second: float
+    latency_ms: dict[str, float]
+    first_chunk_ms: dict[str, float] | None = None
+    stages_ms: dict[str, dict[str, float]] = field(default_factory=dict)
+
+
+def configure_environment(openai_url: str) -> None:
+    """Point every external service at a local stand-in. Must run before importing mpdagents."""
+
+    os.environ.update(
+        {
+            "OPENAI_API_KEY": "sk-benchmark",
+            "OPENAI_BASE_URL": f"{openai_url}/v1",
+            # Never connected to, the checkpointer and the vector store are replaced
+            "MONGO_URI": "mongodb://127.0.0.1:1",
+            "MONGO_DB_NAME": "benchmark",
+            "MONGO_STATE_CHECKPOINT_COLLECTION": "checkpoints",
+            "MONGO_STATE_WRITES_COLLECTION": "checkpoint_writes",
+            "PINECONE_API_KEY": "benchmark",
+            "PINECONE_INDEX_NAME": "benchmark",
+            "COMET_API_KEY": "",
+            "OPIK_TRACK_DISABLE": "true",
+            "TRACING_SAMPLE_RATE": "0",
+            # The retriever is started by the benchmark, with the in-memory vector store
+            "STARTUP_MODE": "lazy",
+        }
+    )
+
+
+def percentiles(samples: list[float]) -> dict[str, float]:
+    """p50, p95, p99 and mean of samples in seconds, in milliseconds (nearest rank)."""
+
+    if not samples:
+        return {}
+
+    ordered = sorted(samples)
+
+    def rank(q: float) -> float:
+        return ordered[min(len(ordered) - 1, max(0, round(q * len(ordered)) - 1))] * 1000
+
+    return {"p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99), "mean": sum(ordered) / len(ordered) * 1000}
+
+
+def stage_totals() -> dict[str, tuple[float, float]]:
+    """Count and total seconds per stage, summed over characters and outcomes."""
+
+    from prometheus_client import REGISTRY
+
+    totals: dict[str, tuple[float, float]] = {}
+    for metric in REGISTRY.collect():
+        if metric.name not in STAGE_METRICS:
+            continue
+
+        prefix, label = STAGE_METRICS[metric.name]
+        for sample in metric.samples:
+            if sample.name.endswith("_count"):
+                index = 0
+            elif sample.name.endswith("_sum"):
+                index = 1
+            else:
+                continue
+
+            if label is not None:
+                stage = f"{prefix}:{sample.labels[label]}"
+            else:
+                stage = f"{prefix}:{metric.name.removeprefix('mpd_llm_').removesuffix('_seconds')}"
+            count, total = totals.get(stage, (0.0, 0.0))
+            totals[stage] = (count + sample.value, total) if index == 0 else (count, total + sample.value)
+
+    return totals
+
+
+async def measure(
+    scenario: str,
+    open_conversation: Callable[[str, str], AsyncIterator[Turn]],
+    characters: list[str],
+    args: argparse.Namespace,
+) -> ScenarioResult:
+    """Run ``args.conversations`` conversations of ``args.turns`` turns, ``args.concurrency`` at a time."""
+
+    run_id = uuid.uuid4().hex[:8]
+    latencies: list[float] = []
+    first_chunks: list[float] = []
+    errors: list[str] = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def conversation(index: int, turns: int, record: bool) -> None:
+        thread_id = f"benchmark-{run_id}-{scenario}-{index}-{record}"
+        async with semaphore, open_conversation(thread_id, characters[index % len(characters)]) as turn:
+            for turn_index in range(turns):
+                start = time.perf_counter()
+                try:
+                    first_chunk = await turn(MESSAGES[(index + turn_index) % len(MESSAGES)])
+                except Exception as e:
+                    errors.append(str(e))
+                    continue
+
+                if record:
+                    latencies.append(time.perf_counter() - start)
+                    if first_chunk is not None:
+                        first_chunks.append(first_chunk - start)
+
+    # Opens connections, resolves the prompts and loads the tokenizer before measuring
+    await asyncio.gather(*(conversation(index, 1, record=False) for index in range(len(characters))))
+    errors.clear()
+
+    stages_before = stage_totals()
+    start = time.perf_counter()
+    await asyncio.gather(*(conversation(index, args.turns, record=True) for index in range(args.conversations)))
+    elapsed = time.perf_counter() - start
+
+    stages = {}
+    for stage, (count, total) in sorted(stage_totals().items()):
+        count_before, total_before = stages_before.get(stage, (0.0, 0.0))
+        if count > count_before:
+            stages[stage] = {
+                "count": count - count_before,
+                "mean": (total - total_before) / (count - count_before) * 1000,
+            }
+
+    if errors:
+        print(f"{scenario}: {len(errors)} turns failed, first error: {errors[0]}")
+
+    return ScenarioResult(
+        scenario=scenario,
+        turns=len(latencies),
+        errors=len(errors),
+        turns_per_second=len(latencies) / elapsed if elapsed else 0.0,
+        latency_ms=percentiles(latencies),
+        first_chunk_ms=percentiles(first_chunks) or None,
+        stages_ms=stages,
+    )
+
+
+async def run_direct(args: argparse.Namespace, characters: list[str]) -> ScenarioResult:
+    """Call `get_response` in process, the path without HTTP or streaming."""
+
+    from mpdagents.application.conversation_service.generate_response import (
+        close_conversation_graph,
+        get_response,
+        init_conversation_graph,
+    )
+    from mpdagents.application.conversation_service.summarization import (
+        close_conversation_summarizer,
+        init_conversation_summarizer,
+    )
+    from mpdagents.application.conversation_service.workflow.chains import close_openai_http_client
+    from mpdagents.application.rag.rag import close_rag_retriever, init_rag_retriever
+    from mpdagents.domain.character_registry import get_character_registry
+
+    from benchmarks.stand_ins import InMemoryVectorStore, in_memory_checkpointer
+
+    @asynccontextmanager
+    async def open_conversation(thread_id: str, character_id: str) -> AsyncIterator[Turn]:
+        character = get_character_registry().get(character_id)
+
+        async def turn(message: str) -> None:
+            await get_response(
+                messages=message,
+                thread_id=thread_id,
+                character_id=character_id,
+                character_name=character.name,
+                character_style=character.style,
+                character_perspective=character.perspective,
+                character_prompt=character.system_prompt,
+            )
+
+        yield turn
+
+    async with in_memory_checkpointer(args.checkpoint_latency)() as checkpointer:
+        graph = init_conversation_graph(checkpointer)
+        init_conversation_summarizer(graph)
+        await init_rag_retriever(vector_store=InMemoryVectorStore(latency=args.vector_latency))
+        try:
+            return await measure("direct", open_conversation, characters, args)
+        finally:
+            await close_conversation_summarizer()
+            await close_rag_retriever()
+            close_conversation_graph()
+            await close_openai_http_client()
+
+
+def start_api(args: argparse.Namespace) -> BackgroundServer:
+    """Serve the API on a local port, with the stand-ins in place of MongoDB and Pinecone."""
+
+    from mpdagents.application.rag.rag import init_rag_retriever
+    from mpdagents.infrastructure import api
+
+    from benchmarks.stand_ins import InMemoryVectorStore, in_memory_checkpointer
+
+    api.pooled_checkpointer = in_memory_checkpointer(args.checkpoint_latency)
+    app_lifespan = api.lifespan
+
+    @asynccontextmanager
+    async def lifespan(app):
+        async with app_lifespan(app):
+            await init_rag_retriever(vector_store=InMemoryVectorStore(latency=args.vector_latency))
+            yield
+
+    api.app.router.lifespan_context = lifespan
+    return BackgroundServer(api.app).start()
+
+
+async def run_chat(url: str, args: argparse.Namespace, characters: list[str]) -> ScenarioResult:
+    """POST /chat, one reply per request."""
+
+    import httpx
+
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout) as client:
+
+        @asynccontextmanager
+        async def open_conversation(thread_id: str, character_id: str) -> AsyncIterator[Turn]:
+            async def turn(message: str) -> None:
+                response = await client.post(
+                    "/chat", json={"message": message, "thread_id": thread_id, "character_id": character_id}
+                )
+                response.raise_for_status()
+
+            yield turn
+
+        return await measure("chat", open_conversation, characters, args)
+
+
+async def run_chat_stream(url: str, args: argparse.Namespace, characters: list[str]) -> ScenarioResult:
+    """POST /chat/stream, the reply as Server-Sent Events."""
+
+    import httpx
+
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout) as client:
+
+        @asynccontextmanager
+        async def open_conversation(thread_id: str, character_id: str) -> AsyncIterator[Turn]:
+            async def turn(message: str) -> float | None:
+                first_chunk = None
+                async with client.stream(
+                    "POST",
+                    "/chat/stream",
+                    json={"message": message, "thread_id": thread_id, "character_id": character_id},
+                ) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if line == "event: token" and first_chunk is None:
+                            first_chunk = time.perf_counter()
+                        elif line == "event: error":
+                            raise RuntimeError("The stream ended with an error event")
+                return first_chunk
+
+            yield turn
+
+        return await measure("chat_stream", open_conversation, characters, args)
+
+
+async def run_ws(url: str, args: argparse.Namespace, characters: list[str]) -> ScenarioResult:
+    """/ws/chat, one socket per conversation kept open across its turns."""
+
+    from websockets.asyncio.client import connect
+
+    @asynccontextmanager
+    async def open_conversation(thread_id: str, character_id: str) -> AsyncIterator[Turn]:
+        async with connect(f"{url.replace('http', 'ws', 1)}/ws/chat", open_timeout=args.timeout) as websocket:
+
+            async def turn(message: str) -> float | None:
+                await websocket.send(
+                    json.dumps({"message": message, "thread_id": thread_id, "character_id": character_id})
+                )
+                first_chunk = None
+                while True:
+                    frame = json.loads(await asyncio.wait_for(websocket.recv(), args.timeout))
+                    if "error" in frame:
+                        raise RuntimeError(frame["error"])
+                    if "chunk" in frame and first_chunk is None:
+                        first_chunk = time.perf_counter()
+                    if frame.get("streaming") is False:
+                        return first_chunk
+
+            yield turn
+
+    return await measure("ws", open_conversation, characters, args)
+
+
+async def benchmark(args: argparse.Namespace) -> list[ScenarioResult]:
+    from mpdagents.domain.character_registry import get_character_registry
+
+    characters = list(get_character_registry().ids)
+    scenarios = SCENARIOS if args.scenario == "all" else (args.scenario,)
+    results = []
+
+    if "direct" in scenarios:
+        results.append(await run_direct(args, characters))
+
+    api_scenarios = [scenario for scenario in scenarios if scenario != "direct"]
+    if api_scenarios:
+        server = await asyncio.to_thread(start_api, args)
+        try:
+            runners = {"chat": run_chat, "chat_stream": run_chat_stream, "ws": run_ws}
+            for scenario in api_scenarios:
+                results.append(await runners[scenario](server.url, args, characters))
+        finally:
+            await asyncio.to_thread(server.stop)
+
+    return results
+
+
+def print_report(results: list[ScenarioResult]) -> None:
+    print(f"{'scenario':<12}{'turns':>7}{'errors':>8}{'turns/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'first chunk p50/p95 ms':>26}")
+    for result in results:
+        latency = result.latency_ms or {"p50": 0.0, "p95": 0.0, "p99": 0.0}
+        first_chunk = (
+            f"{result.first_chunk_ms['p50']:.0f} / {result.first_chunk_ms['p95']:.0f}" if result.first_chunk_ms else "-"
+        )
+        print(
+            f"{result.scenario:<12}{result.turns:>7}{result.errors:>8}{result.turns_per_second:>9.1f}"
+            f"{latency['p50']:>9.0f}{latency['p95']:>9.0f}{latency['p99']:>9.0f}{first_chunk:>26}"
+        )
+
+    for result in results:
+        print(f"\n{result.scenario + ' stages':<38}{'count':>8}{'mean ms':>10}")
+
+        for stage, stats in result.stages_ms.items():
+            print(f"  {stage:<36}{stats['count']:>8.0f}{stats['mean']:>10.1f}")
+
+
+def find_regressions(results: list[ScenarioResult], baseline: dict, max_regression: float) -> list[str]:
+    """Scenarios whose p95 latency grew by more than ``max_regression`` over the baseline."""
+
+    regressions = []
+    for result in results:
+        previous = baseline.get("scenarios", {}).get(result.scenario)
+        if not previous or not previous["latency_ms"] or not result.latency_ms:
+            continue
+
+        limit = previous["latency_ms"]["p95"] * (1 + max_regression)
+        if result.latency_ms["p95"] > limit:
+            regressions.append(
+                f"{result.scenario}: p95 {result.latency_ms['p95']:.0f} ms, "
+                f"baseline {previous['latency_ms']['p95']:.0f} ms (limit {limit:.0f} ms)"
+            )
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the conversation paths against local stand-ins.")
+    parser.add_argument("--scenario", default="all", choices=["all", *SCENARIOS])
+    parser.add_argument("--concurrency", type=int, default=8, help="Conversations running at the same time.")
+    parser.add_argument("--conversations", type=int, default=32, help="Conversations per scenario.")
+    parser.add_argument("--turns", type=int, default=4, help="Turns per conversation.")
+    parser.add_argument("--llm-first-token", type=float, default=0.3, help="Seconds to the first LLM token.")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--llm-reply-tokens", type=int, default=80)
+    parser.add_argument("--embedding-latency", type=float, default=0.05)
+    parser.add_argument("--vector-latency", type=float, default=0.03, help="Seconds per vector store query.")
+    parser.add_argument("--checkpoint-latency", type=float, default=0.005, help="Seconds per checkpoint load or write.")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds before a turn is counted as failed.")
+    parser.add_argument("--output", help="Write the results as JSON, e.g. to use as a baseline.")
+    parser.add_argument("--baseline", help="Results of an earlier run to compare the p95 latencies with.")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed p95 growth over the baseline.")
+    args = parser.parse_args()
+
+    fake_openai = BackgroundServer(
+        create_fake_openai_app(
+            FakeOpenAIProfile(
+                time_to_first_token=args.llm_first_token,
+                tokens_per_second=args.llm_tokens_per_second,
+                reply_tokens=args.llm_reply_tokens,
+                embedding_latency=args.embedding_latency,
+            )
+        )
+    ).start()
+    configure_environment(fake_openai.url)
+    try:
+        results = asyncio.run(benchmark(args))
+    finally:
+        fake_openai.stop()
+
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(
+                {"args": vars(args), "scenarios": {result.scenario: asdict(result) for result in results}}, file, indent=2
+            )
+
+    failed = [result.scenario for result in results if result.errors]
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            regressions = find_regressions(results, json.load(file), args.max_regression)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+
+    if failed or regressions:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import asyncio
+import zlib
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Sequence
+
+import numpy as np
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.memory import InMemorySaver
+
+from mpdagents.infrastructure.metrics import observe_call
+from mpdagents.infrastructure.vector_store.base import (
+    VectorMatch,
+    VectorQueryResult,
+    VectorRecord,
+    VectorStore,
+)
+
+
+class InMemoryVectorStore(VectorStore):
+    """Vector store held in memory, standing in for Pinecone.
+
+    A namespace is filled with ``documents_per_namespace`` random passages the
+    first time it is queried, so every character and routed namespace has
+    something to retrieve. Every call waits ``latency`` seconds, the round
+    trip to the hosted index.
+
+    Args:
+        latency (float, optional): Seconds added to every call.
+        dimension (int, optional): Size of the seeded vectors.
+        documents_per_namespace (int, optional): Passages seeded per namespace.
+    """
+
+    def __init__(self, latency: float = 0.03, dimension: int = 1536, documents_per_namespace: int = 500) -> None:
+        self.latency = latency
+        self.dimension = dimension
+        self.documents_per_namespace = documents_per_namespace
+        self.__namespaces: dict[str, tuple[list[str], list[dict], np.ndarray]] = {}
+
+    def __namespace(self, namespace: str) -> tuple[list[str], list[dict], np.ndarray]:
+        if namespace not in self.__namespaces:
+            rng = np.random.default_rng(zlib.crc32(namespace.encode("utf-8")))
+            vectors = rng.standard_normal((self.documents_per_namespace, self.dimension)).astype(np.float32)
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            ids = [f"{namespace}-{i}" for i in range(self.documents_per_namespace)]
+            metadata = [
+                {"text": f"Benchmark passage {i} about {namespace or 'everything'}.", "source": "benchmark"}
+                for i in range(self.documents_per_namespace)
+            ]
+            self.__namespaces[namespace] = (ids, metadata, vectors)
+        return self.__namespaces[namespace]
+
+    async def query(self, vector: list[float], top_k: int, namespace: str) -> VectorQueryResult:
+        await asyncio.sleep(self.latency)
+        ids, metadata, vectors = self.__namespace(namespace)
+
+        scores = vectors @ np.asarray(vector, dtype=np.float32)
+        best = np.argsort(-scores)[:top_k]
+        return VectorQueryResult(
+            matches=[VectorMatch(id=ids[i], score=float(scores[i]), metadata=metadata[i]) for i in best],
+            namespace=namespace,
+        )
+
+    async def upsert(self, records: list[VectorRecord], namespace: str) -> None:
+        await asyncio.sleep(self.latency)
+        ids, metadata, vectors = self.__namespace(namespace)
+        for record in records:
+            ids.append(record.id)
+            metadata.append(record.metadata)
+        new_vectors = np.asarray([record.values for record in records], dtype=np.float32)
+        self.__namespaces[namespace] = (ids, metadata, np.vstack([vectors, new_vectors]))
+
+    async def existing_ids(self, ids: list[str], namespace: str) -> set[str]:
+        await asyncio.sleep(self.latency)
+        return set(ids) & set(self.__namespace(namespace)[0])
+
+    async def delete(self, ids: list[str], namespace: str) -> None:
+        await asyncio.sleep(self.latency)
+        stored_ids, metadata, vectors = self.__namespace(namespace)
+        to_delete = set(ids)
+        keep = [row for row, id_ in enumerate(stored_ids) if id_ not in to_delete]
+        self.__namespaces[namespace] = (
+            [stored_ids[row] for row in keep],
+            [metadata[row] for row in keep],
+            vectors[keep],
+        )
+
+
+class InMemoryCheckpointer(InMemorySaver):
+    """LangGraph checkpointer held in memory, standing in for MongoDB.
+
+    Checkpoints are still serialized like with MongoDB, and every load and
+    write waits ``latency`` seconds. Calls are timed under the same names as
+    `InstrumentedMongoDBSaver`, so the per-stage breakdown lists them.
+
+    Args:
+        latency (float, optional): Seconds added to every load and write.
+    """
+
+    def __init__(self, latency: float = 0.005) -> None:
+        super().__init__()
+        self.latency = latency
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        with observe_call("checkpoint_load"):
+            await asyncio.sleep(self.latency)
+            return await super().aget_tuple(config)
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        with observe_call("checkpoint_write"):
+            await asyncio.sleep(self.latency)
+            return await super().aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        with observe_call("checkpoint_write_pending"):
+            await asyncio.sleep(self.latency)
+            await super().aput_writes(config, writes, task_id, task_path)
+
+
+def in_memory_checkpointer(latency: float):
+    """Return a drop-in for `pooled_checkpointer` yielding an `InMemoryCheckpointer`."""
+
+    @asynccontextmanager
+    async def checkpointer() -> AsyncIterator[InMemoryCheckpointer]:
+        yield InMemoryCheckpointer(latency=latency)
+
+    return checkpointer
@@ -0,0 +1,91 @@
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, TypeVar
+
+V = TypeVar("V")
+
+
+class LRUCache(Generic[V]):
+    """In-memory LRU cache with optional per-entry time-to-live and hit/miss counters.
+
+    The cache is not thread-safe; it is meant to be used from the event loop.
+
+    Args:
+        max_size (int): Maximum number of entries kept before evicting the least
+            recently used one.
+        ttl_seconds (float | None, optional): Lifetime of an entry. ``None`` keeps
+            entries until they are evicted.
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float | None = None) -> None:
+        if max_size <= 0:
+            raise ValueError("max_size must be a positive integer")
+
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.__entries: OrderedDict[Hashable, tuple[float, V]] = OrderedDict()
+
+    def get(self, key: Hashable) -> V | None:
+        """Return the cached value and mark it as recently used, or None on a miss."""
+
+        entry = self.__entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self.__entries[key]
+            self.misses += 1
+            return None
+
+        self.__entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: V, ttl_seconds: float | None = None) -> None:
+        """Insert or replace an entry, evicting the least recently used one if full."""
+
+        ttl = ttl_seconds if ttl_seconds is not None else self.ttl_seconds
+        expires_at = time.monotonic() + ttl if ttl is not None else float("inf")
+
+        self.__entries[key] = (expires_at, value)
+        self.__entries.move_to_end(key)
+
+        while len(self.__entries) > self.max_size:
+            self.__entries.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable) -> V | None:
+        """Remove an entry and return its value, if present."""
+
+        entry = self.__entries.pop(key, None)
+        return entry[1] if entry is not None else None
+
+    def clear(self) -> None:
+        """Remove every entry. Counters are kept."""
+
+        self.__entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self.__entries.get(key)
+        return entry is not None and entry[0] >= time.monotonic()
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the current size."""
+
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "size": len(self.__entries),
+            "max_size": self.max_size,
+        }
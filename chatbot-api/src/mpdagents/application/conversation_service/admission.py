@@ -0,0 +1,198 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from mpdagents.application.cache import LRUCache
+from mpdagents.config import settings
+from mpdagents.infrastructure.metrics import ADMISSION_IN_FLIGHT, ADMISSION_QUEUED, ADMISSION_REJECTIONS
+
+
+class AdmissionRejected(Exception):
+    """Exception raised when a conversation turn is turned away.
+
+    Args:
+        reason (str): "rate_limited", "thread_busy" or "overloaded".
+        retry_after (float): Seconds after which the client may try again.
+        message (str): Explanation for the client.
+    """
+
+    def __init__(self, reason: str, retry_after: float, message: str):
+        self.reason = reason
+        self.retry_after = retry_after
+        self.message = message
+        super().__init__(self.message)
+
+
+class AdmissionTicket:
+    """Slot held by an admitted turn. Releasing it more than once has no effect."""
+
+    def __init__(self, controller: "AdmissionController", thread_id: str) -> None:
+        self.__controller = controller
+        self.__thread_id = thread_id
+        self.__started_at = time.monotonic()
+        self.__released = False
+
+    def release(self) -> None:
+        if self.__released:
+            return
+
+        self.__released = True
+        self.__controller._release(self.__thread_id, time.monotonic() - self.__started_at)
+
+
+class AdmissionController:
+    """Decide whether a conversation turn runs now, waits for a slot, or is turned away.
+
+    A turn is checked in order against:
+
+    1. The user's token bucket: ``user_rate_per_minute`` turns per minute on
+       average, ``user_burst`` back to back.
+    2. Its thread: turns of a thread already run one at a time, in arrival
+       order, under `thread_lock`; at most ``max_pending_per_thread`` of them
+       may be running or waiting, so a client can't pile up turns on one
+       checkpoint.
+    3. The process: ``max_in_flight`` turns run at once and up to
+       ``max_queued`` wait, each for at most ``queue_timeout_seconds``.
+
+    Rejections are immediate and carry a retry hint derived from the average
+    turn duration, so clients back off instead of hammering an overloaded
+    process. Meant to be used from the event loop.
+
+    Args:
+        max_in_flight (int, optional): Turns running at the same time.
+        max_queued (int, optional): Turns waiting for a free slot.
+        queue_timeout_seconds (float, optional): Longest wait for a free slot.
+        max_pending_per_thread (int, optional): Running plus waiting turns of one thread.
+        user_rate_per_minute (float, optional): Average turns per user and minute, 0 for no limit.
+        user_burst (int, optional): Turns a user may start back to back.
+        max_tracked_users (int, optional): Users whose rate is tracked, least recently seen forgotten first.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = settings.ADMISSION_MAX_IN_FLIGHT,
+        max_queued: int = settings.ADMISSION_MAX_QUEUED,
+        queue_timeout_seconds: float = settings.ADMISSION_QUEUE_TIMEOUT_SECONDS,
+        max_pending_per_thread: int = settings.ADMISSION_MAX_PENDING_PER_THREAD,
+        user_rate_per_minute: float = settings.ADMISSION_USER_RATE_PER_MINUTE,
+        user_burst: int = settings.ADMISSION_USER_BURST,
+        max_tracked_users: int = settings.ADMISSION_MAX_TRACKED_USERS,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.max_pending_per_thread = max_pending_per_thread
+        self.user_rate_per_minute = user_rate_per_minute
+        self.user_burst = user_burst
+
+        self.__slots = asyncio.Semaphore(max_in_flight)
+        self.__in_flight = 0
+        self.__queued = 0
+        self.__pending_by_thread: dict[str, int] = {}
+        # (tokens left, last update) per user
+        self.__buckets: LRUCache[tuple[float, float]] = LRUCache(max_size=max_tracked_users)
+        self.__average_turn_seconds = 1.0
+
+    async def acquire(self, user: str | None, thread_id: str) -> AdmissionTicket:
+        """Wait for a slot for one turn of ``thread_id``.
+
+        Args:
+            user (str | None): Key of the user for rate limiting, None to skip it.
+            thread_id (str): Checkpoint thread the turn writes to.
+
+        Returns:
+            AdmissionTicket: To release once the turn is over.
+
+        Raises:
+            AdmissionRejected: If the turn is not admitted.
+        """
+
+        self.__take_user_token(user)
+
+        pending = self.__pending_by_thread.get(thread_id, 0)
+        if pending >= self.max_pending_per_thread:
+            self.__reject(
+                "thread_busy",
+                self.__average_turn_seconds * pending,
+                "Another message of this conversation is still being answered",
+            )
+
+        if self.__slots.locked() and self.__queued >= self.max_queued:
+            self.__reject("overloaded", self.__overload_retry_after(), "The server is overloaded")
+
+        self.__pending_by_thread[thread_id] = pending + 1
+        self.__queued += 1
+        ADMISSION_QUEUED.inc()
+        try:
+            async with asyncio.timeout(self.queue_timeout_seconds):
+                await self.__slots.acquire()
+        except BaseException as e:
+            self.__leave_thread(thread_id)
+            if isinstance(e, TimeoutError):
+                self.__reject("overloaded", self.__overload_retry_after(), "The server is overloaded")
+            raise
+        finally:
+            self.__queued -= 1
+            ADMISSION_QUEUED.dec()
+
+        self.__in_flight += 1
+        ADMISSION_IN_FLIGHT.inc()
+        return AdmissionTicket(self, thread_id)
+
+    @asynccontextmanager
+    async def admit(self, user: str | None, thread_id: str) -> AsyncIterator[None]:
+        """Hold a slot for the duration of the block, see `acquire`."""
+
+        ticket = await self.acquire(user, thread_id)
+        try:
+            yield
+        finally:
+            ticket.release()
+
+    def _release(self, thread_id: str, turn_seconds: float) -> None:
+        self.__slots.release()
+        self.__in_flight -= 1
+        ADMISSION_IN_FLIGHT.dec()
+        self.__leave_thread(thread_id)
+        # Exponential moving average, only used for the retry hints
+        self.__average_turn_seconds += 0.1 * (turn_seconds - self.__average_turn_seconds)
+
+    def __leave_thread(self, thread_id: str) -> None:
+        pending = self.__pending_by_thread.pop(thread_id, 1) - 1
+        if pending > 0:
+            self.__pending_by_thread[thread_id] = pending
+
+    def __take_user_token(self, user: str | None) -> None:
+        if user is None or self.user_rate_per_minute <= 0:
+            return
+
+        rate = self.user_rate_per_minute / 60
+        now = time.monotonic()
+        tokens, updated_at = self.__buckets.get(user) or (float(self.user_burst), now)
+        tokens = min(float(self.user_burst), tokens + (now - updated_at) * rate)
+
+        if tokens < 1:
+            self.__buckets.set(user, (tokens, now))
+            self.__reject("rate_limited", (1 - tokens) / rate, "Too many messages")
+
+        self.__buckets.set(user, (tokens - 1, now))
+
+    def __overload_retry_after(self) -> float:
+        # Time for the turns ahead in the queue to drain through the slots
+        return self.__average_turn_seconds * (self.__queued + 1) / self.max_in_flight
+
+    def __reject(self, reason: str, retry_after: float, message: str) -> None:
+        ADMISSION_REJECTIONS.labels(reason).inc()
+        raise AdmissionRejected(reason, max(1.0, retry_after), f"{message}, retry in {max(1.0, retry_after):.0f}s")
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.__in_flight,
+            "queued": self.__queued,
+            "busy_threads": len(self.__pending_by_thread),
+            "average_turn_seconds": self.__average_turn_seconds,
+        }
+
+
+admission_controller = AdmissionController()
@@ -1,17 +1,266 @@
+import asyncio
+import time
 import uuid
-from typing import Any, AsyncGenerator, Union
+from contextlib import asynccontextmanager
+from typing import Any, AsyncGenerator, AsyncIterator, Union
 
 from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.checkpoint.mongodb.aio import AsyncMongoDBSaver
-from opik.integrations.langchain import OpikTracer
+from langgraph.graph.state import CompiledStateGraph
 
+from mpdagents.application.conversation_service.summarization import schedule_summarization
+from mpdagents.application.conversation_service.thread_lock import thread_lock
 from mpdagents.application.conversation_service.workflow.graph import (
     create_workflow_graph,
 )
+from mpdagents.application.conversation_service.workflow.node import retrieve_rag_context
+from mpdagents.application.rag.retrieval_gate import needs_retrieval
 
 
 from mpdagents.application.conversation_service.workflow.state import ChatbotState
 from mpdagents.config import settings
+from mpdagents.infrastructure.metrics import (
+    TURN_DURATION,
+    TURN_TIME_TO_FIRST_CHUNK,
+    character_label,
+    llm_metrics_handler,
+)
+from mpdagents.infrastructure.tracing import tracing_callbacks
+
+# Compiled once against the process-wide checkpointer, see `init_conversation_graph`.
+_conversation_graph: CompiledStateGraph | None = None
+
+
+def init_conversation_graph(checkpointer: BaseCheckpointSaver) -> CompiledStateGraph:
+    """Compile the workflow graph once and share it between all conversation turns.
+
+    Args:
+        checkpointer: A long-lived checkpointer, typically created in the API lifespan.
+
+    Returns:
+        CompiledStateGraph: The compiled graph used by `get_response` and
+            `get_streaming_response`.
+    """
+
+    global _conversation_graph
+
+    _conversation_graph = create_workflow_graph().compile(checkpointer=checkpointer)
+
+    return _conversation_graph
+
+
+def close_conversation_graph() -> None:
+    """Drop the shared compiled graph so later turns fall back to per-call setup."""
+
+    global _conversation_graph
+
+    _conversation_graph = None
+
+
+@asynccontextmanager
+async def conversation_graph_scope() -> AsyncIterator[CompiledStateGraph]:
+    """Yield the shared compiled graph, or a short-lived one if none was initialized.
+
+    The fallback keeps `get_response` usable outside the API (scripts, notebooks),
+    at the cost of opening a MongoDB connection for the duration of the call.
+    """
+
+    if _conversation_graph is not None:
+        yield _conversation_graph
+        return
+
+    async with AsyncMongoDBSaver.from_conn_string(
+        conn_string=settings.MONGO_URI,
+        db_name=settings.MONGO_DB_NAME,
+        checkpoint_collection_name=settings.MONGO_STATE_CHECKPOINT_COLLECTION,
+        writes_collection_name=settings.MONGO_STATE_WRITES_COLLECTION,
+    ) as checkpointer:
+        yield create_workflow_graph().compile(checkpointer=checkpointer)
+
+
+@asynccontextmanager
+async def _rag_prefetch(
+    messages: list[Union[HumanMessage, AIMessage]],
+    character_id: str,
+) -> AsyncIterator[asyncio.Task | None]:
+    """Start the RAG lookup for the incoming message before the graph runs.
+
+    The retrieval only depends on the new user message, so it can run while the
+    graph loads the thread checkpoint. `rag_context_injection_node` awaits the
+    task instead of querying again. Messages that do not need retrieval start
+    nothing, and an unused lookup is cancelled on exit.
+    """
+
+    query = next(
+        (message.content for message in reversed(messages) if isinstance(message, HumanMessage)),
+        "",
+    )
+    if not needs_retrieval(query):
+        yield None
+        return
+
+    task = asyncio.create_task(retrieve_rag_context(query, character_id))
+    try:
+        yield task
+    finally:
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled():
+            # Mark a failure as retrieved if the node never awaited the task
+            task.exception()
+
+
+def conversation_thread_id(thread_id: str | None, character_id: str | None) -> str:
+    """Checkpoint thread of a client thread, kept apart per character."""
+
+    return f"{thread_id}-{character_id}"
+
+
+class ConversationSession:
+    """A conversation thread bound to a compiled graph and a character.
+
+    Everything that does not change between the turns of a thread is set up
+    once: the checkpoint thread id and the character fields sent with every
+    turn. Turns are traced by the process-wide tracer, sampled per
+    ``endpoint``. A WebSocket keeps one session for as long as the client
+    talks to the same character on the same thread, so a turn only pays for
+    the graph run itself.
+
+    Args:
+        graph (CompiledStateGraph): Graph compiled with the thread's checkpointer.
+        thread_id (str): Client thread id, combined with the character id.
+        character_id (str | None, optional): Identifier of the character.
+        character_name (str | None, optional): Name of the character.
+        character_style (str | None, optional): Style of the character.
+        character_perspective (str | None, optional): Perspective of the character.
+        character_prompt (str | None, optional): Pre-rendered persona system prompt,
+            see `CharacterRegistry`.
+        endpoint (str, optional): Endpoint serving the session. Selects the tracing
+            sample rate and labels the turn metrics.
+    """
+
+    def __init__(
+        self,
+        graph: CompiledStateGraph,
+        thread_id: str,
+        character_id: str | None = None,
+        character_name: str | None = None,
+        character_style: str | None = None,
+        character_perspective: str | None = None,
+        character_prompt: str | None = None,
+        endpoint: str = "chat",
+    ) -> None:
+        self.graph = graph
+        self.endpoint = endpoint
+        self.client_thread_id = thread_id
+        self.character_id = character_id
+        self.thread_id = conversation_thread_id(thread_id, character_id)
+        self.character_input = {
+            "character_id": character_id,
+            "character_name": character_name,
+            "character_style": character_style,
+            "character_perspective": character_perspective,
+            "character_prompt": character_prompt,
+        }
+
+    def __config(self, rag_prefetch: asyncio.Task | None) -> dict:
+        return {
+            "configurable": {"thread_id": self.thread_id, "rag_prefetch": rag_prefetch},
+            "callbacks": [*tracing_callbacks(self.endpoint), llm_metrics_handler],
+            # Labels the LLM metrics of the turn, see `LLMMetricsHandler`
+            "metadata": {"character_id": self.character_id},
+        }
+
+    def __input(self, input_messages: list[Union[HumanMessage, AIMessage]]) -> dict:
+        return {
+            "messages": input_messages,
+            # Cleared every turn so a skipped retrieval never reuses stale context
+            "context": None,
+            **self.character_input,
+        }
+
+    async def respond(
+        self, messages: str | list[str] | list[dict[str, Any]]
+    ) -> tuple[str, ChatbotState]:
+        """Run one turn and return the reply with the final state.
+
+        Raises:
+            RuntimeError: If there's an error running the conversation workflow.
+        """
+
+        input_messages = _format_messages(messages=messages)
+        start = time.perf_counter()
+
+        try:
+            async with _rag_prefetch(input_messages, self.character_id) as rag_prefetch:
+                async with thread_lock(self.thread_id):
+                    output_state = await self.graph.ainvoke(
+                        input=self.__input(input_messages),
+                        config=self.__config(rag_prefetch),
+                    )
+
+            # Long threads are summarized after the response, off the request path
+            await schedule_summarization(self.graph, self.thread_id)
+            last_message = output_state["messages"][-1]
+            return last_message.content, ChatbotState(**output_state)
+        except Exception as e:
+            raise RuntimeError(f"Error running conversation workflow: {str(e)}") from e
+        finally:
+            TURN_DURATION.labels(self.endpoint, character_label(self.character_id)).observe(
+                time.perf_counter() - start
+            )
+
+    async def stream(
+        self, messages: str | list[str] | list[dict[str, Any]]
+    ) -> AsyncGenerator[str, None]:
+        """Run one turn and yield the reply as it is generated.
+
+        Raises:
+            RuntimeError: If there's an error running the conversation workflow.
+        """
+
+        input_messages = _format_messages(messages=messages)
+        start = time.perf_counter()
+        first_chunk_sent = False
+
+        try:
+            async with _rag_prefetch(input_messages, self.character_id) as rag_prefetch:
+                async with thread_lock(self.thread_id):
+                    async for chunk in self.graph.astream(
+                        input=self.__input(input_messages),
+                        config=self.__config(rag_prefetch),
+                        stream_mode="messages",
+                    ):
+                        if chunk[1]["langgraph_node"] == "conversation_node" and isinstance(
+                            chunk[0], AIMessageChunk
+                        ):
+                            content = chunk[0].content
+                        # A cached reply arrives as one complete message
+                        elif chunk[1]["langgraph_node"] == "response_cache_node" and isinstance(
+                            chunk[0], AIMessage
+                        ):
+                            content = chunk[0].content
+                        else:
+                            continue
+
+                        if content and not first_chunk_sent:
+                            first_chunk_sent = True
+                            TURN_TIME_TO_FIRST_CHUNK.labels(
+                                self.endpoint, character_label(self.character_id)
+                            ).observe(time.perf_counter() - start)
+                        yield content
+
+            # Long threads are summarized after the response, off the request path
+            await schedule_summarization(self.graph, self.thread_id)
+        except Exception as e:
+            raise RuntimeError(
+                f"Error running streaming conversation workflow: {str(e)}"
+            ) from e
+        finally:
+            TURN_DURATION.labels(self.endpoint, character_label(self.character_id)).observe(
+                time.perf_counter() - start
+            )
 
 
 async def get_response(
@@ -21,10 +270,14 @@ async def get_response(
     character_name: str | None = None,
     character_style: str | None = None,
     character_perspective: str | None = None,
+    character_prompt: str | None = None,
     new_thread: bool = False
 ) -> tuple[str, ChatbotState]:
     """Run a conversation through the workflow graph.
 
+    Callers handling several turns of one thread should keep a
+    `ConversationSession` instead, which skips the per-call setup.
+
     Args:   
         message: Initial message to start the conversation.
 
@@ -37,52 +290,24 @@ async def get_response(
         RuntimeError: If there's an error running the conversation workflow.
     """
 
-    graph_builder = create_workflow_graph()
-
     try:
-        async with AsyncMongoDBSaver.from_conn_string(
-            conn_string=settings.MONGO_URI,
-            db_name=settings.MONGO_DB_NAME,
-            checkpoint_collection_name=settings.MONGO_STATE_CHECKPOINT_COLLECTION,
-            writes_collection_name=settings.MONGO_STATE_WRITES_COLLECTION,
-        ) as checkpointer:
-            graph = graph_builder.compile(checkpointer=checkpointer)
-            opik_tracer = OpikTracer(graph=graph.get_graph(xray=True))
-
-            # thread_id = (
-            #     philosopher_id if not new_thread else f"{philosopher_id}-{uuid.uuid4()}"
-            # )
-
-            # thread_id = (
-            #     thread_id if not new_thread else f"{character_id}-{thread_id}"
-            # )
-            thread_id = f"{thread_id}-{character_id}"
-
-            # if new_thread or not thread_id:
-            #     thread_id = f"{character_id}-{thread_id}" 
-
-            config = {
-                "configurable": {"thread_id": thread_id},
-                "callbacks": [opik_tracer],
-            }
-            output_state = await graph.ainvoke(
-                input={
-                    "messages": __format_messages(messages=messages),
-                    "character_id": character_id,
-                    "character_name": character_name,
-                    "character_style": character_style,
-                    "character_perspective": character_perspective,
-
-                },
-                config=config,
+        async with conversation_graph_scope() as graph:
+            session = ConversationSession(
+                graph,
+                thread_id,
+                character_id=character_id,
+                character_name=character_name,
+                character_style=character_style,
+                character_perspective=character_perspective,
+                character_prompt=character_prompt,
             )
-        last_message = output_state["messages"][-1]
-        return last_message.content, ChatbotState(**output_state)
+            return await session.respond(messages)
+    except RuntimeError:
+        raise
     except Exception as e:
         raise RuntimeError(f"Error running conversation workflow: {str(e)}") from e
 
 
-
 async def get_streaming_response(
     messages: str | list[str] | list[dict[str, Any]],
     thread_id: str,
@@ -90,10 +315,14 @@ async def get_streaming_response(
     character_name: str | None = None,
     character_style: str | None = None,
     character_perspective: str | None = None,
+    character_prompt: str | None = None,
     new_thread: bool = False
 ) -> AsyncGenerator[str, None]:
     """Run a conversation through the workflow graph and yield streaming responses.
 
+    Callers handling several turns of one thread should keep a
+    `ConversationSession` instead, which skips the per-call setup.
+
     Args:
         messages: Initial message to start the conversation.
         thread_id: Unique identifier for the conversation thread.
@@ -101,6 +330,7 @@ async def get_streaming_response(
         character_name: Name of the character.
         character_style: Style of the character.
         character_perspective: Perspective of the character.
+        character_prompt: Pre-rendered persona system prompt, see `CharacterRegistry`.
         new_thread: Whether to start a new thread.
 
     Yields:
@@ -110,54 +340,29 @@ async def get_streaming_response(
         RuntimeError: If there's an error running the conversation workflow.
     """
 
-    graph_builder = create_workflow_graph()
     try:
-        async with AsyncMongoDBSaver.from_conn_string(
-            conn_string=settings.MONGO_URI,
-            db_name=settings.MONGO_DB_NAME,
-            checkpoint_collection_name=settings.MONGO_STATE_CHECKPOINT_COLLECTION,
-            writes_collection_name=settings.MONGO_STATE_WRITES_COLLECTION,
-        ) as checkpointer:
-            graph = graph_builder.compile(checkpointer=checkpointer)
-            opik_tracer = OpikTracer(graph=graph.get_graph(xray=True))
-
-            thread_id = f"{thread_id}-{character_id}"
-
-            # if new_thread or not thread_id:
-            #     thread_id = f"{character_id}-{thread_id}" 
-
-            config = {
-                "configurable": {"thread_id": thread_id},
-                "callbacks": [opik_tracer],
-            }
-
-            async for chunk in graph.astream(
-                input={
-                    "messages": __format_messages(messages=messages),
-                    "character_id": character_id,
-                    "character_name": character_name,
-                    "character_style": character_style,
-                    "character_perspective": character_perspective,
-                },
-                config=config,
-                stream_mode="messages"
-            ):
-                if chunk[1]["langgraph_node"] == "conversation_node" and isinstance(
-                    chunk[0], AIMessageChunk
-                ):
-                    yield chunk[0].content
-
+        async with conversation_graph_scope() as graph:
+            session = ConversationSession(
+                graph,
+                thread_id,
+                character_id=character_id,
+                character_name=character_name,
+                character_style=character_style,
+                character_perspective=character_perspective,
+                character_prompt=character_prompt,
+                endpoint="chat_stream",
+            )
+            async for chunk in session.stream(messages):
+                yield chunk
+    except RuntimeError:
+        raise
     except Exception as e:
         raise RuntimeError(
             f"Error running streaming conversation workflow: {str(e)}"
         ) from e
-    
-
-
-    
 
 
-def __format_messages(
+def _format_messages(
     messages: Union[str, list[dict[str, Any]]],
 ) -> list[Union[HumanMessage, AIMessage]]:
     """Convert various message formats to a list of LangChain message objects.
@@ -0,0 +1,92 @@
+import hashlib
+
+from langchain_core.messages import BaseMessage
+
+from mpdagents.application.cache import LRUCache
+from mpdagents.application.rag.embedding_cache import normalize_text
+from mpdagents.config import settings
+
+
+def history_fingerprint(messages: list[BaseMessage]) -> str:
+    """Hash of the earlier messages of a thread, so only identical histories share a reply."""
+
+    digest = hashlib.sha256()
+    for message in messages:
+        digest.update(f"{message.type}\0{message.content}\0".encode())
+    return digest.hexdigest()
+
+
+class ResponseCache:
+    """In-memory cache of persona replies to repeated opening turns.
+
+    Only turns with no summary and at most ``max_history_messages`` earlier
+    messages are eligible, which covers the identical first turns that make
+    up most repeated traffic. The key covers the character, the normalized
+    message, the prompt version and the earlier messages, so a reply is only
+    reused where the model would have seen the same conversation.
+
+    Args:
+        max_entries (int, optional): Maximum number of cached replies.
+        ttl_seconds (float | None, optional): Lifetime of a cached reply.
+        max_history_messages (int, optional): Longest eligible history.
+        excluded_characters (list[str], optional): Characters never served from the cache.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = settings.RESPONSE_CACHE_MAX_ENTRIES,
+        ttl_seconds: float | None = settings.RESPONSE_CACHE_TTL_SECONDS,
+        max_history_messages: int = settings.RESPONSE_CACHE_MAX_HISTORY_MESSAGES,
+        excluded_characters: list[str] = settings.RESPONSE_CACHE_EXCLUDED_CHARACTERS,
+    ) -> None:
+        self.max_history_messages = max_history_messages
+        self.excluded_characters = {character.lower() for character in excluded_characters}
+        self.__cache: LRUCache[str] = LRUCache(max_size=max_entries, ttl_seconds=ttl_seconds)
+
+    def key(
+        self,
+        character_id: str | None,
+        message: str,
+        history: list[BaseMessage],
+        summary: str,
+        prompt_version: str,
+    ) -> str | None:
+        """Return the cache key of a turn, or None if the turn is not eligible."""
+
+        if not character_id or character_id.lower() in self.excluded_characters:
+            return None
+        if summary or len(history) > self.max_history_messages:
+            return None
+
+        normalized = normalize_text(message)
+        if not normalized:
+            return None
+
+        return hashlib.sha256(
+            f"{character_id.lower()}\0{prompt_version}\0{history_fingerprint(history)}\0{normalized}".encode()
+        ).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        return self.__cache.get(key)
+
+    def set(self, key: str, response: str) -> None:
+        if response:
+            self.__cache.set(key, response)
+
+    def clear(self) -> None:
+        self.__cache.clear()
+
+    def stats(self) -> dict:
+        return self.__cache.stats()
+
+
+def create_response_cache() -> ResponseCache | None:
+    """Build the response cache from settings, or None if it is disabled."""
+
+    if not settings.RESPONSE_CACHE_ENABLED:
+        return None
+
+    return ResponseCache()
+
+
+response_cache = create_response_cache()
@@ -0,0 +1,149 @@
+import asyncio
+
+from langgraph.graph import END
+from langgraph.graph.state import CompiledStateGraph
+
+from mpdagents.application.conversation_service.thread_lock import thread_lock
+from mpdagents.application.conversation_service.workflow.egdes import should_summarize_conversation
+from mpdagents.application.conversation_service.workflow.node import summarize_conversation_node
+from mpdagents.config import settings
+from mpdagents.infrastructure.metrics import timed_node
+
+# Summaries run outside the graph, so their duration is recorded here
+_summarize_conversation = timed_node("summarize_conversation_node", summarize_conversation_node)
+
+
+async def summarize_thread(graph: CompiledStateGraph, thread_id: str) -> bool:
+    """Summarize a thread if it is long enough and write the result to its checkpoint.
+
+    The summary is generated from a snapshot without holding the thread lock, so
+    the next turn is never blocked on the LLM call. Only the checkpoint update
+    takes the lock. It removes the summarized messages by id, so messages added
+    by a turn that ran in the meantime are kept.
+
+    Args:
+        graph (CompiledStateGraph): Graph compiled with the thread's checkpointer.
+        thread_id (str): The LangGraph thread id.
+
+    Returns:
+        bool: True if a summary was written.
+    """
+
+    config = {"configurable": {"thread_id": thread_id}}
+
+    snapshot = await graph.aget_state(config)
+    if not snapshot.values or should_summarize_conversation(snapshot.values) == END:
+        return False
+
+    update = await _summarize_conversation(snapshot.values)
+    if not update:
+        return False
+
+    async with thread_lock(thread_id):
+        await graph.aupdate_state(config, update, as_node="conversation_node")
+
+    return True
+
+
+class ConversationSummarizer:
+    """Background queue summarizing long threads off the response path.
+
+    Turns only enqueue their thread id, which is a constant-time call; a
+    small pool of workers checks the trigger and summarizes. A thread is
+    queued at most once at a time and jobs are dropped when the queue is full,
+    since the next turn of the same thread enqueues it again.
+
+    Args:
+        graph (CompiledStateGraph): Graph compiled with the shared checkpointer.
+        workers (int, optional): Number of concurrent summarizations.
+        max_pending (int, optional): Maximum number of queued threads.
+    """
+
+    def __init__(
+        self,
+        graph: CompiledStateGraph,
+        workers: int = settings.SUMMARY_WORKERS,
+        max_pending: int = settings.SUMMARY_QUEUE_SIZE,
+    ) -> None:
+        self.graph = graph
+        self.workers = workers
+        self._queue: asyncio.Queue[str] = asyncio.Queue(maxsize=max_pending)
+        self._pending: set[str] = set()
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self.__worker()) for _ in range(self.workers)]
+
+    def schedule(self, thread_id: str) -> None:
+        if thread_id in self._pending:
+            return
+
+        try:
+            self._queue.put_nowait(thread_id)
+        except asyncio.QueueFull:
+            print(f"Summarization queue is full, skipping thread '{thread_id}' for now")
+            return
+
+        self._pending.add(thread_id)
+
+    async def __worker(self) -> None:
+        while True:
+            thread_id = await self._queue.get()
+            try:
+                await summarize_thread(self.graph, thread_id)
+            except Exception as e:
+                print(f"Failed to summarize thread '{thread_id}': {e}")
+            finally:
+                self._pending.discard(thread_id)
+                self._queue.task_done()
+
+    async def close(self, timeout: float = settings.SUMMARY_SHUTDOWN_TIMEOUT_SECONDS) -> None:
+        """Give queued jobs up to ``timeout`` seconds to finish, then stop the workers."""
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Dropping {len(self._pending)} pending summarizations on shutdown")
+
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+
+_summarizer: ConversationSummarizer | None = None
+
+
+def init_conversation_summarizer(graph: CompiledStateGraph) -> ConversationSummarizer:
+    """Start the process-wide background summarizer for the shared graph."""
+
+    global _summarizer
+
+    _summarizer = ConversationSummarizer(graph)
+    _summarizer.start()
+
+    return _summarizer
+
+
+async def close_conversation_summarizer() -> None:
+    """Finish or drop the pending summarizations and stop the workers."""
+
+    global _summarizer
+
+    if _summarizer is not None:
+        await _summarizer.close()
+        _summarizer = None
+
+
+async def schedule_summarization(graph: CompiledStateGraph, thread_id: str) -> None:
+    """Summarize a thread in the background, or inline if no summarizer is running.
+
+    The inline fallback keeps scripts that call `get_response` without the API
+    lifespan working, since their graph does not outlive the call.
+    """
+
+    if _summarizer is not None and _summarizer.graph is graph:
+        _summarizer.schedule(thread_id)
+        return
+
+    await summarize_thread(graph, thread_id)
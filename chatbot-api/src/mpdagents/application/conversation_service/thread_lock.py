@@ -0,0 +1,26 @@
+import asyncio
+from weakref import WeakValueDictionary
+
+# A lock only lives while a turn or a background job holds or waits on it
+_thread_locks: WeakValueDictionary[str, asyncio.Lock] = WeakValueDictionary()
+
+
+def thread_lock(thread_id: str) -> asyncio.Lock:
+    """Return the lock serializing checkpoint writes of a conversation thread.
+
+    Conversation turns and background jobs that update the same thread (e.g.
+    summarization) hold it while they write, so neither builds its checkpoint
+    on a state the other is about to replace.
+
+    Args:
+        thread_id (str): The LangGraph thread id.
+
+    Returns:
+        asyncio.Lock: The same lock for every caller of this thread.
+    """
+
+    lock = _thread_locks.get(thread_id)
+    if lock is None:
+        lock = asyncio.Lock()
+        _thread_locks[thread_id] = lock
+    return lock
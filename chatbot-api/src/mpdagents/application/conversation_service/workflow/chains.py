@@ -1,40 +1,140 @@
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from functools import lru_cache
+
+import httpx
+from langchain_core.messages import SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
+from langchain_core.runnables import RunnableLambda
 from langchain_openai import ChatOpenAI
+from mpdagents.application.conversation_service.workflow.llm_scheduler import (
+    BACKGROUND_PRIORITY,
+    INTERACTIVE_PRIORITY,
+    ScheduledChatOpenAI,
+    close_llm_schedulers,
+)
 from mpdagents.config import settings
 from mpdagents.domain.prompts import (
-    CHATBOT_CHARACTER_CARD,SUMMARY_PROMPT, EXTEND_SUMMARY_PROMPT
+    CHATBOT_CHARACTER_CARD,SUMMARY_PROMPT, EXTEND_SUMMARY_PROMPT, Prompt,
+    CONVERSATION_SUMMARY_CONTEXT, RAG_KNOWLEDGE_CONTEXT,
 )
 
-def get_chat_model(temperature: float = 0.7, model_name: str = settings.OPENAI_LLM_MODEL) -> ChatOpenAI:
-    return ChatOpenAI(
+
+@lru_cache(maxsize=1)
+def get_openai_http_client() -> httpx.AsyncClient:
+    """Pooled HTTP client shared by every chat model of the process."""
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=settings.LLM_HTTP_TIMEOUT_SECONDS,
+    )
+
+
+async def close_openai_http_client() -> None:
+    """Close the shared HTTP client and drop the chat models and chains built on it."""
+
+    if get_openai_http_client.cache_info().currsize:
+        await get_openai_http_client().aclose()
+    get_openai_http_client.cache_clear()
+    get_chat_model.cache_clear()
+    __build_chatbot_response_chain.cache_clear()
+    __build_conversation_summary_chain.cache_clear()
+    close_llm_schedulers()
+
+
+@lru_cache(maxsize=16)
+def get_chat_model(
+    temperature: float = 0.7, model_name: str = settings.OPENAI_LLM_MODEL, priority: int = INTERACTIVE_PRIORITY
+) -> ChatOpenAI:
+    kwargs = dict(
         api_key=settings.OPENAI_API_KEY,
         model_name=model_name,
         temperature=temperature,
+        http_async_client=get_openai_http_client(),
+        # Token usage, including cached prompt tokens, is also reported when streaming
+        stream_usage=True,
     )
+    if not settings.LLM_SCHEDULER_ENABLED:
+        return ChatOpenAI(**kwargs)
 
+    # The scheduler retries with the rate limits in mind, the client must not retry on its own
+    return ScheduledChatOpenAI(**kwargs, priority=priority, max_retries=0)
 
-def get_chatbot_response_chain():
-    model = get_chat_model()
+
+def get_chatbot_prompt_version() -> str:
+    """Combined version of the prompts rendered by the chatbot response chain."""
+
+    return "-".join(
+        prompt.version for prompt in (CHATBOT_CHARACTER_CARD, CONVERSATION_SUMMARY_CONTEXT, RAG_KNOWLEDGE_CONTEXT)
+    )
+
+
+def get_chatbot_response_chain(model_name: str = settings.OPENAI_LLM_MODEL, temperature: float = 0.7):
+    # The prompt versions are part of the key so the chain is tied to the templates
+    # it renders, like the response cache
+    return __build_chatbot_response_chain(model_name, temperature, get_chatbot_prompt_version())
+
+
+@lru_cache(maxsize=16)
+def __build_chatbot_response_chain(model_name: str, temperature: float, prompt_version: str):
+    model = get_chat_model(temperature=temperature, model_name=model_name)
     # model = model.bind_tools(tools)
     system_message = CHATBOT_CHARACTER_CARD
+    card_template = PromptTemplate.from_template(system_message.prompt, template_format="jinja2")
+    summary_template = PromptTemplate.from_template(CONVERSATION_SUMMARY_CONTEXT.prompt, template_format="jinja2")
+    context_template = PromptTemplate.from_template(RAG_KNOWLEDGE_CONTEXT.prompt, template_format="jinja2")
+
+    def add_context_messages(inputs: dict) -> dict:
+        summary = inputs.get("summary")
+        context = inputs.get("context")
+        # Pre-rendered by the character registry; rendered here for callers passing only the fields
+        character_prompt = inputs.get("character_prompt") or card_template.format(
+            character_name=inputs.get("character_name"),
+            character_perspective=inputs.get("character_perspective"),
+            character_style=inputs.get("character_style"),
+        )
+        return {
+            **inputs,
+            "persona_messages": [SystemMessage(content=character_prompt)],
+            "summary_messages": [SystemMessage(content=summary_template.format(summary=summary))] if summary else [],
+            "context_messages": [SystemMessage(content=context_template.format(context=context))] if context else [],
+        }
 
+    # The character card comes first and never changes within a thread, so it
+    # forms a cacheable prefix. The summary changes only when the thread is
+    # summarized, and the history is append-only, so they extend that prefix.
+    # The RAG context changes every turn and goes last.
     prompt = ChatPromptTemplate.from_messages(
         [
-            ("system", system_message.prompt),
+            MessagesPlaceholder(variable_name="persona_messages"),
+            MessagesPlaceholder(variable_name="summary_messages", optional=True),
             MessagesPlaceholder(variable_name="messages"),
+            MessagesPlaceholder(variable_name="context_messages", optional=True),
         ],
         template_format="jinja2",
     )
 
-    return prompt | model
-
+    return RunnableLambda(add_context_messages) | prompt | model
 
 
-def get_conversation_summary_chain(summary: str = ""):
-    model = get_chat_model(model_name=settings.OPENAI_LLM_MODEL_SUMMARY)
 
+def get_conversation_summary_chain(summary: str = "", temperature: float = 0.7):
     summary_message = EXTEND_SUMMARY_PROMPT if summary else SUMMARY_PROMPT
 
+    return __build_conversation_summary_chain(
+        settings.OPENAI_LLM_MODEL_SUMMARY, temperature, summary_message, summary_message.version
+    )
+
+
+@lru_cache(maxsize=16)
+def __build_conversation_summary_chain(
+    model_name: str, temperature: float, summary_message: Prompt, prompt_version: str
+):
+    # Summaries can wait for budget behind the replies users are waiting for
+    model = get_chat_model(temperature=temperature, model_name=model_name, priority=BACKGROUND_PRIORITY)
+
     prompt = ChatPromptTemplate.from_messages(
         [
             MessagesPlaceholder(variable_name="messages"),
@@ -44,4 +144,3 @@ def get_conversation_summary_chain(summary: str = ""):
     )
 
     return prompt | model
-
@@ -0,0 +1,189 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+import tiktoken
+from langchain_core.messages import BaseMessage, HumanMessage
+
+from mpdagents.config import settings
+
+# Tokens added by the chat format around every message
+_MESSAGE_OVERHEAD_TOKENS = 4
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=8)
+def get_encoding(model_name: str) -> tiktoken.Encoding | None:
+    """Return the tokenizer of a model, or None if it cannot be loaded (e.g. offline)."""
+
+    try:
+        try:
+            return tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            # Unknown to tiktoken, e.g. a fine-tuned model
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        print(f"Can't load the tokenizer of '{model_name}', estimating token counts instead: {e}")
+        return None
+
+
+@dataclass
+class PackedContext:
+    """Prompt inputs that fit in the token budget."""
+
+    summary: str
+    context: str
+    messages: list[BaseMessage]
+    tokens: int
+    dropped_chunks: int = 0
+    dropped_messages: int = 0
+
+
+class ContextPacker:
+    """Fit the summary, the RAG chunks and the message history in a token budget.
+
+    Inputs are admitted by priority: the latest user message, then the
+    conversation summary, then RAG chunks by decreasing score, then older
+    messages from the newest backwards. Chunks scoring below ``min_score`` or
+    mostly covered by a better chunk are dropped before they cost any tokens,
+    and a chunk longer than ``max_chunk_tokens`` is cut at a token boundary.
+
+    Args:
+        model_name (str, optional): Model whose tokenizer counts the tokens.
+        max_tokens (int, optional): Budget shared by summary, context and history.
+        max_summary_tokens (int, optional): Cap on the summary share.
+        max_chunk_tokens (int, optional): Cap on a single RAG chunk.
+        min_score (float, optional): Chunks scoring below this are ignored.
+        duplicate_overlap (float, optional): Word overlap above which a chunk
+            counts as a duplicate of a better one.
+    """
+
+    def __init__(
+        self,
+        model_name: str = settings.OPENAI_LLM_MODEL,
+        max_tokens: int = settings.CONTEXT_TOKEN_BUDGET,
+        max_summary_tokens: int = settings.CONTEXT_MAX_SUMMARY_TOKENS,
+        max_chunk_tokens: int = settings.CONTEXT_MAX_CHUNK_TOKENS,
+        min_score: float = settings.RAG_MIN_SCORE,
+        duplicate_overlap: float = settings.RAG_DUPLICATE_OVERLAP,
+    ) -> None:
+        self.encoding = get_encoding(model_name)
+        self.max_tokens = max_tokens
+        self.max_summary_tokens = max_summary_tokens
+        self.max_chunk_tokens = max_chunk_tokens
+        self.min_score = min_score
+        self.duplicate_overlap = duplicate_overlap
+
+    def count_tokens(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is None:
+            return len(text) // 4 + 1
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Cut ``text`` to at most ``max_tokens`` tokens."""
+
+        if max_tokens <= 0:
+            return ""
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        if self.encoding is None:
+            return text[: max_tokens * 4].rstrip() + "..."
+        tokens = self.encoding.encode(text, disallowed_special=())
+        return self.encoding.decode(tokens[:max_tokens]).rstrip() + "..."
+
+    def count_message_tokens(self, message: BaseMessage) -> int:
+        content = message.content if isinstance(message.content, str) else str(message.content)
+        return self.count_tokens(content) + _MESSAGE_OVERHEAD_TOKENS
+
+    def select_chunks(self, chunks: list[dict]) -> list[dict]:
+        """Keep relevant chunks, best first, without ids or texts seen in a better chunk."""
+
+        selected: list[dict] = []
+        selected_words: list[set[str]] = []
+        seen_ids: set[str] = set()
+
+        for chunk in sorted(chunks, key=lambda chunk: chunk.get("score", 0.0), reverse=True):
+            if chunk.get("score", 0.0) < self.min_score or not chunk.get("text"):
+                continue
+            if chunk.get("id") in seen_ids:
+                continue
+
+            words = set(_WORD_PATTERN.findall(chunk["text"].lower()))
+            if any(
+                len(words & other) / max(1, min(len(words), len(other))) >= self.duplicate_overlap
+                for other in selected_words
+            ):
+                continue
+
+            seen_ids.add(chunk.get("id"))
+            selected.append(chunk)
+            selected_words.append(words)
+
+        return selected
+
+    def pack(self, summary: str, chunks: list[dict] | None, messages: list[BaseMessage]) -> PackedContext:
+        """Select what goes into the prompt.
+
+        Args:
+            summary (str): Summary of the earlier conversation.
+            chunks (list[dict] | None): RAG chunks with "text", "source" and "score".
+            messages (list[BaseMessage]): Conversation history, oldest first.
+
+        Returns:
+            PackedContext: The rendered summary and context, the kept messages
+                and the number of tokens they use.
+        """
+
+        remaining = self.max_tokens
+
+        # The latest user message is always sent, whatever it costs
+        last_human = next(
+            (index for index in range(len(messages) - 1, -1, -1) if isinstance(messages[index], HumanMessage)),
+            len(messages) - 1,
+        )
+        kept_from = max(last_human, 0)
+        for message in messages[kept_from:]:
+            remaining -= self.count_message_tokens(message)
+
+        summary = self.truncate(summary or "", max(0, min(self.max_summary_tokens, remaining)))
+        remaining -= self.count_tokens(summary)
+
+        context_parts: list[str] = []
+        candidates = self.select_chunks(chunks or [])
+        for chunk in candidates:
+            if remaining <= 0:
+                break
+            part = f"[{len(context_parts) + 1}] ({chunk.get('source', 'unknown')}) "
+            text = self.truncate(
+                chunk["text"].strip(), min(self.max_chunk_tokens, remaining - self.count_tokens(part))
+            )
+            if not text:
+                break
+            part += text
+            remaining -= self.count_tokens(part) + 1
+            context_parts.append(part)
+
+        while kept_from > 0:
+            cost = self.count_message_tokens(messages[kept_from - 1])
+            if cost > remaining:
+                break
+            remaining -= cost
+            kept_from -= 1
+
+        return PackedContext(
+            summary=summary,
+            context="\n".join(context_parts),
+            messages=list(messages[kept_from:]),
+            tokens=self.max_tokens - remaining,
+            dropped_chunks=len(chunks or []) - len(context_parts),
+            dropped_messages=kept_from,
+        )
+
+
+@lru_cache(maxsize=1)
+def get_context_packer() -> ContextPacker:
+    """Return the process-wide packer, built once from settings."""
+
+    return ContextPacker()
@@ -1,18 +1,42 @@
 
 from typing_extensions import Literal
 
+from langchain_core.messages import AIMessage
 from langgraph.graph import END
 
+from mpdagents.application.conversation_service.workflow.context_packer import get_context_packer
+from mpdagents.application.conversation_service.workflow.node import get_last_user_query
 from mpdagents.application.conversation_service.workflow.state import ChatbotState
+from mpdagents.application.rag.retrieval_gate import needs_retrieval
 from mpdagents.config import settings
 
 
+def should_retrieve_context(
+    state: ChatbotState,
+) -> Literal["rag_context_injection_node", "conversation_node"]:
+    if needs_retrieval(get_last_user_query(state)):
+        return "rag_context_injection_node"
+
+    return "conversation_node"
+
+
+def should_use_cached_response(
+    state: ChatbotState,
+) -> Literal["rag_context_injection_node", "conversation_node", "__end__"]:
+    # `response_cache_node` answered the turn
+    if isinstance(state["messages"][-1], AIMessage):
+        return END
+
+    return should_retrieve_context(state)
+
+
 def should_summarize_conversation(
     state: ChatbotState,
 ) -> Literal["summarize_conversation_node", "__end__"]:
-    messages = state["messages"]
+    packer = get_context_packer()
+    history_tokens = sum(packer.count_message_tokens(message) for message in state["messages"])
 
-    if len(messages) > settings.TOTAL_MESSAGES_SUMMARY_TRIGGER:
+    if history_tokens > settings.SUMMARY_TRIGGER_TOKENS:
         return "summarize_conversation_node"
 
     return END
@@ -3,33 +3,34 @@ from functools import lru_cache
 from langgraph.graph import StateGraph, START, END
 from mpdagents.application.conversation_service.workflow.node import (
     conversation_node,
-    summarize_conversation_node,
-    rag_context_injection_node
+    rag_context_injection_node,
+    response_cache_node,
+)
+from mpdagents.application.conversation_service.workflow.egdes  import (
+    should_use_cached_response,
 )
-from mpdagents.application.conversation_service.workflow.egdes  import should_summarize_conversation
 from mpdagents.application.conversation_service.workflow.state import ChatbotState
-from mpdagents.infrastructure.opik_utils import configure
-
+from mpdagents.infrastructure.metrics import timed_node
 
-configure()
 
 @lru_cache(maxsize=1)
 def create_workflow_graph():
     graph_builder = StateGraph(ChatbotState)
 
     # Add all nodes
-    graph_builder.add_node("rag_context_injection_node",rag_context_injection_node)
-    graph_builder.add_node("conversation_node", conversation_node)
-    graph_builder.add_node("summarize_conversation_node", summarize_conversation_node)
+    graph_builder.add_node("response_cache_node", timed_node("response_cache_node", response_cache_node))
+    graph_builder.add_node(
+        "rag_context_injection_node", timed_node("rag_context_injection_node", rag_context_injection_node)
+    )
+    graph_builder.add_node("conversation_node", timed_node("conversation_node", conversation_node))
     
     # Define the flow
-    graph_builder.add_edge(START, "rag_context_injection_node")
+    graph_builder.add_edge(START, "response_cache_node")
+    graph_builder.add_conditional_edges("response_cache_node", should_use_cached_response)
     graph_builder.add_edge("rag_context_injection_node", "conversation_node")
-    graph_builder.add_conditional_edges("conversation_node", should_summarize_conversation)
-    graph_builder.add_edge("summarize_conversation_node", END)
+    # Summarization runs in the background after the turn, see `summarization.py`
+    graph_builder.add_edge("conversation_node", END)
     
-
-    # configure()
     return graph_builder
 
 # Compiled without a checkpointer. Used for LangGraph Studio
@@ -0,0 +1,378 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import random
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun
+from langchain_core.load import dumps
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+from langchain_openai import ChatOpenAI
+from openai import APIConnectionError, APITimeoutError, InternalServerError, RateLimitError
+
+from mpdagents.application.conversation_service.workflow.context_packer import get_context_packer
+from mpdagents.config import settings
+from mpdagents.infrastructure.metrics import LLM_COALESCED, LLM_QUEUE_WAIT, LLM_RETRIES
+
+# Lower priorities are served first when the budget is short
+INTERACTIVE_PRIORITY = 0
+BACKGROUND_PRIORITY = 10
+
+_RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+
+class _Budget:
+    """Token bucket holding at most one minute of ``per_minute``, refilled continuously."""
+
+    def __init__(self, per_minute: int) -> None:
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def clamp(self, amount: float) -> float:
+        # A call larger than the whole budget waits for a full bucket instead of forever
+        return min(amount, self.capacity)
+
+    def wait_time(self, amount: float) -> float:
+        return max(0.0, (self.clamp(amount) - self.level) / self.rate)
+
+
+class LLMScheduler:
+    """Queue in front of the calls to one model, keeping them within its rate limits.
+
+    A call reserves one request and its estimated tokens before it is sent,
+    and waits, lowest ``priority`` first, while either per-minute budget is
+    short. Once the call is over the reservation is corrected by the tokens
+    it actually used. A 429 from OpenAI pauses the whole queue for the
+    retry-after it carries, so one rejection does not turn into a burst of
+    them. Identical calls in flight at the same time can share one request,
+    see `coalesce`. Meant to be used from the event loop.
+
+    Args:
+        model_name (str): Model the calls go to, for the metrics.
+        requests_per_minute (int): Request budget, 0 for no limit.
+        tokens_per_minute (int): Token budget, 0 for no limit.
+        queue_timeout_seconds (float, optional): Longest wait for budget.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        requests_per_minute: int,
+        tokens_per_minute: int,
+        queue_timeout_seconds: float = settings.LLM_QUEUE_TIMEOUT_SECONDS,
+    ) -> None:
+        self.model_name = model_name
+        self.queue_timeout_seconds = queue_timeout_seconds
+
+        self.__requests = _Budget(requests_per_minute) if requests_per_minute > 0 else None
+        self.__tokens = _Budget(tokens_per_minute) if tokens_per_minute > 0 else None
+        # (priority, arrival, tokens, future) of the calls waiting for budget
+        self.__waiters: list[tuple[int, int, int, asyncio.Future]] = []
+        self.__arrivals = itertools.count()
+        self.__paused_until = 0.0
+        self.__wakeup: asyncio.TimerHandle | None = None
+        # Shared call and number of callers waiting on it, per request key
+        self.__in_flight: dict[str, tuple[asyncio.Task, list[int]]] = {}
+
+    async def acquire(self, tokens: int, priority: int = INTERACTIVE_PRIORITY) -> None:
+        """Wait until one request and ``tokens`` tokens fit in the budgets, and reserve them.
+
+        Raises:
+            TimeoutError: If the budget does not free up within ``queue_timeout_seconds``.
+        """
+
+        started_at = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.__waiters, (priority, next(self.__arrivals), tokens, future))
+        self.__dispatch()
+
+        try:
+            async with asyncio.timeout(self.queue_timeout_seconds):
+                await future
+        except BaseException as e:
+            if future.done() and not future.cancelled():
+                # Granted just as the caller gave up; the call is never sent
+                self.settle(tokens, 0, sent=False)
+            else:
+                future.cancel()
+                self.__dispatch()
+            if isinstance(e, TimeoutError):
+                raise TimeoutError(
+                    f"No rate limit budget for '{self.model_name}' within {self.queue_timeout_seconds:g}s"
+                ) from e
+            raise
+        finally:
+            LLM_QUEUE_WAIT.labels(self.model_name, str(priority)).observe(time.perf_counter() - started_at)
+
+    def settle(self, reserved_tokens: int, used_tokens: int, sent: bool = True) -> None:
+        """Replace a reservation of `acquire` by what the call actually used.
+
+        Args:
+            reserved_tokens (int): Tokens reserved for the call.
+            used_tokens (int): Tokens the call used, may exceed the reservation.
+            sent (bool, optional): False if the request never reached OpenAI.
+        """
+
+        now = time.monotonic()
+        if self.__tokens is not None:
+            self.__tokens.refill(now)
+            self.__tokens.level += self.__tokens.clamp(reserved_tokens) - used_tokens
+        if not sent and self.__requests is not None:
+            self.__requests.refill(now)
+            self.__requests.level = min(self.__requests.capacity, self.__requests.level + 1)
+        self.__dispatch()
+
+    def pause(self, seconds: float) -> None:
+        """Hold every waiting call for ``seconds``, e.g. after a 429."""
+
+        self.__paused_until = max(self.__paused_until, time.monotonic() + seconds)
+        self.__dispatch()
+
+    async def coalesce(self, key: str, call: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """Run ``call``, or join the identical call already running under ``key``.
+
+        The shared call is cancelled only once every caller waiting on it is.
+
+        Returns:
+            tuple[Any, bool]: The result, and whether this caller started the call.
+        """
+
+        leader = key not in self.__in_flight
+        if leader:
+            task = asyncio.create_task(call())
+            self.__in_flight[key] = (task, [0])
+            task.add_done_callback(lambda _: self.__in_flight.pop(key, None))
+        else:
+            LLM_COALESCED.labels(self.model_name).inc()
+        task, waiting = self.__in_flight[key]
+
+        waiting[0] += 1
+        try:
+            return await asyncio.shield(task), leader
+        finally:
+            waiting[0] -= 1
+            if not waiting[0] and not task.done():
+                task.cancel()
+
+    def close(self) -> None:
+        if self.__wakeup is not None:
+            self.__wakeup.cancel()
+            self.__wakeup = None
+        for *_, future in self.__waiters:
+            future.cancel()
+        self.__waiters.clear()
+
+    def __dispatch(self) -> None:
+        # Grants waiters in priority order while the budgets allow, then sleeps
+        # until the first one can go
+        if self.__wakeup is not None:
+            self.__wakeup.cancel()
+            self.__wakeup = None
+
+        now = time.monotonic()
+        for budget in (self.__requests, self.__tokens):
+            if budget is not None:
+                budget.refill(now)
+
+        while self.__waiters:
+            _, _, tokens, future = self.__waiters[0]
+            if future.done():
+                heapq.heappop(self.__waiters)
+                continue
+
+            wait = max(
+                self.__paused_until - now,
+                self.__requests.wait_time(1) if self.__requests is not None else 0.0,
+                self.__tokens.wait_time(tokens) if self.__tokens is not None else 0.0,
+            )
+            if wait > 0:
+                self.__wakeup = asyncio.get_running_loop().call_later(wait, self.__dispatch)
+                return
+
+            heapq.heappop(self.__waiters)
+            if self.__requests is not None:
+                self.__requests.level -= 1
+            if self.__tokens is not None:
+                self.__tokens.level -= self.__tokens.clamp(tokens)
+            future.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "waiting": sum(not future.done() for *_, future in self.__waiters),
+            "in_flight_shared": len(self.__in_flight),
+            "requests_left": self.__requests.level if self.__requests is not None else None,
+            "tokens_left": self.__tokens.level if self.__tokens is not None else None,
+            "paused_seconds": max(0.0, self.__paused_until - time.monotonic()),
+        }
+
+
+_schedulers: dict[str, LLMScheduler] = {}
+
+
+def get_llm_scheduler(model_name: str) -> LLMScheduler:
+    """Scheduler shared by every call to ``model_name`` in the process."""
+
+    if model_name not in _schedulers:
+        _schedulers[model_name] = LLMScheduler(
+            model_name,
+            requests_per_minute=settings.LLM_REQUESTS_PER_MINUTE_BY_MODEL.get(
+                model_name, settings.LLM_REQUESTS_PER_MINUTE
+            ),
+            tokens_per_minute=settings.LLM_TOKENS_PER_MINUTE_BY_MODEL.get(model_name, settings.LLM_TOKENS_PER_MINUTE),
+        )
+    return _schedulers[model_name]
+
+
+def get_llm_scheduler_stats() -> dict:
+    return {model_name: scheduler.stats() for model_name, scheduler in _schedulers.items()}
+
+
+def close_llm_schedulers() -> None:
+    """Drop the schedulers, whose timers and waiters belong to the current event loop."""
+
+    for scheduler in _schedulers.values():
+        scheduler.close()
+    _schedulers.clear()
+
+
+def _retry_after(error: Exception) -> float | None:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+
+    try:
+        if "retry-after-ms" in response.headers:
+            return float(response.headers["retry-after-ms"]) / 1000
+        if "retry-after" in response.headers:
+            return float(response.headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def _is_retryable(error: Exception) -> bool:
+    # An exhausted quota is also a 429, but waiting does not help and must not hold the queue
+    return not (isinstance(error, RateLimitError) and getattr(error, "code", None) == "insufficient_quota")
+
+
+def _used_tokens(message: BaseMessage, default: int) -> int:
+    usage = getattr(message, "usage_metadata", None)
+    return usage["total_tokens"] if usage else default
+
+
+class ScheduledChatOpenAI(ChatOpenAI):
+    """ChatOpenAI whose calls go through the `LLMScheduler` of their model.
+
+    Every call waits for rate limit budget at ``priority``, and calls failing
+    with a 429, a timeout or a 5xx are retried with jittered exponential
+    backoff, honouring the retry-after of OpenAI. An exhausted quota fails
+    right away. Identical non-streamed calls
+    running at the same time share one request. Streamed calls are never
+    shared, as each one reports its tokens to its own callbacks, and are only
+    retried until their first chunk.
+    """
+
+    priority: int = INTERACTIVE_PRIORITY
+
+    def __estimate_tokens(self, messages: list[BaseMessage]) -> int:
+        packer = get_context_packer()
+        return sum(packer.count_message_tokens(message) for message in messages) + settings.LLM_EXPECTED_OUTPUT_TOKENS
+
+    async def __backoff(self, scheduler: LLMScheduler, error: Exception, attempt: int) -> None:
+        LLM_RETRIES.labels(self.model_name, type(error).__name__).inc()
+        delay = min(settings.LLM_RETRY_MAX_DELAY_SECONDS, settings.LLM_RETRY_BASE_DELAY_SECONDS * 2**attempt)
+        retry_after = _retry_after(error)
+        if isinstance(error, RateLimitError):
+            # Every queued call waits as well, not only this one
+            scheduler.pause(retry_after or delay)
+        sleep = max(retry_after or 0.0, random.uniform(delay / 2, delay))
+        print(f"'{self.model_name}' call failed ({type(error).__name__}), retry {attempt + 1} in {sleep:.1f}s")
+        await asyncio.sleep(sleep)
+
+    async def __generate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None,
+        run_manager: AsyncCallbackManagerForLLMRun | None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        scheduler = get_llm_scheduler(self.model_name)
+        estimate = self.__estimate_tokens(messages)
+
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            await scheduler.acquire(estimate, self.priority)
+            try:
+                result = await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+            except _RETRYABLE_ERRORS as e:
+                scheduler.settle(estimate, 0)
+                if attempt == settings.LLM_MAX_RETRIES or not _is_retryable(e):
+                    raise
+                await self.__backoff(scheduler, e, attempt)
+                continue
+            except BaseException:
+                scheduler.settle(estimate, 0)
+                raise
+
+            scheduler.settle(estimate, sum(_used_tokens(g.message, 0) for g in result.generations) or estimate)
+            return result
+
+    async def _agenerate(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        if self.streaming:
+            # ChatOpenAI streams these itself through `_astream`, which reserves the budget
+            return await super()._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        key = hashlib.sha256(
+            dumps([self.model_name, self.temperature, messages, stop, kwargs]).encode("utf-8")
+        ).hexdigest()
+        result, leader = await get_llm_scheduler(self.model_name).coalesce(
+            key, lambda: self.__generate(messages, stop, run_manager, **kwargs)
+        )
+        return result if leader else result.model_copy(deep=True)
+
+    async def _astream(
+        self,
+        messages: list[BaseMessage],
+        stop: list[str] | None = None,
+        run_manager: AsyncCallbackManagerForLLMRun | None = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[ChatGenerationChunk]:
+        scheduler = get_llm_scheduler(self.model_name)
+        estimate = self.__estimate_tokens(messages)
+
+        for attempt in range(settings.LLM_MAX_RETRIES + 1):
+            await scheduler.acquire(estimate, self.priority)
+            used = 0
+            started = False
+            try:
+                async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                    started = True
+                    used = _used_tokens(chunk.message, used)
+                    yield chunk
+            except _RETRYABLE_ERRORS as e:
+                scheduler.settle(estimate, used)
+                if started or attempt == settings.LLM_MAX_RETRIES or not _is_retryable(e):
+                    raise
+                await self.__backoff(scheduler, e, attempt)
+                continue
+            except BaseException:
+                # Cancelled or failed mid-stream: keep the reservation, the tokens were likely spent
+                scheduler.settle(estimate, used or estimate)
+                raise
+
+            scheduler.settle(estimate, used or estimate)
+            return
@@ -0,0 +1,48 @@
+from dataclasses import dataclass
+
+from mpdagents.application.conversation_service.workflow.context_packer import ContextPacker, get_context_packer
+from mpdagents.application.rag.retrieval_gate import needs_retrieval
+from mpdagents.config import settings
+
+
+@dataclass(frozen=True)
+class ModelRoute:
+    """The model chosen for a call and why, as recorded in the trace metadata."""
+
+    model: str
+    reason: str
+
+    def as_metadata(self) -> dict[str, str]:
+        return {"model_route": self.model, "model_route_reason": self.reason}
+
+
+def route_conversation_model(query: str, context: str, packer: ContextPacker | None = None) -> ModelRoute:
+    """Pick the model answering a conversation turn.
+
+    Persona banter (greetings, thanks, short messages) is answered by the small
+    model. The large model is kept for turns that carry RAG context or a long
+    query, where answer quality depends on it.
+
+    Args:
+        query (str): The latest user message.
+        context (str): The RAG context rendered in the prompt, possibly empty.
+        packer (ContextPacker | None, optional): Used to count the query tokens.
+
+    Returns:
+        ModelRoute: The model name and the routing reason.
+    """
+
+    if not settings.MODEL_ROUTING_ENABLED:
+        return ModelRoute(model=settings.OPENAI_LLM_MODEL, reason="routing_disabled")
+
+    if context:
+        return ModelRoute(model=settings.OPENAI_LLM_MODEL, reason="rag_context")
+
+    packer = packer or get_context_packer()
+    if packer.count_tokens(query) >= settings.MODEL_ROUTING_LONG_QUERY_TOKENS:
+        return ModelRoute(model=settings.OPENAI_LLM_MODEL, reason="long_query")
+
+    if not needs_retrieval(query):
+        return ModelRoute(model=settings.OPENAI_LLM_MODEL_SMALL, reason="small_talk")
+
+    return ModelRoute(model=settings.OPENAI_LLM_MODEL_SMALL, reason="short_turn")
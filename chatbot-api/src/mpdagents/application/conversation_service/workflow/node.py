@@ -1,108 +1,212 @@
 
-from mpdagents.application.conversation_service.workflow.chains import get_chatbot_response_chain, get_conversation_summary_chain
+from mpdagents.application.conversation_service.response_cache import response_cache
+from mpdagents.application.conversation_service.workflow.chains import (
+    get_chatbot_prompt_version,
+    get_chatbot_response_chain,
+    get_conversation_summary_chain,
+)
+from mpdagents.application.conversation_service.workflow.context_packer import get_context_packer
+from mpdagents.application.conversation_service.workflow.model_router import ModelRoute, route_conversation_model
+from mpdagents.application.conversation_service.workflow.prompt_usage import prompt_usage_stats
 from mpdagents.application.conversation_service.workflow.state import ChatbotState
 from langchain_core.messages import RemoveMessage
 from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.config import merge_configs
 from mpdagents.config import settings
-from mpdagents.application.rag.rag import get_rag_context,Rag_Input_Schema
+from mpdagents.application.rag.rag import get_routed_rag_context
 from typing import Optional
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.messages import BaseMessage, HumanMessage, AIMessage
 
 async def conversation_node(state: ChatbotState, config: RunnableConfig):
-    summary = state.get("summary", "")
-    rag_context = state.get("context","")
-    conversation_chain = get_chatbot_response_chain()
+    # Summary, RAG chunks and history share one token budget
+    packer = get_context_packer()
+    packed = packer.pack(
+        summary=state.get("summary", ""),
+        chunks=state.get("context"),
+        messages=state["messages"],
+    )
+
+    # Small talk goes to the small model; the choice is recorded in the trace
+    route = route_conversation_model(get_last_user_query(state), packed.context, packer)
+    conversation_chain = get_chatbot_response_chain(route.model)
+    config = merge_configs(config, {"metadata": route.as_metadata()})
 
     response = await conversation_chain.ainvoke(
         {
-            "messages": state["messages"],
-            "summary": summary,
-            "context": rag_context,
+            "messages": packed.messages,
+            "summary": packed.summary,
+            "context": packed.context,
             "character_id": state.get("character_id"),
             "character_name": state.get("character_name"),
             "character_style": state.get("character_style"),
             "character_perspective": state.get("character_perspective"),
+            "character_prompt": state.get("character_prompt"),
         },
         config,
     )
-    
-    return {"messages": response}
+    prompt_usage_stats.record(route.model, response.usage_metadata)
+
+    cache_key = state.get("response_cache_key")
+    if cache_key and response_cache is not None:
+        response_cache.set(cache_key, response.content)
+
+    return {"messages": response, "response_cache_key": None}
+
+async def response_cache_node(state: ChatbotState):
+    """Answer repeated opening turns from the response cache, see `ResponseCache`.
+
+    On a miss, the cache key is kept in the state so `conversation_node` can
+    store the reply it generates.
+    """
+
+    if response_cache is None:
+        return {"response_cache_key": None}
+
+    messages = state["messages"]
+    last_human = next(
+        (index for index in range(len(messages) - 1, -1, -1) if isinstance(messages[index], HumanMessage)),
+        None,
+    )
+    if last_human is None:
+        return {"response_cache_key": None}
+
+    cache_key = response_cache.key(
+        character_id=state.get("character_id"),
+        message=messages[last_human].content,
+        history=messages[:last_human],
+        summary=state.get("summary", ""),
+        # A reloaded persona must not be answered with replies cached for the old one
+        prompt_version=f"{get_chatbot_prompt_version()}\0{state.get('character_prompt') or ''}",
+    )
+    if cache_key is None:
+        return {"response_cache_key": None}
+
+    cached_response = response_cache.get(cache_key)
+    if cached_response is None:
+        return {"response_cache_key": cache_key}
+
+    return {
+        "response_cache_key": None,
+        "messages": AIMessage(content=cached_response, response_metadata={"response_cache": "hit"}),
+    }
+
 
 async def summarize_conversation_node(state: ChatbotState):
     summary = state.get("summary", "")
+    to_summarize = select_messages_to_summarize(state["messages"], summary)
+    if not to_summarize:
+        return {}
+
     summary_chain = get_conversation_summary_chain(summary)
 
+    # Only messages not yet in the summary are sent, the summary carries the rest
     response = await summary_chain.ainvoke(
         {
-            "messages": state["messages"],
+            "messages": to_summarize,
             "summary": summary,
-        }
+        },
+        {"metadata": ModelRoute(model=settings.OPENAI_LLM_MODEL_SUMMARY, reason="summary").as_metadata()},
     )
+    prompt_usage_stats.record(settings.OPENAI_LLM_MODEL_SUMMARY, response.usage_metadata)
 
-    delete_messages = [
-        RemoveMessage(id=m.id)
-        for m in state["messages"][: -settings.TOTAL_MESSAGES_AFTER_SUMMARY]
-    ]
+    delete_messages = [RemoveMessage(id=m.id) for m in to_summarize]
     return {"summary": response.content, "messages": delete_messages}
 
 
-async def rag_context_injection_node(state: ChatbotState):
+def select_messages_to_summarize(messages: list[BaseMessage], summary: str = "") -> list[BaseMessage]:
+    """Pick the oldest messages to fold into the summary.
+
+    The most recent ``SUMMARY_KEEP_RECENT_TOKENS`` of history stay verbatim,
+    and the selection stops before the existing summary plus the selected
+    messages exceed ``SUMMARY_PROMPT_TOKEN_BUDGET``. Anything left over is
+    folded in by the next summarization. Summarized messages are removed from
+    the thread, so no message is ever sent to the summary model twice.
+    """
+
+    packer = get_context_packer()
+    costs = [packer.count_message_tokens(message) for message in messages]
+
+    # Keep the recent tail, and always at least the latest message
+    kept_from = len(messages) - 1
+    kept_tokens = costs[kept_from] if messages else 0
+    while kept_from > 0 and kept_tokens + costs[kept_from - 1] <= settings.SUMMARY_KEEP_RECENT_TOKENS:
+        kept_from -= 1
+        kept_tokens += costs[kept_from]
+
+    budget = settings.SUMMARY_PROMPT_TOKEN_BUDGET - packer.count_tokens(summary)
+    selected = 0
+    # The oldest message always goes in, so an oversized message cannot stall summarization
+    while selected < kept_from and (selected == 0 or costs[selected] <= budget):
+        budget -= costs[selected]
+        selected += 1
+
+    return messages[:selected]
+
+
+def get_last_user_query(state: ChatbotState) -> str:
+    """Return the content of the latest HumanMessage, skipping AI messages."""
+
+    for message in reversed(state.get("messages", [])):
+        if isinstance(message, HumanMessage):
+            return message.content
+    return ""
+
+
+async def retrieve_rag_context(user_query: str, character_id: Optional[str] = None) -> Optional[list[dict]]:
+    """Retrieve knowledge-base chunks for a user query.
+
+    The namespaces searched depend on the character and the query, see
+    `NamespaceRouter`.
+    """
+
+    # Get RAG context from every routed namespace at once
+    results = await get_routed_rag_context(user_query, character_id)
+
+    # Keep the chunks whole; `conversation_node` fits them in the token budget
+    return to_rag_chunks(results)
+
+
+async def rag_context_injection_node(state: ChatbotState, config: RunnableConfig):
     """
     Context injection node to add RAG context to the conversation.
     Retrieves relevant documents based on the user's latest message.
+
+    If the caller already started the retrieval (see `rag_prefetch` in
+    `generate_response`), its result is awaited instead of querying again, so
+    the lookup overlaps with checkpoint loading.
     """
     
-    # Extract the latest user message
-    if not state["messages"]:
-        return {"context": None}
-    
-    # Get the last user message (skip AI messages)
-    user_query = ""
-    for message in reversed(state["messages"]):
-        if isinstance(message, HumanMessage):
-            user_query = message.content
-            break
+    user_query = get_last_user_query(state)
     
     if not user_query.strip():
         return {"context": None}
     
+    prefetch = config.get("configurable", {}).get("rag_prefetch")
+
     try:
-        # Create RAG input
-        rag_input = Rag_Input_Schema(
-            query=user_query,
-            k=3,
-            namespace="motion"
-        )
-        
-        # Get RAG context
-        results = await get_rag_context(rag_input)
-        
-        # Format context for the LLM
-        formatted_context = format_rag_context(results)
+        if prefetch is not None:
+            rag_chunks = await prefetch
+        else:
+            rag_chunks = await retrieve_rag_context(user_query, state.get("character_id"))
         
-        return {"context": formatted_context}
+        return {"context": rag_chunks}
         
     except Exception as e:
         print(f"Error in RAG context injection: {e}")
         return {"context": None}
 
-def format_rag_context(query_results) -> Optional[str]:
-    """Format RAG results into a context string for the LLM"""
-    
+def to_rag_chunks(query_results) -> Optional[list[dict]]:
+    """Turn RAG results into plain chunks that can be stored in the graph state."""
+
     if not query_results or not hasattr(query_results, 'matches') or not query_results.matches:
         return None
-    
-    context_parts = []
-    context_parts.append("Here is relevant context from the knowledge base:\n")
-    
-    for i, match in enumerate(query_results.matches[:3]):  # Top 3 results
-        text = match.metadata.get('text', 'No content available')
-        source = match.metadata.get('source', 'Unknown source')
-        score = match.score
-        
-        context_parts.append(f"**Context {i+1}** (Relevance: {score:.3f}):")
-        context_parts.append(f"Source: {source}")
-        context_parts.append(f"Content: {text[:500]}...")  # Limit length
-        context_parts.append("")  # Empty line for separation
-    
-    return "\n".join(context_parts)
+
+    return [
+        {
+            "id": match.id,
+            "text": match.metadata.get("text", ""),
+            "source": match.metadata.get("source", "Unknown source"),
+            "score": match.score,
+        }
+        for match in query_results.matches
+    ]
@@ -0,0 +1,46 @@
+from collections import defaultdict
+from dataclasses import dataclass
+
+
+@dataclass
+class _ModelUsage:
+    calls: int = 0
+    input_tokens: int = 0
+    cached_input_tokens: int = 0
+    output_tokens: int = 0
+
+
+class PromptUsageStats:
+    """Process-wide token counters per model, including OpenAI's cached prompt tokens.
+
+    The cached ratio tells how much of the prompt was served from the provider
+    prompt cache, i.e. how well the stable prompt prefix is reused.
+    """
+
+    def __init__(self) -> None:
+        self.__usage: defaultdict[str, _ModelUsage] = defaultdict(_ModelUsage)
+
+    def record(self, model: str, usage_metadata: dict | None) -> None:
+        if not usage_metadata:
+            return
+
+        usage = self.__usage[model]
+        usage.calls += 1
+        usage.input_tokens += usage_metadata.get("input_tokens", 0)
+        usage.output_tokens += usage_metadata.get("output_tokens", 0)
+        usage.cached_input_tokens += (usage_metadata.get("input_token_details") or {}).get("cache_read", 0) or 0
+
+    def stats(self) -> dict:
+        return {
+            model: {
+                "calls": usage.calls,
+                "input_tokens": usage.input_tokens,
+                "cached_input_tokens": usage.cached_input_tokens,
+                "cached_ratio": usage.cached_input_tokens / usage.input_tokens if usage.input_tokens else 0.0,
+                "output_tokens": usage.output_tokens,
+            }
+            for model, usage in self.__usage.items()
+        }
+
+
+prompt_usage_stats = PromptUsageStats()
@@ -9,11 +9,13 @@ class ChatbotState(MessagesState):
     """
     
     summary: str
-    context: Optional[str]
+    context: Optional[list[dict]]
     character_id: Optional[str] = None
     character_style: Optional[str] = None
     character_perspective: Optional[str] = None
     character_name: Optional[str] = None
+    character_prompt: Optional[str] = None
+    response_cache_key: Optional[str] = None
     
     
         
@@ -0,0 +1,256 @@
+import asyncio
+import hashlib
+import re
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from array import array
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import OperationFailure
+
+from mpdagents.application.cache import LRUCache
+from mpdagents.config import settings
+from mpdagents.infrastructure.mongodb.checkpointer import create_async_mongo_client
+
+_WHITESPACE = re.compile(r"\s+")
+_EDGE_PUNCTUATION = " \t\n.,!?;:'\"`~-_*()[]{}"
+# MongoDB error for an index that exists with other options, e.g. another TTL
+_INDEX_OPTIONS_CONFLICT = 85
+
+
+def normalize_text(text: str) -> str:
+    """Normalize a query so trivially different inputs share one cache entry.
+
+    Case, repeated whitespace and surrounding punctuation are ignored, so
+    "Hi!", "hi" and "  HI  " all map to "hi".
+    """
+
+    return _WHITESPACE.sub(" ", text.casefold()).strip(_EDGE_PUNCTUATION)
+
+
+def embedding_cache_key(text: str, model: str) -> str:
+    """Build the cache key for a text embedded with a given model."""
+
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode()).hexdigest()
+
+
+class EmbeddingStore(ABC):
+    """Persistent tier behind the in-memory embedding cache."""
+
+    @abstractmethod
+    async def get(self, key: str) -> list[float] | None: ...
+
+    @abstractmethod
+    async def set(self, key: str, model: str, embedding: list[float]) -> None: ...
+
+    async def close(self) -> None:
+        return None
+
+
+class DiskEmbeddingStore(EmbeddingStore):
+    """SQLite-backed embedding store, useful for a single replica or local runs.
+
+    Args:
+        path (str): Path of the SQLite database file.
+        ttl_seconds (float | None): Entries older than this are ignored.
+    """
+
+    def __init__(self, path: str, ttl_seconds: float | None = None) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        self.__lock = asyncio.Lock()
+        self.__connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, embedding BLOB NOT NULL, created_at REAL NOT NULL)"
+        )
+        self.__connection.commit()
+
+    def __get(self, key: str) -> list[float] | None:
+        row = self.__connection.execute(
+            "SELECT embedding, created_at FROM embeddings WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        blob, created_at = row
+        if self.ttl_seconds is not None and created_at + self.ttl_seconds < time.time():
+            return None
+
+        return array("f", blob).tolist()
+
+    def __set(self, key: str, model: str, embedding: list[float]) -> None:
+        self.__connection.execute(
+            "INSERT OR REPLACE INTO embeddings (key, model, embedding, created_at) VALUES (?, ?, ?, ?)",
+            (key, model, array("f", embedding).tobytes(), time.time()),
+        )
+        self.__connection.commit()
+
+    async def get(self, key: str) -> list[float] | None:
+        async with self.__lock:
+            return await asyncio.to_thread(self.__get, key)
+
+    async def set(self, key: str, model: str, embedding: list[float]) -> None:
+        async with self.__lock:
+            await asyncio.to_thread(self.__set, key, model, embedding)
+
+    async def close(self) -> None:
+        self.__connection.close()
+
+
+class MongoEmbeddingStore(EmbeddingStore):
+    """MongoDB-backed embedding store shared by every API replica.
+
+    Expiry is delegated to a MongoDB TTL index on ``created_at``.
+
+    Args:
+        collection_name (str): Name of the collection holding the embeddings.
+        ttl_seconds (float | None): Lifetime of a stored embedding.
+    """
+
+    def __init__(self, collection_name: str, ttl_seconds: float | None = None) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.__client = create_async_mongo_client()
+        self.__collection = self.__client[settings.MONGO_DB_NAME][collection_name]
+        self.__setup_done = False
+
+    async def __setup(self) -> None:
+        if self.__setup_done:
+            return
+
+        # Done even if the index can't be set up, so writes don't retry it and fail every time
+        self.__setup_done = True
+        if self.ttl_seconds is None:
+            return
+
+        try:
+            await self.__collection.create_index("created_at", expireAfterSeconds=int(self.ttl_seconds))
+        except OperationFailure as e:
+            if e.code != _INDEX_OPTIONS_CONFLICT:
+                print(f"Can't create the TTL index of '{self.__collection.name}': {e}")
+                return
+            # The index exists with the TTL of an earlier deploy; update it in place
+            try:
+                await self.__collection.database.command(
+                    "collMod",
+                    self.__collection.name,
+                    index={"keyPattern": {"created_at": 1}, "expireAfterSeconds": int(self.ttl_seconds)},
+                )
+            except OperationFailure as e:
+                print(f"Can't update the TTL index of '{self.__collection.name}': {e}")
+
+    async def get(self, key: str) -> list[float] | None:
+        document = await self.__collection.find_one({"_id": key}, {"embedding": 1, "created_at": 1})
+        if document is None:
+            return None
+
+        # The TTL monitor only runs once a minute, so expired documents can linger.
+        if self.ttl_seconds is not None:
+            created_at = document["created_at"].replace(tzinfo=timezone.utc)
+            if created_at + timedelta(seconds=self.ttl_seconds) < datetime.now(timezone.utc):
+                return None
+
+        return document["embedding"]
+
+    async def set(self, key: str, model: str, embedding: list[float]) -> None:
+        await self.__setup()
+        await self.__collection.replace_one(
+            {"_id": key},
+            {"model": model, "embedding": embedding, "created_at": datetime.now(timezone.utc)},
+            upsert=True,
+        )
+
+    async def close(self) -> None:
+        self.__client.close()
+
+
+class EmbeddingCache:
+    """Two-tier cache of query embeddings keyed by normalized text and model name.
+
+    Lookups hit the in-memory LRU first, then the optional persistent store.
+    Embeddings found in the store are promoted to memory.
+
+    Args:
+        max_size (int): Number of embeddings kept in memory.
+        ttl_seconds (float | None): Lifetime of a cached embedding.
+        store (EmbeddingStore | None): Optional persistent tier.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl_seconds: float | None = None,
+        store: EmbeddingStore | None = None,
+    ) -> None:
+        self.__memory: LRUCache[list[float]] = LRUCache(max_size, ttl_seconds)
+        self.__store = store
+        self.store_hits = 0
+        self.store_misses = 0
+
+    async def get(self, text: str, model: str) -> list[float] | None:
+        key = embedding_cache_key(text, model)
+
+        embedding = self.__memory.get(key)
+        if embedding is not None or self.__store is None:
+            return embedding
+
+        try:
+            embedding = await self.__store.get(key)
+        except Exception as e:
+            print(f"Error reading embedding cache store: {e}")
+            embedding = None
+
+        if embedding is None:
+            self.store_misses += 1
+            return None
+
+        self.store_hits += 1
+        self.__memory.set(key, embedding)
+        return embedding
+
+    async def set(self, text: str, model: str, embedding: list[float]) -> None:
+        key = embedding_cache_key(text, model)
+        self.__memory.set(key, embedding)
+
+        if self.__store is not None:
+            try:
+                await self.__store.set(key, model, embedding)
+            except Exception as e:
+                print(f"Error writing embedding cache store: {e}")
+
+    def stats(self) -> dict:
+        """Return hit/miss counters for both tiers."""
+
+        memory = self.__memory.stats()
+        hits = memory["hits"] + self.store_hits
+        lookups = memory["hits"] + memory["misses"]
+        return {
+            "hits": hits,
+            "misses": lookups - hits,
+            "hit_ratio": hits / lookups if lookups else 0.0,
+            "memory": memory,
+            "store": {"hits": self.store_hits, "misses": self.store_misses}
+            if self.__store is not None
+            else None,
+        }
+
+    async def close(self) -> None:
+        if self.__store is not None:
+            await self.__store.close()
+
+
+def create_embedding_cache() -> EmbeddingCache | None:
+    """Build the embedding cache described by settings, or None if it is disabled."""
+
+    if not settings.EMBEDDING_CACHE_ENABLED:
+        return None
+
+    ttl_seconds = settings.EMBEDDING_CACHE_TTL_SECONDS
+    if settings.EMBEDDING_CACHE_BACKEND == "disk":
+        store = DiskEmbeddingStore(settings.EMBEDDING_CACHE_DISK_PATH, ttl_seconds)
+    elif settings.EMBEDDING_CACHE_BACKEND == "mongo":
+        store = MongoEmbeddingStore(settings.EMBEDDING_CACHE_COLLECTION, ttl_seconds)
+    else:
+        store = None
+
+    return EmbeddingCache(settings.EMBEDDING_CACHE_MAX_SIZE, ttl_seconds, store)
@@ -0,0 +1,372 @@
+"""Build or refresh a RAG namespace from a directory of text documents.
+
+Usage:
+    python -m mpdagents.application.rag.ingestion data/motion --namespace motion [--prune]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import AsyncIterator, Iterator
+
+import httpx
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from openai import APIConnectionError, APITimeoutError, AsyncOpenAI, InternalServerError, RateLimitError
+
+from mpdagents.application.rag.rag import invalidate_rag_cache
+from mpdagents.config import settings
+from mpdagents.infrastructure.vector_store.base import VectorRecord, VectorStore
+from mpdagents.infrastructure.vector_store.factory import create_vector_store
+
+_RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, APITimeoutError, InternalServerError)
+
+
+@dataclass(frozen=True)
+class Chunk:
+    """A piece of a document, identified by the hash of its content."""
+
+    id: str
+    text: str
+    source: str
+    chunk_index: int
+
+
+@dataclass
+class IngestionReport:
+    """Counters describing one ingestion run."""
+
+    files: int = 0
+    chunks: int = 0
+    skipped: int = 0
+    upserted: int = 0
+    deleted: int = 0
+    failed_batches: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+
+    def __str__(self) -> str:
+        elapsed = time.perf_counter() - self.started_at
+        return (
+            f"IngestionReport(files={self.files}, chunks={self.chunks}, skipped={self.skipped}, "
+            f"upserted={self.upserted}, deleted={self.deleted}, failed_batches={self.failed_batches}, elapsed={elapsed:.1f}s)"
+        )
+
+
+def chunk_id(text: str) -> str:
+    """Content hash used as the vector id, so unchanged chunks keep their id."""
+
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:32]
+
+
+class IngestionManifest:
+    """Chunk ids each source produced when the namespace was last ingested.
+
+    Chunk ids are content hashes, so an edited or deleted document leaves its
+    old chunks in the namespace; the manifest is how they are found again. It
+    is a JSON file per namespace next to the other ingestion runs, so the
+    namespace should always be ingested from the same place.
+
+    Args:
+        path (Path): JSON file of the manifest.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.sources: dict[str, list[str]] = {}
+        if path.exists():
+            self.sources = json.loads(path.read_text(encoding="utf-8"))
+
+    @classmethod
+    def for_namespace(cls, namespace: str, directory: str = settings.INGESTION_MANIFEST_PATH) -> "IngestionManifest":
+        return cls(Path(directory) / f"{namespace or '__default__'}.json")
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(self.sources, sort_keys=True), encoding="utf-8")
+        os.replace(tmp_path, self.path)
+
+
+def iter_files(paths: list[Path], extensions: tuple[str, ...]) -> Iterator[Path]:
+    """Yield matching files under the given paths, in a stable order."""
+
+    for path in paths:
+        if path.is_file():
+            yield path
+        elif path.is_dir():
+            for file in sorted(path.rglob("*")):
+                if file.is_file() and file.suffix.lower() in extensions:
+                    yield file
+
+
+def iter_chunks(
+    paths: list[Path],
+    extensions: tuple[str, ...],
+    chunk_size: int,
+    chunk_overlap: int,
+    report: IngestionReport,
+    produced: dict[str, list[str]] | None = None,
+) -> Iterator[Chunk]:
+    """Read documents one at a time and split them into overlapping chunks.
+
+    The ids of the chunks of every source are collected into ``produced``.
+    """
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    for file in iter_files(paths, extensions):
+        report.files += 1
+        text = file.read_text(encoding="utf-8", errors="ignore")
+        ids = produced.setdefault(str(file), []) if produced is not None else []
+        for index, piece in enumerate(splitter.split_text(text)):
+            piece = piece.strip()
+            if piece:
+                ids.append(chunk_id(piece))
+                yield Chunk(id=ids[-1], text=piece, source=str(file), chunk_index=index)
+
+
+async def iter_batches(chunks: Iterator[Chunk], batch_size: int) -> AsyncIterator[list[Chunk]]:
+    """Group chunks into batches, dropping duplicates within the run."""
+
+    seen: set[str] = set()
+    batch: list[Chunk] = []
+    for chunk in chunks:
+        if chunk.id in seen:
+            continue
+        seen.add(chunk.id)
+        batch.append(chunk)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+            # Let in-flight embedding requests make progress while files are read
+            await asyncio.sleep(0)
+    if batch:
+        yield batch
+
+
+async def with_backoff(operation, max_attempts: int, base_delay: float = 1.0, max_delay: float = 60.0):
+    """Await ``operation()`` and retry transient OpenAI errors with jittered exponential backoff."""
+
+    for attempt in range(1, max_attempts + 1):
+        try:
+            return await operation()
+        except _RETRYABLE_ERRORS as e:
+            if attempt == max_attempts:
+                raise
+            delay = min(max_delay, base_delay * 2 ** (attempt - 1))
+            delay = random.uniform(delay / 2, delay)
+            print(f"Embedding request failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+class IngestionPipeline:
+    """Chunk, embed and upsert documents into a vector store namespace.
+
+    Chunks whose content hash is already stored in the namespace are skipped,
+    so re-running the pipeline over an unchanged corpus only costs the
+    existence checks. New chunks are embedded in large batches, with at most
+    ``concurrency`` batches in flight.
+
+    After a run without failed batches, the chunks an ingested source no
+    longer produces are deleted, using the namespace's `IngestionManifest`.
+    With ``prune``, so are the chunks of sources that were not found under
+    the ingested paths at all, e.g. deleted documents.
+
+    Args:
+        vector_store (VectorStore): Destination of the vectors.
+        namespace (str): Namespace to write to.
+        manifest (IngestionManifest | None, optional): Chunk ids per source, the namespace's by default.
+        embedding_model (str, optional): OpenAI embedding model name.
+        batch_size (int, optional): Number of chunks embedded and upserted per request.
+        concurrency (int, optional): Maximum number of batches processed at once.
+        max_attempts (int, optional): Attempts per embedding request.
+    """
+
+    def __init__(
+        self,
+        vector_store: VectorStore,
+        namespace: str,
+        embedding_model: str = settings.RAG_EMBEDDING_MODEL,
+        batch_size: int = settings.INGESTION_BATCH_SIZE,
+        concurrency: int = settings.INGESTION_CONCURRENCY,
+        max_attempts: int = settings.INGESTION_MAX_ATTEMPTS,
+        manifest: IngestionManifest | None = None,
+    ) -> None:
+        self.vector_store = vector_store
+        self.namespace = namespace
+        self.manifest = manifest or IngestionManifest.for_namespace(namespace)
+        self.embedding_model = embedding_model
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self._semaphore = asyncio.Semaphore(concurrency)
+        # Retries are handled by `with_backoff`, so the client does not retry on its own
+        self._openai_client = AsyncOpenAI(api_key=settings.OPENAI_API_KEY, max_retries=0)
+
+    async def embed(self, texts: list[str]) -> list[list[float]]:
+        response = await with_backoff(
+            lambda: self._openai_client.embeddings.create(input=texts, model=self.embedding_model),
+            self.max_attempts,
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    async def process_batch(self, batch: list[Chunk], report: IngestionReport) -> None:
+        async with self._semaphore:
+            try:
+                existing = await self.vector_store.existing_ids([chunk.id for chunk in batch], self.namespace)
+                new_chunks = [chunk for chunk in batch if chunk.id not in existing]
+                report.skipped += len(batch) - len(new_chunks)
+                if not new_chunks:
+                    return
+
+                embeddings = await self.embed([chunk.text for chunk in new_chunks])
+                await self.vector_store.upsert(
+                    [
+                        VectorRecord(
+                            id=chunk.id,
+                            values=embedding,
+                            metadata={"text": chunk.text, "source": chunk.source, "chunk_index": chunk.chunk_index},
+                        )
+                        for chunk, embedding in zip(new_chunks, embeddings)
+                    ],
+                    self.namespace,
+                )
+            except Exception as e:
+                report.failed_batches += 1
+                print(f"Failed to ingest a batch of {len(batch)} chunks: {e}")
+                return
+
+            report.upserted += len(new_chunks)
+
+    async def run(
+        self,
+        paths: list[Path],
+        extensions: tuple[str, ...] = (".txt", ".md"),
+        chunk_size: int = settings.INGESTION_CHUNK_SIZE,
+        chunk_overlap: int = settings.INGESTION_CHUNK_OVERLAP,
+        prune: bool = False,
+    ) -> IngestionReport:
+        """Ingest every matching file under ``paths`` and return the run counters.
+
+        Args:
+            prune (bool, optional): Also delete the chunks of sources not found under ``paths``.
+        """
+
+        report = IngestionReport()
+        produced: dict[str, list[str]] = {}
+        chunks = iter_chunks(paths, extensions, chunk_size, chunk_overlap, report, produced)
+
+        tasks: set[asyncio.Task] = set()
+        async for batch in iter_batches(chunks, self.batch_size):
+            report.chunks += len(batch)
+            task = asyncio.create_task(self.process_batch(batch, report))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            # Bound the number of pending batches so large corpora are not held in memory
+            if len(tasks) >= 2 * self.concurrency:
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+
+        if report.failed_batches:
+            # The replacements of some chunks are missing; keep the old ones until a clean run
+            print("Some batches failed, stale chunks are kept until the next complete run")
+        else:
+            await self.delete_stale_chunks(produced, prune, report)
+
+        await self.vector_store.optimize(self.namespace)
+        invalidate_rag_cache(self.namespace)
+        return report
+
+    async def delete_stale_chunks(
+        self, produced: dict[str, list[str]], prune: bool, report: IngestionReport
+    ) -> None:
+        """Delete the chunks of the manifest that no source produces any more, then update it."""
+
+        sources = {
+            source: ids for source, ids in self.manifest.sources.items() if not prune and source not in produced
+        }
+        sources.update(produced)
+
+        # A chunk shared by several sources stays as long as one of them still produces it
+        kept = {id_ for ids in sources.values() for id_ in ids}
+        stale = sorted({id_ for ids in self.manifest.sources.values() for id_ in ids} - kept)
+
+        for start in range(0, len(stale), self.batch_size):
+            await self.vector_store.delete(stale[start : start + self.batch_size], self.namespace)
+            report.deleted += len(stale[start : start + self.batch_size])
+
+        self.manifest.sources = sources
+        self.manifest.save()
+
+    async def close(self) -> None:
+        await self._openai_client.close()
+
+
+async def ingest(args: argparse.Namespace) -> IngestionReport:
+    vector_store = create_vector_store(args.backend)
+    await vector_store.start()
+    pipeline = IngestionPipeline(
+        vector_store,
+        namespace=args.namespace,
+        batch_size=args.batch_size,
+        concurrency=args.concurrency,
+    )
+    try:
+        report = await pipeline.run(
+            [Path(path) for path in args.paths],
+            extensions=tuple(f".{ext.lstrip('.').lower()}" for ext in args.extensions),
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+            prune=args.prune,
+        )
+    finally:
+        await pipeline.close()
+        await vector_store.close()
+
+    if args.api_url and (report.upserted or report.deleted):
+        # Running API replicas cache retrieval results and, with the local backend,
+        # the namespace snapshot; drop both
+        async with httpx.AsyncClient() as client:
+            response = await client.post(
+                f"{args.api_url.rstrip('/')}/rag/invalidate-cache", params={"namespace": args.namespace}
+            )
+            response.raise_for_status()
+
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Chunk, embed and upsert documents into a RAG namespace.")
+    parser.add_argument("paths", nargs="+", help="Files or directories to ingest.")
+    parser.add_argument("--namespace", required=True, help="Vector store namespace to write to.")
+    parser.add_argument("--backend", default=settings.VECTOR_STORE_BACKEND, choices=["pinecone", "local"])
+    parser.add_argument("--extensions", nargs="+", default=["txt", "md"], help="File extensions to read.")
+    parser.add_argument("--chunk-size", type=int, default=settings.INGESTION_CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=settings.INGESTION_CHUNK_OVERLAP)
+    parser.add_argument("--batch-size", type=int, default=settings.INGESTION_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=settings.INGESTION_CONCURRENCY)
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="Also delete the chunks of previously ingested sources that are no longer under the given paths.",
+    )
+    parser.add_argument(
+        "--api-url",
+        default=None,
+        help="Running API to notify so it drops its cached retrieval results and snapshot of the namespace.",
+    )
+    args = parser.parse_args()
+
+    report = asyncio.run(ingest(args))
+    print(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+import re
+
+from mpdagents.config import settings
+from mpdagents.domain.character_registry import get_character_registry
+
+# Query keywords that pull a namespace into the search whichever character is talking
+NAMESPACE_KEYWORDS: dict[str, frozenset[str]] = {
+    "motion": frozenset(
+        {
+            "motion", "move", "moving", "movement", "velocity", "speed", "acceleration",
+            "force", "momentum", "newton", "inertia", "gravity", "friction", "kinematics",
+            "dynamics", "displacement", "trajectory", "projectile", "mass", "energy",
+        }
+    ),
+}
+
+_WORD_PATTERN = re.compile(r"[a-z']+")
+
+
+class NamespaceRouter:
+    """Choose the RAG namespaces to search for a character and a query.
+
+    A character always searches its own knowledge namespaces. Namespaces whose
+    keywords appear in the query are added after them, and the list is capped
+    at ``max_namespaces`` so a turn never fans out to every domain.
+
+    Args:
+        character_namespaces (dict[str, list[str]] | None, optional): Namespaces per
+            character id. Defaults to the ones of the character registry.
+        namespace_keywords (dict[str, frozenset[str]], optional): Trigger words per namespace.
+        default_namespace (str, optional): Used when nothing else matches.
+        max_namespaces (int, optional): Maximum number of namespaces per query.
+    """
+
+    def __init__(
+        self,
+        character_namespaces: dict[str, list[str]] | None = None,
+        namespace_keywords: dict[str, frozenset[str]] = NAMESPACE_KEYWORDS,
+        default_namespace: str = settings.RAG_DEFAULT_NAMESPACE,
+        max_namespaces: int = settings.RAG_MAX_NAMESPACES,
+    ) -> None:
+        self.character_namespaces = character_namespaces
+        self.namespace_keywords = namespace_keywords
+        self.default_namespace = default_namespace
+        self.max_namespaces = max_namespaces
+
+    def route(self, character_id: str | None, query: str) -> list[str]:
+        """Return the namespaces to search, most relevant first.
+
+        Args:
+            character_id (str | None): Id of the character answering.
+            query (str): The user message.
+
+        Returns:
+            list[str]: Distinct namespaces, never empty.
+        """
+
+        namespaces = list(self.__character_namespaces(character_id))
+
+        words = set(_WORD_PATTERN.findall(query.lower()))
+        for namespace, keywords in self.namespace_keywords.items():
+            if namespace not in namespaces and words & keywords:
+                namespaces.append(namespace)
+
+        if not namespaces:
+            namespaces.append(self.default_namespace)
+
+        return namespaces[: self.max_namespaces]
+
+    def __character_namespaces(self, character_id: str | None) -> list[str] | tuple[str, ...]:
+        if self.character_namespaces is not None:
+            return self.character_namespaces.get((character_id or "").lower(), [])
+
+        try:
+            return get_character_registry().get(character_id).knowledge_namespaces
+        except ValueError:
+            return []
@@ -1,47 +1,22 @@
-import os
+import asyncio
+
+import httpx
 from pydantic.v1 import BaseModel
-from dotenv import load_dotenv
-from openai import OpenAI
-from pinecone import Pinecone
+from openai import AsyncOpenAI
+from mpdagents.application.rag.embedding_cache import EmbeddingCache, create_embedding_cache
+from mpdagents.application.rag.namespace_router import NamespaceRouter
+from mpdagents.application.rag.retrieval_cache import (
+    SemanticRetrievalCache,
+    create_retrieval_cache,
+)
 from mpdagents.config import settings
+from mpdagents.infrastructure.metrics import observe_call
+from mpdagents.infrastructure.vector_store.base import VectorQueryResult, VectorStore
+from mpdagents.infrastructure.vector_store.factory import create_vector_store
 
-# --- 1. SETUP: Load API keys and connect to services ---
-
-# Load variables from your .env file
-load_dotenv()
-
-# Initialize the OpenAI client
-openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-
-# Initialize the Pinecone client
-pinecone_client = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index_name = os.getenv("PINECONE_INDEX_NAME")
-
-# Check if the index exists, otherwise raise an error
-if index_name not in pinecone_client.list_indexes().names():
-    raise ValueError(f"Index '{index_name}' does not exist. Please create it first.")
-
-# Connect to your specific index
-index = pinecone_client.Index(index_name)
-
-print(f"Successfully connected to Pinecone index: '{index_name}'")
-
-# --- 2. DEFINE YOUR QUERY ---
 
-# The user's question you want to find documents for
-user_question = "What is the syllabus for the MOST scholarship test?"
-
-# The target namespace to search within.
-# In your real app, this is determined by your query_router.
-# For this example, we'll hardcode it to "motion".
-target_namespace = "motion"
-
-print(f"\nSearching for: '{user_question}' in namespace '{target_namespace}'...")
-
-# --- 3. EMBED THE QUERY ---
-
-def get_embedding(text: str, openai_client: OpenAI, model="text-embedding-3-small"):
-    """Converts a text query into a vector embedding using OpenAI - Synchronous version"""
+async def get_embedding(text: str, openai_client: AsyncOpenAI, model: str = settings.RAG_EMBEDDING_MODEL):
+    """Converts a text query into a vector embedding using OpenAI"""
     try:
         # Ensure text is clean and not empty
         if not text or not text.strip():
@@ -52,113 +27,299 @@ def get_embedding(text: str, openai_client: OpenAI, model="text-embedding-3-smal
         clean_text = text.strip()
         
         # Make sure we're passing the right parameters to the API
-        response = openai_client.embeddings.create(
-            input=clean_text,  # Pass text directly, not as a list
-            model=model
-        )
+        with observe_call("embedding"):
+            response = await openai_client.embeddings.create(
+                input=clean_text,  # Pass text directly, not as a list
+                model=model
+            )
         
         return response.data[0].embedding
         
     except Exception as e:
         print(f"Error getting embedding: {e}")
-        print(f"Text input: {text}")  # Debug info
         print(f"Model: {model}")      # Debug info
         return None
 
 
-# query_vector = get_embedding(user_question)
+class Rag_Input_Schema(BaseModel):
+    query : str = ""
+    k : int = 3
+    namespace : str = "motion"
+
+
+class RagRetriever:
+    """Long-lived, async-native retriever over the RAG knowledge base.
+
+    The embedding client and the vector store are created once and keep their
+    HTTP connections alive between queries, so a retrieval costs one embedding
+    call and one vector query without blocking the event loop.
+
+    Args:
+        vector_store (VectorStore | None, optional): Backend to query. Defaults to
+            the one selected by `VECTOR_STORE_BACKEND`.
+        openai_api_key (str, optional): API key used for embeddings.
+        embedding_model (str, optional): OpenAI embedding model name.
+    """
+
+    def __init__(
+        self,
+        vector_store: VectorStore | None = None,
+        openai_api_key: str = settings.OPENAI_API_KEY,
+        embedding_model: str = settings.RAG_EMBEDDING_MODEL,
+    ) -> None:
+        self.embedding_model = embedding_model
+
+        self._http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.RAG_HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.RAG_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=settings.RAG_HTTP_KEEPALIVE_EXPIRY_SECONDS,
+            ),
+            timeout=settings.RAG_HTTP_TIMEOUT_SECONDS,
+        )
+        self._openai_client = AsyncOpenAI(api_key=openai_api_key, http_client=self._http_client)
+        self.vector_store = vector_store or create_vector_store()
+        self._started = False
+        self.embedding_cache: EmbeddingCache | None = create_embedding_cache()
+        self.retrieval_cache: SemanticRetrievalCache | None = create_retrieval_cache()
 
-# --- 4. QUERY PINECONE ---
+    async def start(self) -> None:
+        """Open the vector store and validate it, e.g. that the Pinecone index exists.
 
-# if query_vector:
-#     try:
-#         # Perform the search in the specified namespace
-#         query_results = index.query(
-#             namespace=target_namespace,
-#             vector=query_vector,
-#             top_k=3,  # Retrieve the top 3 most relevant documents
-#             include_metadata=True
-#         )
+        Raises:
+            ValueError: If the vector store cannot be used.
+        """
 
-#         # --- 5. DISPLAY THE RESULTS ---
-#         print("\n--- Top 3 Retrieved Documents ---")
-#         if query_results.matches:
-#             for i, match in enumerate(query_results.matches):
-#                 text = match.metadata.get('text', 'No text found.')
-#                 source = match.metadata.get('source', 'No source found.')
-#                 score = match.score
+        await self.vector_store.start()
+        self._started = True
 
-#                 print(f"\n{i+1}. Score: {score:.4f}")
-#                 print(f"   Source: {source}")
-#                 print(f"   Text: {text[:400]}...") # Print the first 400 characters
-#         else:
-#             print("No relevant documents found.")
+    async def embed(self, text: str) -> list[float] | None:
+        """Embed a query, serving repeated and near-identical queries from the cache."""
 
-#     except Exception as e:
-#         print(f"An error occurred while querying Pinecone: {e}")
+        if self.embedding_cache is not None:
+            embedding = await self.embedding_cache.get(text, self.embedding_model)
+            if embedding is not None:
+                return embedding
+
+        embedding = await get_embedding(text, self._openai_client, self.embedding_model)
+
+        if embedding is not None and self.embedding_cache is not None:
+            await self.embedding_cache.set(text, self.embedding_model, embedding)
+
+        return embedding
+
+    async def retrieve(self, rag_input: Rag_Input_Schema) -> VectorQueryResult:
+        """Embed the query and return the closest matches from the index.
+
+        Args:
+            rag_input (Rag_Input_Schema): Query text, number of results and namespace.
+
+        Returns:
+            VectorQueryResult: Matches ordered by decreasing score, possibly empty.
+
+        Raises:
+            ValueError: If the query is empty, cannot be embedded, or the vector
+                database query fails.
+        """
+
+        if not self._started:
+            await self.start()
+
+        # Validate inputs
+        if not rag_input.query.strip():
+            raise ValueError("Query cannot be empty")
+
+        query_vector = await self.embed(rag_input.query)
+
+        if not query_vector:
+            raise ValueError("Failed to generate embedding for the query")
+
+        return await self.__query_namespace(query_vector, rag_input.k, rag_input.namespace)
+
+    async def retrieve_many(
+        self,
+        query: str,
+        namespaces: list[str],
+        k: int = settings.RAG_TOP_K,
+        latency_budget: float | None = settings.RAG_LATENCY_BUDGET_SECONDS,
+    ) -> VectorQueryResult:
+        """Search several namespaces concurrently and merge their matches by score.
+
+        The query is embedded once and every namespace is queried in parallel,
+        so adding a namespace costs no extra latency as long as it answers
+        within ``latency_budget``. Namespaces that fail or are still pending
+        when the budget runs out are dropped from this turn.
+
+        Args:
+            query (str): The user message.
+            namespaces (list[str]): Namespaces to search.
+            k (int, optional): Number of merged matches to return.
+            latency_budget (float | None, optional): Seconds allowed for the
+                namespace queries, None to wait for all of them.
+
+        Returns:
+            VectorQueryResult: The best ``k`` matches across the namespaces that
+                answered in time; `namespace` lists those namespaces.
+
+        Raises:
+            ValueError: If the query is empty or cannot be embedded.
+        """
+
+        if not self._started:
+            await self.start()
+
+        if not query.strip():
+            raise ValueError("Query cannot be empty")
+
+        query_vector = await self.embed(query)
+
+        if not query_vector:
+            raise ValueError("Failed to generate embedding for the query")
+
+        tasks = {
+            asyncio.create_task(self.__query_namespace(query_vector, k, namespace)): namespace
+            for namespace in dict.fromkeys(namespaces)
+        }
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=latency_budget)
+        finally:
+            # Also reached when the turn itself is cancelled
+            for task in tasks:
+                task.cancel()
+
+        for task in pending:
+            print(f"RAG namespace '{tasks[task]}' exceeded the {latency_budget}s budget and was skipped")
 
+        results = []
+        for task in done:
+            if task.exception() is not None:
+                print(f"RAG namespace '{tasks[task]}' failed and was skipped: {task.exception()}")
+                continue
+            results.append(task.result())
+
+        # Same embedding model and metric everywhere, so scores are comparable across namespaces
+        matches = sorted(
+            (match for result in results for match in result.matches),
+            key=lambda match: match.score,
+            reverse=True,
+        )
 
+        answered = {result.namespace for result in results}
+        return VectorQueryResult(
+            matches=matches[:k],
+            namespace=",".join(namespace for namespace in tasks.values() if namespace in answered),
+        )
+
+    async def __query_namespace(self, query_vector: list[float], k: int, namespace: str) -> VectorQueryResult:
+        if self.retrieval_cache is not None:
+            cached_results = self.retrieval_cache.lookup(namespace, query_vector, k)
+            if cached_results is not None:
+                return cached_results
+
+        try:
+            with observe_call("vector_query"):
+                query_results = await self.vector_store.query(
+                    vector=query_vector,
+                    top_k=k,
+                    namespace=namespace,
+                )
+        except Exception as e:
+            print(f"Error querying vector store: {e}")
+            raise ValueError(f"Failed to query vector database: {e}")
+
+        if self.retrieval_cache is not None:
+            self.retrieval_cache.store(namespace, query_vector, k, query_results)
+
+        return query_results
+
+    def invalidate_cache(self, namespace: str | None = None) -> None:
+        """Forget cached retrieval results and vector store state, e.g. after a namespace was re-ingested."""
+
+        self.vector_store.reload(namespace)
+        if self.retrieval_cache is not None:
+            self.retrieval_cache.invalidate(namespace)
+
+    async def close(self) -> None:
+        """Release the pooled HTTP connections."""
+
+        await self.vector_store.close()
+        await self._http_client.aclose()
+        if self.embedding_cache is not None:
+            await self.embedding_cache.close()
+
+    def cache_stats(self) -> dict:
+        """Return hit/miss counters of the retriever caches."""
+
+        return {
+            "embedding": self.embedding_cache.stats() if self.embedding_cache is not None else None,
+            "retrieval": self.retrieval_cache.stats() if self.retrieval_cache is not None else None,
+        }
+
+
+_retriever: RagRetriever | None = None
+_namespace_router = NamespaceRouter()
+_retriever_lock = asyncio.Lock()
+
+
+async def init_rag_retriever(vector_store: VectorStore | None = None) -> RagRetriever:
+    """Create and start the process-wide retriever if it does not exist yet.
+
+    Args:
+        vector_store (VectorStore | None, optional): Backend to search instead of
+            the one selected in settings, e.g. an in-memory store for benchmarks.
+    """
+
+    global _retriever
+
+    async with _retriever_lock:
+        if _retriever is None:
+            retriever = RagRetriever(vector_store=vector_store)
+            try:
+                await retriever.start()
+            except Exception:
+                await retriever.close()
+                raise
+            _retriever = retriever
+
+    return _retriever
+
+
+async def close_rag_retriever() -> None:
+    """Close the process-wide retriever, if one was started."""
+
+    global _retriever
+
+    async with _retriever_lock:
+        if _retriever is not None:
+            await _retriever.close()
+            _retriever = None
+
+
+def get_rag_cache_stats() -> dict | None:
+    """Return cache counters of the process-wide retriever, if it was started."""
+
+    return _retriever.cache_stats() if _retriever is not None else None
+
+
+def invalidate_rag_cache(namespace: str | None = None) -> None:
+    """Forget cached retrieval results and vector store state of the process-wide retriever."""
+
+    if _retriever is not None:
+        _retriever.invalidate_cache(namespace)
 
-class Rag_Input_Schema(BaseModel):
-    query : str = ""
-    k : int = 3
-    namespace : str = "motion"
 
 async def get_rag_context(rag_input: Rag_Input_Schema):
-    """Get RAG context from vector database (Pinecone)"""
-    
-    # Initialize clients
-    openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
-    pinecone_client = Pinecone(api_key=settings.PINECONE_API_KEY)
-    index_name = settings.PINECONE_INDEX_NAME
-
-    # Validate inputs
-    if not rag_input.query.strip():
-        raise ValueError("Query cannot be empty")
-
-    # Check if index exists
-    if index_name not in pinecone_client.list_indexes().names():
-        raise ValueError(f"Index '{index_name}' does not exist. Please create it first.")
-    
-    # Connect to index
-    index = pinecone_client.Index(index_name)   
-    print(f"Successfully connected to Pinecone index: '{index_name}'")
-
-    user_question = rag_input.query.strip()
-    target_namespace = rag_input.namespace
-
-    print(f"\nSearching for: '{user_question}' in namespace '{target_namespace}'...")
-
-    # Generate embedding
-    query_vector = get_embedding(user_question, openai_client)
-    
-    if not query_vector:
-        raise ValueError("Failed to generate embedding for the query")
+    """Get RAG context from the configured vector store"""
 
-    try:
-        # Perform the search
-        query_results = index.query(
-            namespace=target_namespace,
-            vector=query_vector,
-            top_k=rag_input.k,  # Use the k parameter from input
-            include_metadata=True
-        )
+    retriever = _retriever or await init_rag_retriever()
 
-        # Validate results
-        if not query_results.matches:
-            print("No relevant documents found.")
-            return {"matches": [], "message": "No relevant documents found"}
+    return await retriever.retrieve(rag_input)
 
-        print(f"\nFound {len(query_results.matches)} relevant documents")
-        
-        # Optional: Log results for debugging
-        for i, match in enumerate(query_results.matches):
-            score = match.score
-            source = match.metadata.get('source', 'Unknown source')
-            print(f"{i+1}. Score: {score:.4f} | Source: {source}")
 
-        return query_results
+async def get_routed_rag_context(query: str, character_id: str | None, k: int = settings.RAG_TOP_K):
+    """Get RAG context from the namespaces routed for this character and query"""
 
-    except Exception as e:
-        print(f"Error querying Pinecone: {e}")
-        raise ValueError(f"Failed to query vector database: {e}")
\ No newline at end of file
+    retriever = _retriever or await init_rag_retriever()
+    namespaces = _namespace_router.route(character_id, query)
+
+    return await retriever.retrieve_many(query, namespaces, k=k)
@@ -0,0 +1,145 @@
+import time
+from typing import Any
+
+import numpy as np
+
+from mpdagents.config import settings
+
+
+class _NamespaceIndex:
+    """Fixed-capacity matrix of unit-normalized query vectors and their results."""
+
+    def __init__(self, dimension: int, capacity: int) -> None:
+        self.vectors = np.zeros((capacity, dimension), dtype=np.float32)
+        self.expires_at = np.full(capacity, -np.inf)
+        self.last_used = np.zeros(capacity)
+        self.results: list[Any] = [None] * capacity
+        self.size = 0
+
+    def slot_for_insert(self) -> int:
+        if self.size < len(self.results):
+            self.size += 1
+            return self.size - 1
+
+        # Full: reuse an expired slot if there is one, else the least recently used
+        now = time.monotonic()
+        expired = np.flatnonzero(self.expires_at[: self.size] < now)
+        if expired.size:
+            return int(expired[0])
+        return int(np.argmin(self.last_used[: self.size]))
+
+
+class SemanticRetrievalCache:
+    """Cache of vector-search results looked up by query-embedding similarity.
+
+    A cached result is served when a new query vector has a cosine similarity of
+    at least ``threshold`` with a previously answered query in the same namespace
+    and with the same ``top_k``. Each namespace keeps its own small in-process
+    matrix, so a lookup is a single matrix-vector product.
+
+    Args:
+        threshold (float): Minimum cosine similarity for a hit.
+        max_entries (int): Number of cached queries per namespace.
+        ttl_seconds (float | None): Lifetime of a cached result.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        max_entries: int,
+        ttl_seconds: float | None = None,
+    ) -> None:
+        if not 0.0 < threshold <= 1.0:
+            raise ValueError("threshold must be in (0, 1]")
+
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self.__indexes: dict[tuple[str, int], _NamespaceIndex] = {}
+
+    @staticmethod
+    def __normalize(vector: list[float]) -> np.ndarray | None:
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        return query / norm if norm else None
+
+    def lookup(self, namespace: str, vector: list[float], top_k: int) -> Any | None:
+        """Return cached results for a query similar enough to ``vector``, or None."""
+
+        index = self.__indexes.get((namespace, top_k))
+        query = self.__normalize(vector)
+        if index is None or query is None or index.size == 0 or index.vectors.shape[1] != query.shape[0]:
+            self.misses += 1
+            return None
+
+        now = time.monotonic()
+        similarities = index.vectors[: index.size] @ query
+        similarities[index.expires_at[: index.size] < now] = -np.inf
+        best = int(np.argmax(similarities))
+
+        if similarities[best] < self.threshold:
+            self.misses += 1
+            return None
+
+        index.last_used[best] = now
+        self.hits += 1
+        return index.results[best]
+
+    def store(self, namespace: str, vector: list[float], top_k: int, results: Any) -> None:
+        """Remember the results returned for a query vector."""
+
+        query = self.__normalize(vector)
+        if query is None:
+            return
+
+        index = self.__indexes.get((namespace, top_k))
+        if index is None or index.vectors.shape[1] != query.shape[0]:
+            index = _NamespaceIndex(query.shape[0], self.max_entries)
+            self.__indexes[(namespace, top_k)] = index
+
+        now = time.monotonic()
+        slot = index.slot_for_insert()
+        index.vectors[slot] = query
+        index.results[slot] = results
+        index.last_used[slot] = now
+        index.expires_at[slot] = now + self.ttl_seconds if self.ttl_seconds is not None else np.inf
+
+    def invalidate(self, namespace: str | None = None) -> None:
+        """Drop cached results for one namespace, or for every namespace."""
+
+        if namespace is None:
+            self.__indexes.clear()
+            return
+
+        for key in [key for key in self.__indexes if key[0] == namespace]:
+            del self.__indexes[key]
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the number of cached queries per namespace."""
+
+        lookups = self.hits + self.misses
+        sizes: dict[str, int] = {}
+        for (namespace, _), index in self.__indexes.items():
+            sizes[namespace] = sizes.get(namespace, 0) + index.size
+
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "namespaces": sizes,
+        }
+
+
+def create_retrieval_cache() -> SemanticRetrievalCache | None:
+    """Build the retrieval cache described by settings, or None if it is disabled."""
+
+    if not settings.RETRIEVAL_CACHE_ENABLED:
+        return None
+
+    return SemanticRetrievalCache(
+        threshold=settings.RETRIEVAL_CACHE_SIMILARITY_THRESHOLD,
+        max_entries=settings.RETRIEVAL_CACHE_MAX_ENTRIES,
+        ttl_seconds=settings.RETRIEVAL_CACHE_TTL_SECONDS,
+    )
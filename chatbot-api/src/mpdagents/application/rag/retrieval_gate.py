@@ -0,0 +1,40 @@
+from mpdagents.application.rag.embedding_cache import normalize_text
+from mpdagents.config import settings
+
+SMALL_TALK = frozenset(
+    {
+        "hi", "hii", "hello", "hey", "heya", "yo", "sup", "good morning", "good evening", "good night",
+        "thanks", "thank you", "thx", "ty", "thanks a lot", "thank you so much", "cheers",
+        "ok", "okay", "k", "kk", "cool", "nice", "great", "awesome", "perfect", "got it", "alright",
+        "yes", "yeah", "yep", "no", "nope", "sure", "maybe",
+        "lol", "haha", "hahaha", "lmao", "wow", "hmm", "bye", "goodbye", "see you", "see ya",
+        "how are you", "what's up", "whats up", "who are you",
+    }
+)
+
+
+def needs_retrieval(query: str) -> bool:
+    """Cheap local check deciding whether a user message is worth a RAG lookup.
+
+    Greetings, thanks, acknowledgements and very short messages without a
+    question mark are answered from the persona alone, which skips the
+    embedding call and the vector search for that turn.
+
+    Args:
+        query (str): The latest user message.
+
+    Returns:
+        bool: True if the knowledge base should be queried.
+    """
+
+    if not settings.RAG_GATE_ENABLED:
+        return bool(query.strip())
+
+    normalized = normalize_text(query)
+    if not normalized or normalized in SMALL_TALK:
+        return False
+
+    if "?" not in query and len(normalized.split()) < settings.RAG_GATE_MIN_WORDS:
+        return False
+
+    return True
@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import Literal
 
 from pydantic import Field
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -12,12 +13,124 @@ class Settings(BaseSettings):
     # OPENAI API key
     OPENAI_API_KEY: str
     OPENAI_LLM_MODEL: str = "gpt-4o"
-    OPENAI_LLM_MODEL_SUMMARY: str = "gpt-4o"
+    OPENAI_LLM_MODEL_SMALL: str = Field(
+        default="gpt-4o-mini", description="Model used for short turns without RAG context."
+    )
+    OPENAI_LLM_MODEL_SUMMARY: str = "gpt-4o-mini"
+
+    # Shared by every chat model, so connections to OpenAI are reused across turns
+    LLM_HTTP_MAX_CONNECTIONS: int = 100
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 50
+    LLM_HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 120.0
+    LLM_HTTP_TIMEOUT_SECONDS: float = 60.0
+
+    # --- Model Routing Configuration ---
+    MODEL_ROUTING_ENABLED: bool = True
+    MODEL_ROUTING_LONG_QUERY_TOKENS: int = Field(
+        default=60, description="Queries at least this long go to OPENAI_LLM_MODEL."
+    )
+
+    # --- LLM Rate Limit Configuration ---
+    LLM_SCHEDULER_ENABLED: bool = Field(
+        default=True, description="Queue chat model calls behind per-model request and token budgets."
+    )
+    LLM_REQUESTS_PER_MINUTE: int = Field(
+        default=5000,
+        description="Requests per minute this replica sends to a model: the key's limit divided by the replicas. 0 disables it.",
+    )
+    LLM_TOKENS_PER_MINUTE: int = Field(
+        default=450_000,
+        description="Tokens per minute this replica sends to a model: the key's limit divided by the replicas. 0 disables it.",
+    )
+    LLM_REQUESTS_PER_MINUTE_BY_MODEL: dict[str, int] = Field(
+        default_factory=dict, description="LLM_REQUESTS_PER_MINUTE per model name."
+    )
+    LLM_TOKENS_PER_MINUTE_BY_MODEL: dict[str, int] = Field(
+        default_factory=dict, description="LLM_TOKENS_PER_MINUTE per model name."
+    )
+    LLM_EXPECTED_OUTPUT_TOKENS: int = Field(
+        default=400, description="Output tokens reserved per call until its actual usage is known."
+    )
+    LLM_QUEUE_TIMEOUT_SECONDS: float = Field(
+        default=30.0, description="Longest time a call waits for budget before it fails."
+    )
+    LLM_MAX_RETRIES: int = 3
+    LLM_RETRY_BASE_DELAY_SECONDS: float = 0.5
+    LLM_RETRY_MAX_DELAY_SECONDS: float = 20.0
+
+    # --- API Startup Configuration ---
+    STARTUP_MODE: Literal["eager", "lazy"] = Field(
+        default="eager",
+        description="'eager' connects to external services before serving, 'lazy' defers it to first use.",
+    )
+
+
+    # --- WebSocket Streaming Configuration ---
+    WS_FRAME_MAX_CHARS: int = Field(
+        default=256, description="Characters after which streamed tokens are sent as one frame."
+    )
+    WS_FRAME_INTERVAL_SECONDS: float = Field(
+        default=0.05, description="Longest time a streamed token waits before its frame is sent."
+    )
+    WS_STREAM_BUFFER_SIZE: int = Field(
+        default=256,
+        description="Tokens buffered for a slow client before the model stream is paused.",
+    )
+    WS_SEND_TIMEOUT_SECONDS: float = Field(
+        default=30.0, description="The socket is closed if a client does not accept a frame within this time."
+    )
+
+    # --- Admission Control Configuration ---
+    ADMISSION_MAX_IN_FLIGHT: int = Field(
+        default=64, description="Conversation turns running at the same time, across all endpoints."
+    )
+    ADMISSION_MAX_QUEUED: int = Field(
+        default=128, description="Turns waiting for a free slot; further turns are rejected with 503."
+    )
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: float = Field(
+        default=5.0, description="Longest time a turn waits for a free slot before it is rejected."
+    )
+    ADMISSION_MAX_PENDING_PER_THREAD: int = Field(
+        default=2, description="Running plus waiting turns of one thread; further turns are rejected with 429."
+    )
+    ADMISSION_USER_RATE_PER_MINUTE: float = Field(
+        default=30.0, description="Turns a user may start per minute on average; 0 disables the limit."
+    )
+    ADMISSION_USER_BURST: int = Field(default=10, description="Turns a user may start back to back.")
+    ADMISSION_USER_HEADER: str = Field(
+        default="X-User-Id",
+        description="Header identifying the user, set by the UI or the gateway. Turns without it are not rate-limited.",
+    )
+    ADMISSION_USER_ADDRESS_FALLBACK: bool = Field(
+        default=False,
+        description="Rate-limit turns without the user header by client address, only if clients connect directly.",
+    )
+    ADMISSION_MAX_TRACKED_USERS: int = 10_000
 
 
+    # --- Characters Configuration ---
+    CHARACTERS_CONFIG_PATH: str | None = Field(
+        default=None, description="JSON file with characters added to the built-in ones."
+    )
+    CHARACTERS_RELOAD_INTERVAL_SECONDS: float = Field(
+        default=0.0, description="How often the character file is checked for changes; 0 disables it."
+    )
+
     # --- Agents Configuration ---
-    TOTAL_MESSAGES_SUMMARY_TRIGGER: int = 30
-    TOTAL_MESSAGES_AFTER_SUMMARY: int = 5
+    SUMMARY_TRIGGER_TOKENS: int = Field(
+        default=2000, description="History size, in tokens, above which a thread is summarized."
+    )
+    SUMMARY_KEEP_RECENT_TOKENS: int = Field(
+        default=600, description="Most recent history, in tokens, left verbatim after a summary."
+    )
+    SUMMARY_PROMPT_TOKEN_BUDGET: int = Field(
+        default=6000, description="Maximum size of the existing summary plus the messages folded into it."
+    )
+    SUMMARY_WORKERS: int = Field(
+        default=2, description="Background tasks summarizing long threads off the response path."
+    )
+    SUMMARY_QUEUE_SIZE: int = 1000
+    SUMMARY_SHUTDOWN_TIMEOUT_SECONDS: float = 10.0
 
 
     # --- Comet ML & Opik Configuration ---
@@ -28,6 +141,23 @@ class Settings(BaseSettings):
         default="mpdagents_course",
         description="Project name for Comet ML and Opik tracking.",
     )
+    TRACING_SAMPLE_RATE: float = Field(
+        default=1.0, description="Share of conversation turns traced to Opik, between 0 and 1."
+    )
+    TRACING_SAMPLE_RATES: dict[str, float] = Field(
+        default_factory=dict,
+        description="Sample rates per endpoint ('chat', 'chat_stream', 'ws_chat'), overriding TRACING_SAMPLE_RATE.",
+    )
+    TRACING_QUEUE_SIZE: int = Field(
+        default=1000, description="Finished traces waiting to be sent; new traces are dropped when full."
+    )
+    TRACING_BATCH_SIZE: int = Field(default=50, description="Traces sent to Opik per flush.")
+    TRACING_FLUSH_INTERVAL_SECONDS: float = Field(
+        default=1.0, description="Longest time a finished trace waits for its batch."
+    )
+    TRACING_SHUTDOWN_TIMEOUT_SECONDS: float = Field(
+        default=10.0, description="Time given to queued traces to be sent on shutdown."
+    )
 
     # # --- MongoDB Configuration ---
     # MONGO_URI: str = Field(
@@ -44,12 +174,110 @@ class Settings(BaseSettings):
     MONGO_STATE_CHECKPOINT_COLLECTION: str 
     MONGO_STATE_WRITES_COLLECTION: str
 
+    # Connection pool shared by the process-wide checkpointer.
+    MONGO_MAX_POOL_SIZE: int = Field(
+        default=50, description="Maximum number of pooled MongoDB connections."
+    )
+    MONGO_MIN_POOL_SIZE: int = Field(
+        default=5, description="Connections kept warm to avoid per-turn handshakes."
+    )
+    MONGO_MAX_IDLE_TIME_MS: int = 5 * 60 * 1000
+    MONGO_CONNECT_TIMEOUT_MS: int = 10_000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 10_000
+
 
 
     # # --- RAG PineCone Configurations ---
     # Initialize the OpenAI client
-    PINECONE_API_KEY : str
-    PINECONE_INDEX_NAME : str 
+    PINECONE_API_KEY : str | None = None
+    PINECONE_INDEX_NAME : str | None = None
+
+    # --- Response Cache Configuration ---
+    RESPONSE_CACHE_ENABLED: bool = Field(
+        default=False, description="Serve repeated opening turns from an in-memory reply cache."
+    )
+    RESPONSE_CACHE_MAX_ENTRIES: int = 2048
+    RESPONSE_CACHE_TTL_SECONDS: float | None = 60 * 60
+    RESPONSE_CACHE_MAX_HISTORY_MESSAGES: int = Field(
+        default=2, description="Turns with more earlier messages than this are never cached."
+    )
+    RESPONSE_CACHE_EXCLUDED_CHARACTERS: list[str] = Field(
+        default_factory=list, description="Character ids that always get a fresh reply."
+    )
+
+    # --- Vector Store Configuration ---
+    VECTOR_STORE_BACKEND: Literal["pinecone", "local"] = Field(
+        default="pinecone",
+        description="'local' serves retrieval from a memory-mapped matrix on disk instead of Pinecone.",
+    )
+    LOCAL_VECTOR_STORE_PATH: str = "vector_store"
+    LOCAL_VECTOR_STORE_IVF_MIN_VECTORS: int = 50_000
+    LOCAL_VECTOR_STORE_IVF_PROBES: int = 8
+
+    # --- Ingestion Configuration ---
+    INGESTION_CHUNK_SIZE: int = 1500
+    INGESTION_CHUNK_OVERLAP: int = 150
+    INGESTION_BATCH_SIZE: int = Field(
+        default=100, description="Chunks per embedding request and per vector store upsert."
+    )
+    INGESTION_CONCURRENCY: int = 4
+    INGESTION_MAX_ATTEMPTS: int = 6
+    INGESTION_MANIFEST_PATH: str = Field(
+        default="ingestion_manifests",
+        description="Directory of the per-namespace manifests of the chunk ids each source produced.",
+    )
+
+    # --- RAG Retrieval Configuration ---
+    RAG_EMBEDDING_MODEL: str = "text-embedding-3-small"
+    RAG_HTTP_MAX_CONNECTIONS: int = Field(
+        default=100, description="Connection pool size for the embedding and vector DB clients."
+    )
+    RAG_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    RAG_HTTP_KEEPALIVE_EXPIRY_SECONDS: float = 60.0
+    RAG_HTTP_TIMEOUT_SECONDS: float = 10.0
+    RAG_GATE_ENABLED: bool = Field(
+        default=True, description="Skip retrieval for greetings, thanks and very short messages."
+    )
+    RAG_GATE_MIN_WORDS: int = 3
+    RAG_TOP_K: int = 3
+    RAG_DEFAULT_NAMESPACE: str = "motion"
+    RAG_MAX_NAMESPACES: int = 3
+    RAG_LATENCY_BUDGET_SECONDS: float = Field(
+        default=1.0,
+        description="Time allowed for the namespace queries of a turn; slower namespaces are dropped.",
+    )
+    RAG_MIN_SCORE: float = Field(
+        default=0.3, description="RAG chunks scoring below this are not sent to the model."
+    )
+    RAG_DUPLICATE_OVERLAP: float = 0.8
+
+    # --- Context Budget Configuration ---
+    CONTEXT_TOKEN_BUDGET: int = Field(
+        default=3000,
+        description="Tokens shared by the summary, the RAG context and the message history of a turn.",
+    )
+    CONTEXT_MAX_SUMMARY_TOKENS: int = 500
+    CONTEXT_MAX_CHUNK_TOKENS: int = 300
+
+    # --- Embedding Cache Configuration ---
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_MAX_SIZE: int = 10_000
+    EMBEDDING_CACHE_TTL_SECONDS: float | None = 7 * 24 * 60 * 60
+    EMBEDDING_CACHE_BACKEND: Literal["memory", "disk", "mongo"] = Field(
+        default="memory",
+        description="Persistent tier behind the in-memory LRU. 'memory' disables it.",
+    )
+    EMBEDDING_CACHE_DISK_PATH: str = "embedding_cache.sqlite3"
+    EMBEDDING_CACHE_COLLECTION: str = "embedding_cache"
+
+    # --- Retrieval Cache Configuration ---
+    RETRIEVAL_CACHE_ENABLED: bool = True
+    RETRIEVAL_CACHE_SIMILARITY_THRESHOLD: float = Field(
+        default=0.95,
+        description="Minimum cosine similarity between query embeddings to reuse cached results.",
+    )
+    RETRIEVAL_CACHE_MAX_ENTRIES: int = 1024
+    RETRIEVAL_CACHE_TTL_SECONDS: float | None = 60 * 60
 
 
 settings = Settings()
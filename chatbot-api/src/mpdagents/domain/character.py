@@ -10,6 +10,8 @@ class Character(BaseModel):
         perspective (str): Description of the character's theoretical views
             about AI.
         style (str): Description of the character's talking style.
+        knowledge_namespaces (list[str]): RAG namespaces the character draws
+            its knowledge from.
     """
 
     id: str = Field(description="Unique identifier for the character")
@@ -18,6 +20,10 @@ class Character(BaseModel):
         description="Description of the character's theoretical views about AI"
     )
     style: str = Field(description="Description of the character's talking style")
+    knowledge_namespaces: list[str] = Field(
+        default_factory=list,
+        description="RAG namespaces the character draws its knowledge from",
+    )
 
     def __str__(self) -> str:
         return f"Character(id={self.id}, name={self.name}, perspective={self.perspective}, style={self.style})"
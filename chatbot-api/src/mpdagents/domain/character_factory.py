@@ -49,6 +49,15 @@ CHARACTER_STYLES = {
     Example: 'Your query is ambiguously phrased. Assuming you are asking for the atomic weight of Beryllium, the answer is as follows: 9.012u.'
     """,
 }
+
+# RAG namespaces searched for each character, on top of the ones matched from the query
+CHARACTER_KNOWLEDGE_NAMESPACES = {
+    "motivator": ["motion"],
+    "comedian": ["motion"],
+    "philosopher": ["motion"],
+    "intelligent": ["motion"],
+}
+
 AVAILABLE_CHARACTERS = list(CHARACTER_NAMES.keys())
 
 
@@ -75,7 +84,8 @@ class CharacterFactory:
             id=id_lower,
             name=CHARACTER_NAMES[id_lower],
             perspective=CHARACTER_PERSPECTIVES[id_lower],
-            style=CHARACTER_STYLES[id_lower]
+            style=CHARACTER_STYLES[id_lower],
+            knowledge_namespaces=CHARACTER_KNOWLEDGE_NAMESPACES.get(id_lower, []),
         )
     
 
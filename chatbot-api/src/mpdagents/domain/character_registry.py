@@ -0,0 +1,192 @@
+import json
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+from typing import Mapping
+
+from langchain_core.prompts.string import jinja2_formatter
+
+from mpdagents.config import settings
+from mpdagents.domain.character_factory import (
+    CHARACTER_KNOWLEDGE_NAMESPACES,
+    CHARACTER_NAMES,
+    CHARACTER_PERSPECTIVES,
+    CHARACTER_STYLES,
+)
+from mpdagents.domain.prompts import CHATBOT_CHARACTER_CARD
+
+
+@dataclass(frozen=True, slots=True)
+class CharacterProfile:
+    """An immutable character, with its persona system prompt rendered once.
+
+    Args:
+        id (str): Unique identifier for the character.
+        name (str): Name of the character.
+        perspective (str): Description of the character's views.
+        style (str): Description of the character's talking style.
+        knowledge_namespaces (tuple[str, ...]): RAG namespaces of the character.
+        system_prompt (str): The character card rendered for this character.
+    """
+
+    id: str
+    name: str
+    perspective: str
+    style: str
+    knowledge_namespaces: tuple[str, ...]
+    system_prompt: str
+
+
+def render_character_card(name: str, perspective: str, style: str) -> str:
+    """Render the character card exactly like the conversation chain's jinja2 template does."""
+
+    return jinja2_formatter(
+        CHATBOT_CHARACTER_CARD.prompt,
+        character_name=name,
+        character_perspective=perspective,
+        character_style=style,
+    )
+
+
+def _build_profile(id: str, name: str, perspective: str, style: str, knowledge_namespaces=()) -> CharacterProfile:
+    return CharacterProfile(
+        id=id.lower(),
+        name=name,
+        perspective=perspective,
+        style=style,
+        knowledge_namespaces=tuple(knowledge_namespaces),
+        system_prompt=render_character_card(name, perspective, style),
+    )
+
+
+def load_character_file(path: Path) -> list[CharacterProfile]:
+    """Load extra characters from a JSON file.
+
+    The file holds ``{"characters": [{"id", "name", "perspective", "style",
+    "knowledge_namespaces"}, ...]}``; ``knowledge_namespaces`` is optional.
+
+    Raises:
+        ValueError: If the file is not valid JSON or a character is incomplete.
+    """
+
+    try:
+        entries = json.loads(path.read_text(encoding="utf-8")).get("characters", [])
+    except (OSError, json.JSONDecodeError, AttributeError) as e:
+        raise ValueError(f"Can't read the character file '{path}': {e}") from e
+
+    profiles = []
+    for entry in entries:
+        missing = [field for field in ("id", "name", "perspective", "style") if not entry.get(field)]
+        if missing:
+            raise ValueError(f"Character {entry.get('id', '?')!r} in '{path}' is missing {missing}")
+        profiles.append(
+            _build_profile(
+                entry["id"],
+                entry["name"],
+                entry["perspective"],
+                entry["style"],
+                entry.get("knowledge_namespaces", ()),
+            )
+        )
+
+    return profiles
+
+
+class CharacterRegistry:
+    """Read-only lookup of every available character, built once.
+
+    The built-in characters come from `character_factory`; characters from
+    ``config_path`` are added on top and replace built-ins with the same id.
+    A registry is never mutated: reloading builds a new one and swaps it in.
+
+    Args:
+        config_path (str | None, optional): JSON file with extra characters.
+    """
+
+    __slots__ = ("config_path", "config_mtime", "__characters")
+
+    def __init__(self, config_path: str | None = settings.CHARACTERS_CONFIG_PATH) -> None:
+        self.config_path = Path(config_path) if config_path else None
+        self.config_mtime: float | None = None
+
+        characters = {
+            id: _build_profile(
+                id,
+                CHARACTER_NAMES[id],
+                CHARACTER_PERSPECTIVES[id],
+                CHARACTER_STYLES[id],
+                CHARACTER_KNOWLEDGE_NAMESPACES.get(id, ()),
+            )
+            for id in CHARACTER_NAMES
+        }
+
+        if self.config_path is not None and self.config_path.exists():
+            self.config_mtime = self.config_path.stat().st_mtime
+            characters.update({profile.id: profile for profile in load_character_file(self.config_path)})
+
+        self.__characters: Mapping[str, CharacterProfile] = MappingProxyType(characters)
+
+    @property
+    def ids(self) -> list[str]:
+        return list(self.__characters)
+
+    def get(self, id: str | None) -> CharacterProfile:
+        """Return a character by id, case-insensitively.
+
+        Raises:
+            ValueError: If the character does not exist.
+        """
+
+        profile = self.__characters.get((id or "").lower())
+        if profile is None:
+            raise ValueError(f"Character with id '{id}' does not exist. Available characters: {self.ids}")
+        return profile
+
+    def is_stale(self) -> bool:
+        """True if the character file changed since this registry was built."""
+
+        if self.config_path is None:
+            return False
+        mtime = self.config_path.stat().st_mtime if self.config_path.exists() else None
+        return mtime != self.config_mtime
+
+
+_registry: CharacterRegistry | None = None
+_registry_lock = threading.Lock()
+
+
+def get_character_registry() -> CharacterRegistry:
+    """Return the process-wide registry, building it on first use."""
+
+    global _registry
+
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = CharacterRegistry()
+
+    return _registry
+
+
+def reload_character_registry(force: bool = False) -> CharacterRegistry:
+    """Rebuild the registry if the character file changed, and swap it in.
+
+    Requests already holding the previous registry keep using it. If the file
+    is invalid the previous registry stays in place.
+
+    Raises:
+        ValueError: If the character file is invalid.
+    """
+
+    global _registry
+
+    current = get_character_registry()
+    if not force and not current.is_stale():
+        return current
+
+    registry = CharacterRegistry(str(current.config_path) if current.config_path else None)
+    with _registry_lock:
+        _registry = registry
+
+    return registry
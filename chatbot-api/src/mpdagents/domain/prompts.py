@@ -1,3 +1,7 @@
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
 import opik
 
 
@@ -5,22 +9,62 @@ import opik
 class Prompt:
     def __init__(self, name: str, prompt: str) -> None:
         self.name = name
+        self.__template = prompt
+        # Versioning with Opik is a network call, so it is deferred to `resolve`
+        # instead of running when this module is imported.
+        self.__prompt: opik.Prompt | str | None = None
+
+    def resolve(self) -> None:
+        """Version the prompt with Opik. A network call that may retry for a while, call it from a thread."""
+
+        if self.__prompt is not None:
+            return
 
         try:
-            self.__prompt = opik.Prompt(name=name, prompt=prompt)
+            self.__prompt = opik.Prompt(name=self.name, prompt=self.__template)
         except Exception:
             # logger.warning(
             #     "Can't use Opik to version the prompt (probably due to missing or invalid credentials). Falling back to local prompt. The prompt is not versioned, but it's still usable."
             # )
 
-            self.__prompt = prompt
+            self.__prompt = self.__template
+
+    def __resolve(self) -> opik.Prompt | str:
+        if self.__prompt is None:
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                # Off the event loop, e.g. in a script or a worker thread, it may block
+                self.resolve()
+            else:
+                # On the event loop the Opik call would stall every request, so the
+                # local template is used until `resolve_prompts` has run
+                return self.__template
+
+        return self.__prompt
 
     @property
     def prompt(self) -> str:
-        if isinstance(self.__prompt, opik.Prompt):
-            return self.__prompt.prompt
+        prompt = self.__resolve()
+        if isinstance(prompt, opik.Prompt):
+            return prompt.prompt
         else:
-            return self.__prompt
+            return prompt
+
+    @property
+    def version(self) -> str:
+        """Opik commit of the prompt, or a hash of the local template if it is not versioned.
+
+        The prompt is registered from the template in code and resolved once
+        per process, so the version changes with the deployed template, not
+        with versions edited in Opik while the process runs. On the event loop
+        the local hash is used until the prompt is resolved.
+        """
+
+        prompt = self.__resolve()
+        if isinstance(prompt, opik.Prompt) and prompt.commit:
+            return prompt.commit
+        return hashlib.sha256(self.__template.encode("utf-8")).hexdigest()[:8]
 
     def __str__(self) -> str:
         return self.prompt
@@ -40,16 +84,32 @@ You must strictly embody this personality. Your response must be short, fun, and
 **Personality Profile:**
 - **Perspective:** {{character_perspective}}
 - **Style:** {{character_style}}
+"""
+# Only depends on the character, so it is a byte-identical prefix that OpenAI can cache
+CHATBOT_CHARACTER_CARD = Prompt(
+    name="chatbot_character_card",
+    prompt=__CHATBOT_CHARACTER_CARD,
+)
 
-**Summary of messages till now:**
-{{summary}}
+# --- Conversation Context ---
+# Sent after the character card, since they change during a thread
 
+__CONVERSATION_SUMMARY_CONTEXT = """**Summary of messages till now:**
+{{summary}}
+"""
 
+CONVERSATION_SUMMARY_CONTEXT = Prompt(
+    name="conversation_summary_context",
+    prompt=__CONVERSATION_SUMMARY_CONTEXT,
+)
 
+__RAG_KNOWLEDGE_CONTEXT = """**Relevant knowledge (use it if it helps, stay in character):**
+{{context}}
 """
-CHATBOT_CHARACTER_CARD = Prompt(
-    name="chatbot_character_card",
-    prompt=__CHATBOT_CHARACTER_CARD,
+
+RAG_KNOWLEDGE_CONTEXT = Prompt(
+    name="rag_knowledge_context",
+    prompt=__RAG_KNOWLEDGE_CONTEXT,
 )
 # --- Summary ---
 
@@ -72,3 +132,18 @@ EXTEND_SUMMARY_PROMPT = Prompt(
     name="extend_summary_prompt",
     prompt=__EXTEND_SUMMARY_PROMPT,
 )
+
+PROMPTS = (
+    CHATBOT_CHARACTER_CARD,
+    CONVERSATION_SUMMARY_CONTEXT,
+    RAG_KNOWLEDGE_CONTEXT,
+    SUMMARY_PROMPT,
+    EXTEND_SUMMARY_PROMPT,
+)
+
+
+def resolve_prompts() -> None:
+    """Version every prompt with Opik, concurrently. Blocks, call it from a thread."""
+
+    with ThreadPoolExecutor(max_workers=len(PROMPTS)) as executor:
+        list(executor.map(Prompt.resolve, PROMPTS))
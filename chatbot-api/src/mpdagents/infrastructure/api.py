@@ -1,37 +1,143 @@
-from contextlib import asynccontextmanager
+import asyncio
+import math
+from contextlib import aclosing, asynccontextmanager
 
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect, status
 from fastapi.middleware.cors import CORSMiddleware
-from opik.integrations.langchain import OpikTracer
+from fastapi.requests import HTTPConnection
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
+from starlette.background import BackgroundTask
 
-from mpdagents.domain.character_factory import CharacterFactory
+from mpdagents.domain.character_registry import (
+    CharacterRegistry,
+    get_character_registry,
+    reload_character_registry,
+)
+from mpdagents.domain.prompts import resolve_prompts
+from mpdagents.application.conversation_service.admission import (
+    AdmissionRejected,
+    admission_controller,
+)
 from mpdagents.application.conversation_service.generate_response import (
+    ConversationSession,
+    close_conversation_graph,
+    conversation_graph_scope,
+    conversation_thread_id,
     get_response,
     get_streaming_response,
+    init_conversation_graph,
+)
+from mpdagents.application.conversation_service.response_cache import response_cache
+from mpdagents.application.conversation_service.summarization import (
+    close_conversation_summarizer,
+    init_conversation_summarizer,
 )
+from mpdagents.application.conversation_service.workflow.chains import close_openai_http_client
+from mpdagents.application.conversation_service.workflow.context_packer import get_context_packer
+from mpdagents.application.conversation_service.workflow.prompt_usage import prompt_usage_stats
 from mpdagents.application.conversation_service.reset_conversation import (
     reset_conversation_state,
 )
+from mpdagents.application.rag.rag import (
+    close_rag_retriever,
+    get_rag_cache_stats,
+    init_rag_retriever,
+    invalidate_rag_cache,
+)
 # from mpdagents.domain.character_factory import characterFactory
 
-from .opik_utils import configure
+from mpdagents.config import settings
+
+from .metrics import StatsCollector, register_stats_collector, render_metrics
+from .mongodb.checkpointer import pooled_checkpointer
+from .streaming import STREAM_FORMATS, coalesce_chunks, format_sse, send_stream
+from .tracing import close_tracing, get_tracing_stats, init_tracing
 
-configure()
+
+async def watch_character_file() -> None:
+    """Reload the character registry whenever the character file changes."""
+
+    while True:
+        await asyncio.sleep(settings.CHARACTERS_RELOAD_INTERVAL_SECONDS)
+        try:
+            await asyncio.to_thread(reload_character_registry)
+        except ValueError as e:
+            print(f"Keeping the current characters, the character file is invalid: {e}")
+
+
+def set_up_opik(graph) -> None:
+    """Configure Opik, then create the tracer, version every prompt and render the personas.
+
+    Blocks on the Opik server, call it from a thread. The order matters: the
+    tracer and the prompts use the Opik client configured first, and the
+    character registry is only built once the character card no longer needs
+    Opik, so requests never wait on the registry lock for it.
+    """
+    init_tracing(graph)
+    resolve_prompts()
+    get_character_registry()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Handles startup and shutdown events for the API."""
-    # Startup code (if any) goes here
-    yield
-    # Shutdown code goes here
-    opik_tracer = OpikTracer()
-    opik_tracer.flush()
+    """Handles startup and shutdown events for the API.
+
+    External clients are set up here rather than at import time, so importing
+    this module stays fast and never touches the network. With
+    ``STARTUP_MODE=lazy`` the app is ready immediately: Opik and the tokenizer are
+    set up in the background and the RAG retriever connects on the first query.
+    """
+    # One pooled checkpointer and compiled graph shared by /chat and /ws/chat.
+    # Motor connects lazily, so this does not block startup.
+    async with pooled_checkpointer() as checkpointer:
+        graph = init_conversation_graph(checkpointer)
+        init_conversation_summarizer(graph)
+
+        if settings.STARTUP_MODE == "eager":
+            await asyncio.to_thread(set_up_opik, graph)
+            # Loading the tokenizer may download its vocabulary, keep it off the event loop
+            await asyncio.to_thread(get_context_packer)
+            # Validates the Pinecone index once and keeps its connections warm
+            await init_rag_retriever()
+            background_setup = []
+        else:
+            background_setup = [
+                # Until the prompts are resolved, requests use their local templates
+                asyncio.create_task(asyncio.to_thread(set_up_opik, graph)),
+                asyncio.create_task(asyncio.to_thread(get_context_packer)),
+            ]
+
+        if settings.CHARACTERS_CONFIG_PATH and settings.CHARACTERS_RELOAD_INTERVAL_SECONDS > 0:
+            background_setup.append(asyncio.create_task(watch_character_file()))
+
+        try:
+            yield
+        finally:
+            for task in background_setup:
+                if not task.done():
+                    task.cancel()
+            await close_conversation_summarizer()
+            await close_rag_retriever()
+            close_conversation_graph()
+            await close_openai_http_client()
+    # Sends the traces still queued, this blocks on the Opik client
+    await asyncio.to_thread(close_tracing)
 
 
 app = FastAPI(lifespan=lifespan)
 
+register_stats_collector(
+    StatsCollector(
+        cache_stats=lambda: {
+            **(get_rag_cache_stats() or {}),
+            "response": response_cache.stats() if response_cache is not None else None,
+        },
+        prompt_stats=prompt_usage_stats.stats,
+        tracing_stats=get_tracing_stats,
+    )
+)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -49,90 +155,267 @@ class ChatMessage(BaseModel):
     character_id: str | None = None
     new_thread: bool = False
 
+def admission_user(connection: HTTPConnection) -> str | None:
+    """Rate-limiting key of a client: the user header, or its address if opted in.
+
+    Without the header the client address is usually that of the UI server or
+    a proxy, shared by all of its users, so it is not used by default.
+    """
+    user = connection.headers.get(settings.ADMISSION_USER_HEADER)
+    if user:
+        return user
+    if settings.ADMISSION_USER_ADDRESS_FALLBACK and connection.client:
+        return connection.client.host
+    return None
+
+
+def admission_error(rejection: AdmissionRejected) -> HTTPException:
+    """429 for a rate-limited client or a busy thread, 503 when the server is overloaded."""
+    return HTTPException(
+        status_code=(
+            status.HTTP_503_SERVICE_UNAVAILABLE
+            if rejection.reason == "overloaded"
+            else status.HTTP_429_TOO_MANY_REQUESTS
+        ),
+        detail=rejection.message,
+        headers={"Retry-After": str(math.ceil(rejection.retry_after))},
+    )
+
+
 @app.post("/chat")
-async def chat(chat_message: ChatMessage):
+async def chat(chat_message: ChatMessage, request: Request):
     try:
-        character_factory = CharacterFactory()
-        character = character_factory.get_character(chat_message.character_id)
+        async with admission_controller.admit(
+            admission_user(request),
+            conversation_thread_id(chat_message.thread_id, chat_message.character_id),
+        ):
+            character = get_character_registry().get(chat_message.character_id)
+
+            response, *_ = await get_response(  # Fixed the function call
+                messages=chat_message.message,
+                thread_id=chat_message.thread_id,
+                character_id=chat_message.character_id,
+                character_name=character.name,
+                character_style=character.style,
+                character_perspective=character.perspective,
+                character_prompt=character.system_prompt,
+                new_thread=chat_message.new_thread,
+            )
         
-        response, *_ = await get_response(  # Fixed the function call
+        return {
+            "response": response,
+            "thread_id": chat_message.thread_id,
+            "character_id": chat_message.character_id
+        }
+    except AdmissionRejected as e:
+        raise admission_error(e)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/chat/stream")
+async def chat_stream(chat_message: ChatMessage, request: Request):
+    """Streams the reply as Server-Sent Events over plain HTTP.
+
+    Emits ``token`` events with ``{"chunk": ...}``, coalesced like the WebSocket
+    frames, then a ``done`` event with the thread and character ids, or an
+    ``error`` event. When the client disconnects the graph run is cancelled,
+    which aborts the upstream LLM call.
+
+    Raises:
+        HTTPException: If the character does not exist (400), or the turn is not
+            admitted (429 or 503, with a Retry-After header).
+    """
+    try:
+        character = get_character_registry().get(chat_message.character_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        # Held until the stream ends, released by whichever of the two runs first
+        ticket = await admission_controller.acquire(
+            admission_user(request),
+            conversation_thread_id(chat_message.thread_id, chat_message.character_id),
+        )
+    except AdmissionRejected as e:
+        raise admission_error(e)
+
+    async def event_stream():
+        chunks = get_streaming_response(
             messages=chat_message.message,
             thread_id=chat_message.thread_id,
             character_id=chat_message.character_id,
             character_name=character.name,
             character_style=character.style,
             character_perspective=character.perspective,
+            character_prompt=character.system_prompt,
             new_thread=chat_message.new_thread,
         )
-        
-        return {
-            "response": response,
-            "thread_id": chat_message.thread_id,
-            "character_id": chat_message.character_id
-        }
-    except Exception as e:
-        opik_tracer = OpikTracer()
-        opik_tracer.flush()
-        raise HTTPException(status_code=500, detail=str(e))
+        try:
+            # Closing the frames cancels the graph run, whichever way the stream ends
+            async with aclosing(coalesce_chunks(chunks)) as frames:
+                async for frame in frames:
+                    if await request.is_disconnected():
+                        print("Client disconnected from the SSE stream, cancelling the response")
+                        return
+                    yield format_sse("token", {"chunk": frame})
+            yield format_sse(
+                "done", {"thread_id": chat_message.thread_id, "character_id": chat_message.character_id}
+            )
+        except Exception as e:
+            yield format_sse("error", {"error": str(e)})
+        finally:
+            ticket.release()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Keeps proxies and load balancers from buffering the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Also runs if the client left before the stream started
+        background=BackgroundTask(ticket.release),
+    )
+
 
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
+
+@app.get("/cache-stats")
+def cache_stats():
+    """Returns hit/miss counters of the in-process caches and OpenAI prompt caching."""
+    return {
+        "rag": get_rag_cache_stats(),
+        "response": response_cache.stats() if response_cache is not None else None,
+        "prompt": prompt_usage_stats.stats(),
+    }
+
+
+@app.get("/metrics")
+def metrics():
+    """Exposes per-stage latency, token usage and cache hit ratios for Prometheus."""
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+
+@app.post("/rag/invalidate-cache")
+def invalidate_retrieval_cache(namespace: str | None = None):
+    """Drops cached retrieval results and the vector store's cached copy of a namespace,
+    e.g. after it was re-ingested, so the next query reads the new data.
+
+    Args:
+        namespace: Namespace to invalidate. All namespaces when omitted.
+    """
+    invalidate_rag_cache(namespace)
+    return {"status": "success", "namespace": namespace}
+
+@app.post("/characters/reload")
+async def reload_characters():
+    """Reloads the character file, so new or edited personas are served without a restart.
+
+    Raises:
+        HTTPException: If the character file is invalid. The current characters are kept.
+    """
+    try:
+        registry = await asyncio.to_thread(reload_character_registry, True)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"status": "success", "characters": registry.ids}
+
 @app.websocket("/ws/chat")
 async def websocket_chat(websocket: WebSocket):
+    """Streams replies over a WebSocket.
+
+    Each message is ``{"message", "character_id", "thread_id"}`` plus the optional
+    ``"stream_format"`` (``"json"`` for ``{"chunk": ...}`` frames, ``"binary"`` for
+    UTF-8 binary frames) and ``"include_response"`` to repeat the full reply in the
+    final frame. Tokens are coalesced into frames by size and time. A message that
+    is not admitted gets ``{"error", "reason", "retry_after"}`` and the socket stays open.
+    """
     await websocket.accept()
+    user = admission_user(websocket)
     
     try:
-        while True:
-            data = await websocket.receive_json()
-            
-            # Validate required fields
-            if "message" not in data or "character_id" not in data:
-                await websocket.send_json({
-                    "error": "Invalid message format. Required fields: 'message' and 'character_id'"
-                })
-                continue
-            
-            try:
-                character_factory = CharacterFactory()
-                character = character_factory.get_character(data["character_id"])
-                
-                # Extract thread_id from data, not from undefined chat_message
-                thread_id = data.get("thread_id")
-                
-                # Use streaming response
-                response_stream = get_streaming_response(
-                    messages=data["message"],
-                    character_id=data["character_id"],
-                    thread_id=thread_id,  # Fixed: use data["thread_id"] instead of chat_message.thread_id
-                    character_name=character.name,
-                    character_perspective=character.perspective,
-                    character_style=character.style,
-                    new_thread=data.get("new_thread", False),  # Added new_thread parameter if needed
-                )
-                
-                # Send initial message to indicate streaming has started
-                await websocket.send_json({"streaming": True})
-                
-                # Stream each chunk of the response
-                full_response = ""
-                async for chunk in response_stream:
-                    full_response += chunk
-                    await websocket.send_json({"chunk": chunk})
+        # The graph and the session are bound once per socket and reused for every
+        # message, until the client switches thread or character.
+        async with conversation_graph_scope() as graph:
+            session: ConversationSession | None = None
+            # A reloaded registry rebinds the session to the updated persona
+            session_registry: CharacterRegistry | None = None
+
+            while True:
+                data = await websocket.receive_json()
                 
-                # Send final response
-                await websocket.send_json({
-                    "response": full_response, 
-                    "streaming": False,
-                    "thread_id": thread_id,  # Include thread_id in response
-                    "character_id": data["character_id"]  # Include character_id in response
-                })
+                # Validate required fields
+                if "message" not in data or "character_id" not in data:
+                    await websocket.send_json({
+                        "error": "Invalid message format. Required fields: 'message' and 'character_id'"
+                    })
+                    continue
+
+                stream_format = data.get("stream_format", "json")
+                if stream_format not in STREAM_FORMATS:
+                    await websocket.send_json({
+                        "error": f"Invalid stream_format '{stream_format}'. Supported formats: {list(STREAM_FORMATS)}"
+                    })
+                    continue
                 
-            except Exception as e:
-                opik_tracer = OpikTracer()
-                opik_tracer.flush()
-                await websocket.send_json({"error": str(e)})
+                try:
+                    registry = get_character_registry()
+                    if (
+                        session is None
+                        or session_registry is not registry
+                        or session.client_thread_id != data.get("thread_id")
+                        or session.character_id != data["character_id"]
+                    ):
+                        character = registry.get(data["character_id"])
+                        session = ConversationSession(
+                            graph,
+                            data.get("thread_id"),
+                            character_id=data["character_id"],
+                            character_name=character.name,
+                            character_perspective=character.perspective,
+                            character_style=character.style,
+                            character_prompt=character.system_prompt,
+                            endpoint="ws_chat",
+                        )
+                        session_registry = registry
+                    
+                    async with admission_controller.admit(user, session.thread_id):
+                        # Send initial message to indicate streaming has started
+                        await websocket.send_json({"streaming": True})
+
+                        # Stream the response as coalesced frames, the full text is only kept if asked for
+                        include_response = bool(data.get("include_response", False))
+                        full_response = await send_stream(
+                            websocket,
+                            session.stream(data["message"]),
+                            stream_format=stream_format,
+                            keep_text=include_response,
+                        )
+                    
+                    # Send final response
+                    final_message = {
+                        "streaming": False,
+                        "thread_id": session.client_thread_id,  # Include thread_id in response
+                        "character_id": session.character_id  # Include character_id in response
+                    }
+                    if include_response:
+                        final_message["response"] = full_response
+                    await websocket.send_json(final_message)
+                    
+                except WebSocketDisconnect:
+                    raise
+                except AdmissionRejected as e:
+                    await websocket.send_json(
+                        {"error": e.message, "reason": e.reason, "retry_after": math.ceil(e.retry_after)}
+                    )
+                except asyncio.TimeoutError:
+                    print("Closing WebSocket, the client stopped reading its stream")
+                    await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                    return
+                except Exception as e:
+                    await websocket.send_json({"error": str(e)})
                 
     except WebSocketDisconnect:
         print("Client disconnected from WebSocket")  # Optional: log disconnection
@@ -0,0 +1,236 @@
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Awaitable, Callable, Iterator, TypeVar
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.registry import Collector
+
+T = TypeVar("T")
+
+# From a cache hit to a long generation
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+NODE_DURATION = Histogram(
+    "mpd_graph_node_duration_seconds",
+    "Time spent in a LangGraph node, summarization included.",
+    ["node", "character_id"],
+    buckets=LATENCY_BUCKETS,
+)
+EXTERNAL_CALL_DURATION = Histogram(
+    "mpd_external_call_duration_seconds",
+    "Latency of calls to OpenAI embeddings, the vector store and the checkpointer.",
+    ["operation", "outcome"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_TIME_TO_FIRST_TOKEN = Histogram(
+    "mpd_llm_time_to_first_token_seconds",
+    "Time from a streamed chat model call to its first token.",
+    ["model", "character_id"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_GENERATION_DURATION = Histogram(
+    "mpd_llm_generation_duration_seconds",
+    "Duration of a chat model call.",
+    ["model", "character_id"],
+    buckets=LATENCY_BUCKETS,
+)
+TURN_DURATION = Histogram(
+    "mpd_turn_duration_seconds",
+    "Duration of a conversation turn, from the request to the last chunk.",
+    ["endpoint", "character_id"],
+    buckets=LATENCY_BUCKETS,
+)
+TURN_TIME_TO_FIRST_CHUNK = Histogram(
+    "mpd_turn_time_to_first_chunk_seconds",
+    "Time from a streamed request to the first chunk sent to the client.",
+    ["endpoint", "character_id"],
+    buckets=LATENCY_BUCKETS,
+)
+
+LLM_QUEUE_WAIT = Histogram(
+    "mpd_llm_queue_wait_seconds",
+    "Time a chat model call waited for request and token budget.",
+    ["model", "priority"],
+    buckets=LATENCY_BUCKETS,
+)
+LLM_RETRIES = Counter("mpd_llm_retries", "Chat model calls retried, by error.", ["model", "error"])
+LLM_COALESCED = Counter(
+    "mpd_llm_coalesced_calls", "Chat model calls served by an identical call already in flight.", ["model"]
+)
+ADMISSION_IN_FLIGHT = Gauge("mpd_admission_in_flight_turns", "Conversation turns running.")
+ADMISSION_QUEUED = Gauge("mpd_admission_queued_turns", "Conversation turns waiting for a free slot.")
+ADMISSION_REJECTIONS = Counter(
+    "mpd_admission_rejections",
+    "Conversation turns turned away, by reason: rate_limited, thread_busy, overloaded.",
+    ["reason"],
+)
+
+
+def character_label(character_id: str | None) -> str:
+    return (character_id or "unknown").lower()
+
+
+@contextmanager
+def observe_call(operation: str) -> Iterator[None]:
+    """Time a call to an external service, labelled with whether it raised."""
+
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        EXTERNAL_CALL_DURATION.labels(operation, outcome).observe(time.perf_counter() - start)
+
+
+def timed_node(name: str, node: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """Wrap an async LangGraph node so its duration is recorded per character.
+
+    The wrapper keeps the node's signature, so LangGraph still passes the
+    config to nodes that take one.
+    """
+
+    @wraps(node)
+    async def wrapper(state, *args, **kwargs) -> T:
+        start = time.perf_counter()
+        try:
+            return await node(state, *args, **kwargs)
+        finally:
+            NODE_DURATION.labels(name, character_label(state.get("character_id"))).observe(
+                time.perf_counter() - start
+            )
+
+    return wrapper
+
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Record time to first token and generation time of chat model calls.
+
+    The model comes from the ``ls_model_name`` metadata LangChain adds to chat
+    model runs, the character from the ``character_id`` metadata of the turn.
+    """
+
+    run_inline = True
+
+    def __init__(self) -> None:
+        self.__runs: dict[UUID, tuple[float, str, str, bool]] = {}
+
+    def on_chat_model_start(
+        self,
+        serialized: dict[str, Any],
+        messages: list,
+        *,
+        run_id: UUID,
+        metadata: dict[str, Any] | None = None,
+        **kwargs: Any,
+    ) -> None:
+        metadata = metadata or {}
+        self.__runs[run_id] = (
+            time.perf_counter(),
+            metadata.get("ls_model_name") or "unknown",
+            character_label(metadata.get("character_id")),
+            False,
+        )
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self.__runs.get(run_id)
+        # The stream opens with an empty chunk carrying the role, not a token
+        if run is None or run[3] or not token:
+            return
+
+        start, model, character_id, _ = run
+        LLM_TIME_TO_FIRST_TOKEN.labels(model, character_id).observe(time.perf_counter() - start)
+        self.__runs[run_id] = (start, model, character_id, True)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        run = self.__runs.pop(run_id, None)
+        if run is not None:
+            start, model, character_id, _ = run
+            LLM_GENERATION_DURATION.labels(model, character_id).observe(time.perf_counter() - start)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.__runs.pop(run_id, None)
+
+
+llm_metrics_handler = LLMMetricsHandler()
+
+
+class StatsCollector(Collector):
+    """Export the counters the caches, the prompt usage and the tracer already keep.
+
+    Read at scrape time, so nothing on the request path is counted twice.
+
+    Args:
+        cache_stats (Callable[[], dict[str, dict | None]]): Stats per cache name.
+        prompt_stats (Callable[[], dict[str, dict]]): Token usage per model.
+        tracing_stats (Callable[[], dict | None]): Counters of the tracing queue.
+    """
+
+    def __init__(
+        self,
+        cache_stats: Callable[[], dict[str, dict | None]],
+        prompt_stats: Callable[[], dict[str, dict]],
+        tracing_stats: Callable[[], dict | None],
+    ) -> None:
+        self.cache_stats = cache_stats
+        self.prompt_stats = prompt_stats
+        self.tracing_stats = tracing_stats
+
+    def collect(self):
+        hits = CounterMetricFamily("mpd_cache_hits", "Cache hits.", labels=["cache"])
+        misses = CounterMetricFamily("mpd_cache_misses", "Cache misses.", labels=["cache"])
+        hit_ratio = GaugeMetricFamily("mpd_cache_hit_ratio", "Share of lookups served by a cache.", labels=["cache"])
+        for cache, stats in self.cache_stats().items():
+            if stats is None:
+                continue
+            hits.add_metric([cache], stats["hits"])
+            misses.add_metric([cache], stats["misses"])
+            hit_ratio.add_metric([cache], stats["hit_ratio"])
+        yield from (hits, misses, hit_ratio)
+
+        calls = CounterMetricFamily("mpd_llm_calls", "Chat model calls with token usage.", labels=["model"])
+        tokens = CounterMetricFamily(
+            "mpd_llm_tokens", "Tokens used, by type: input, cached_input, output.", labels=["model", "type"]
+        )
+        cached_ratio = GaugeMetricFamily(
+            "mpd_llm_cached_prompt_ratio", "Share of prompt tokens served from the provider cache.", labels=["model"]
+        )
+        for model, usage in self.prompt_stats().items():
+            calls.add_metric([model], usage["calls"])
+            for token_type in ("input", "cached_input", "output"):
+                tokens.add_metric([model, token_type], usage[f"{token_type}_tokens"])
+            cached_ratio.add_metric([model], usage["cached_ratio"])
+        yield from (calls, tokens, cached_ratio)
+
+        tracing = self.tracing_stats()
+        if tracing is not None:
+            traces = CounterMetricFamily("mpd_traces", "Conversation traces by outcome.", labels=["outcome"])
+            for outcome in ("sent", "dropped", "failed"):
+                traces.add_metric([outcome], tracing[outcome])
+            yield traces
+            yield GaugeMetricFamily("mpd_traces_pending", "Traces waiting to be sent.", value=tracing["pending"])
+
+
+_stats_collector: StatsCollector | None = None
+
+
+def register_stats_collector(collector: StatsCollector) -> None:
+    """Register the collector with the default registry, replacing an earlier one."""
+
+    global _stats_collector
+
+    if _stats_collector is not None:
+        REGISTRY.unregister(_stats_collector)
+    REGISTRY.register(collector)
+    _stats_collector = collector
+
+
+def render_metrics() -> tuple[bytes, str]:
+    """Return the metrics in the Prometheus text format, with its content type."""
+
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
@@ -0,0 +1,85 @@
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import ChannelVersions, Checkpoint, CheckpointMetadata, CheckpointTuple
+from langgraph.checkpoint.mongodb.aio import AsyncMongoDBSaver
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from mpdagents.config import settings
+from mpdagents.infrastructure.metrics import observe_call
+
+
+def create_async_mongo_client(mongodb_uri: str = settings.MONGO_URI) -> AsyncIOMotorClient:
+    """Create a Motor client backed by a tunable connection pool.
+
+    Args:
+        mongodb_uri (str, optional): URI for connecting to MongoDB instance.
+            Defaults to value from settings.
+
+    Returns:
+        AsyncIOMotorClient: A client whose pool is sized from settings. Connections
+            are opened lazily and reused across requests.
+    """
+
+    return AsyncIOMotorClient(
+        mongodb_uri,
+        appname="mpdagents",
+        maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+        minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+        connectTimeoutMS=settings.MONGO_CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=settings.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    )
+
+
+class InstrumentedMongoDBSaver(AsyncMongoDBSaver):
+    """MongoDB checkpointer recording the latency of checkpoint loads and writes."""
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        with observe_call("checkpoint_load"):
+            return await super().aget_tuple(config)
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        with observe_call("checkpoint_write"):
+            return await super().aput(config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        with observe_call("checkpoint_write_pending"):
+            await super().aput_writes(config, writes, task_id, task_path)
+
+
+@asynccontextmanager
+async def pooled_checkpointer() -> AsyncIterator[AsyncMongoDBSaver]:
+    """Yield a MongoDB checkpointer that lives for the lifetime of the process.
+
+    Unlike ``AsyncMongoDBSaver.from_conn_string``, which opens a new client for
+    every conversation turn, the checkpointer yielded here shares one pooled
+    Motor client. It is meant to be entered once, from the API lifespan.
+
+    Yields:
+        AsyncMongoDBSaver: The shared checkpointer, timing its loads and writes.
+    """
+
+    client = create_async_mongo_client()
+    try:
+        yield InstrumentedMongoDBSaver(
+            client=client,
+            db_name=settings.MONGO_DB_NAME,
+            checkpoint_collection_name=settings.MONGO_STATE_CHECKPOINT_COLLECTION,
+            writes_collection_name=settings.MONGO_STATE_WRITES_COLLECTION,
+        )
+    finally:
+        client.close()
@@ -0,0 +1,142 @@
+import asyncio
+import json
+from contextlib import aclosing
+from typing import AsyncIterator, Literal
+
+from fastapi import WebSocket
+
+from mpdagents.config import settings
+
+# "json" sends {"chunk": ...} text frames, "binary" sends the raw UTF-8 text as
+# binary frames, which keeps them apart from the JSON control frames
+StreamFormat = Literal["json", "binary"]
+STREAM_FORMATS: tuple[str, ...] = ("json", "binary")
+
+_END_OF_STREAM = object()
+
+
+async def coalesce_chunks(
+    chunks: AsyncIterator[str],
+    max_chars: int = settings.WS_FRAME_MAX_CHARS,
+    interval_seconds: float = settings.WS_FRAME_INTERVAL_SECONDS,
+    buffer_size: int = settings.WS_STREAM_BUFFER_SIZE,
+) -> AsyncIterator[str]:
+    """Group streamed tokens into larger frames.
+
+    A frame is emitted once it holds ``max_chars`` characters, or once its
+    first token has waited ``interval_seconds``, so text still arrives promptly
+    when the model is slow. The model stream is read by a separate task into a
+    queue of ``buffer_size`` tokens: while the consumer is busy sending, tokens
+    pile up there and go out together in the next frame, and once the queue is
+    full the model stream is paused instead of buffering the whole answer.
+
+    Args:
+        chunks (AsyncIterator[str]): Streamed tokens.
+        max_chars (int, optional): Frame size that triggers a send.
+        interval_seconds (float, optional): Longest time a token is held back.
+        buffer_size (int, optional): Tokens read ahead of the consumer.
+
+    Yields:
+        str: The text of one frame.
+    """
+
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+
+    async def produce() -> None:
+        try:
+            # Closing the source releases the model stream and the thread lock
+            # it holds, also when the producer is cancelled on a full queue
+            async with aclosing(chunks):
+                async for chunk in chunks:
+                    if chunk:
+                        await queue.put(chunk)
+        except Exception as e:
+            await queue.put(e)
+        else:
+            await queue.put(_END_OF_STREAM)
+
+    producer = asyncio.create_task(produce())
+    buffer: list[str] = []
+    size = 0
+    deadline = 0.0
+
+    try:
+        while True:
+            timeout = max(0.0, deadline - loop.time()) if buffer else None
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout)
+            except asyncio.TimeoutError:
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+                continue
+
+            if item is _END_OF_STREAM:
+                break
+            if isinstance(item, Exception):
+                raise item
+
+            if not buffer:
+                deadline = loop.time() + interval_seconds
+            buffer.append(item)
+            size += len(item)
+
+            if size >= max_chars:
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+
+
+async def send_stream(
+    websocket: WebSocket,
+    chunks: AsyncIterator[str],
+    stream_format: StreamFormat = "json",
+    keep_text: bool = False,
+    send_timeout: float = settings.WS_SEND_TIMEOUT_SECONDS,
+) -> str:
+    """Send a token stream over a WebSocket as coalesced frames.
+
+    Every send is awaited, so a slow client slows down the model stream rather
+    than growing a buffer on the server.
+
+    Args:
+        websocket (WebSocket): The client socket.
+        chunks (AsyncIterator[str]): Streamed tokens.
+        stream_format (StreamFormat, optional): Framing of the text frames.
+        keep_text (bool, optional): Whether to collect and return the full text.
+        send_timeout (float, optional): Longest time a single frame may take to send.
+
+    Returns:
+        str: The full text if ``keep_text`` is set, an empty string otherwise.
+
+    Raises:
+        asyncio.TimeoutError: If the client did not accept a frame in time.
+    """
+
+    parts: list[str] = []
+
+    # Closing the frames stops the model stream, also when a send times out
+    async with aclosing(coalesce_chunks(chunks)) as frames:
+        async for frame in frames:
+            if keep_text:
+                parts.append(frame)
+
+            if stream_format == "binary":
+                await asyncio.wait_for(websocket.send_bytes(frame.encode("utf-8")), send_timeout)
+            else:
+                await asyncio.wait_for(websocket.send_json({"chunk": frame}), send_timeout)
+
+    return "".join(parts)
+
+
+def format_sse(event: str, data: dict) -> str:
+    """Encode one Server-Sent Event, with its data as a single line of JSON."""
+
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
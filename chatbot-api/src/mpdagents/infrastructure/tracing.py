@@ -0,0 +1,230 @@
+import contextvars
+import queue
+import random
+import threading
+import time
+from typing import Callable
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables.graph import Graph
+from langchain_core.tracers.schemas import Run
+from langgraph.graph.state import CompiledStateGraph
+from opik.integrations.langchain import OpikTracer
+
+from mpdagents.config import settings
+from mpdagents.infrastructure.opik_utils import configure
+
+_TraceEvent = tuple[Callable[[OpikTracer, Run], None], Run]
+
+
+class BatchedOpikTracer(OpikTracer):
+    """Process-wide Opik tracer that builds and sends spans off the request path.
+
+    LangChain calls tracers inline, on the event loop. This tracer only records
+    there which hooks ran for which run, grouped by trace. When the root run
+    ends, the whole trace goes on a bounded queue, and a worker thread replays
+    queued traces into the Opik span logic in batches, flushing the Opik client
+    after each batch. When the queue is full the trace is dropped as a whole,
+    so a request never waits on tracing and Opik never gets half a trace.
+
+    Args:
+        graph (Graph | None, optional): Graph structure stored with every trace.
+        max_pending_traces (int, optional): Finished traces waiting to be sent.
+        batch_size (int, optional): Traces sent per flush.
+        flush_interval_seconds (float, optional): Longest time a trace waits for its batch.
+    """
+
+    def __init__(
+        self,
+        graph: Graph | None = None,
+        max_pending_traces: int = settings.TRACING_QUEUE_SIZE,
+        batch_size: int = settings.TRACING_BATCH_SIZE,
+        flush_interval_seconds: float = settings.TRACING_FLUSH_INTERVAL_SECONDS,
+    ) -> None:
+        super().__init__(graph=graph)
+
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.sent = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self._open_traces: dict[UUID, list[_TraceEvent]] = {}
+        self._open_traces_lock = threading.Lock()
+        self._queue: queue.Queue[list[_TraceEvent]] = queue.Queue(maxsize=max_pending_traces)
+        self._stopping = threading.Event()
+        self._worker = threading.Thread(target=self.__work, name="opik-tracing", daemon=True)
+        self._worker.start()
+
+    def _persist_run(self, run: Run) -> None:
+        self.__record(OpikTracer._persist_run, run)
+
+    def _on_llm_start(self, run: Run) -> None:
+        self.__record(OpikTracer._on_llm_start, run)
+
+    def _on_chat_model_start(self, run: Run) -> None:
+        self.__record(OpikTracer._on_chat_model_start, run)
+
+    def _on_llm_end(self, run: Run) -> None:
+        self.__record(OpikTracer._on_llm_end, run, ends_run=True)
+
+    def _on_llm_error(self, run: Run) -> None:
+        self.__record(OpikTracer._on_llm_error, run, ends_run=True)
+
+    def _on_chain_start(self, run: Run) -> None:
+        self.__record(OpikTracer._on_chain_start, run)
+
+    def _on_chain_end(self, run: Run) -> None:
+        self.__record(OpikTracer._on_chain_end, run, ends_run=True)
+
+    def _on_chain_error(self, run: Run) -> None:
+        self.__record(OpikTracer._on_chain_error, run, ends_run=True)
+
+    def _on_tool_start(self, run: Run) -> None:
+        self.__record(OpikTracer._on_tool_start, run)
+
+    def _on_tool_end(self, run: Run) -> None:
+        self.__record(OpikTracer._on_tool_end, run, ends_run=True)
+
+    def _on_tool_error(self, run: Run) -> None:
+        self.__record(OpikTracer._on_tool_error, run, ends_run=True)
+
+    def __record(self, hook: Callable[[OpikTracer, Run], None], run: Run, ends_run: bool = False) -> None:
+        trace_id = run.trace_id or run.id
+
+        with self._open_traces_lock:
+            events = self._open_traces.setdefault(trace_id, [])
+            events.append((hook, run))
+
+            # The end or error hook of the root run is the last call of a trace
+            if not ends_run or run.parent_run_id is not None:
+                return
+            del self._open_traces[trace_id]
+
+        # A long-lived tracer has to forget the run order itself, LangChain only
+        # clears it when the tracer is garbage collected
+        for _, traced_run in events:
+            self.order_map.pop(traced_run.id, None)
+
+        try:
+            self._queue.put_nowait(events)
+        except queue.Full:
+            self.dropped += 1
+
+    def __work(self) -> None:
+        while not (self._stopping.is_set() and self._queue.empty()):
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval_seconds)]
+            except queue.Empty:
+                continue
+
+            deadline = time.monotonic() + self.flush_interval_seconds
+            while len(batch) < self.batch_size and not self._stopping.is_set():
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+
+            for events in batch:
+                try:
+                    # Each trace is replayed in an empty context, so the spans OpikTracer
+                    # pushes on the Opik context stack never leak into the next trace
+                    contextvars.Context().run(self.__replay, events)
+                    self.sent += 1
+                except Exception as e:
+                    self.failed += 1
+                    print(f"Failed to trace a conversation turn: {e}")
+
+            # Sent traces are kept by OpikTracer for inspection, which a process-wide tracer can't afford
+            self._created_traces.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Failed to flush traces to Opik: {e}")
+
+            for _ in batch:
+                self._queue.task_done()
+
+    def __replay(self, events: list[_TraceEvent]) -> None:
+        for hook, run in events:
+            hook(self, run)
+
+    def close(self, timeout: float = settings.TRACING_SHUTDOWN_TIMEOUT_SECONDS) -> None:
+        """Send the queued traces within ``timeout`` seconds and stop the worker."""
+
+        self._stopping.set()
+        self._worker.join(timeout)
+        if self._worker.is_alive():
+            print(f"Dropping {self._queue.qsize()} pending traces on shutdown")
+
+    def stats(self) -> dict:
+        return {
+            "pending": self._queue.qsize(),
+            "open": len(self._open_traces),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "failed": self.failed,
+        }
+
+
+_tracer: BatchedOpikTracer | None = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer(graph: CompiledStateGraph | None = None) -> BatchedOpikTracer:
+    """Return the process-wide tracer, rendering ``graph`` into it on first use."""
+
+    global _tracer
+
+    if _tracer is None:
+        with _tracer_lock:
+            if _tracer is None:
+                _tracer = BatchedOpikTracer(graph=graph.get_graph(xray=True) if graph is not None else None)
+
+    return _tracer
+
+
+def init_tracing(graph: CompiledStateGraph | None = None) -> None:
+    """Configure Opik, then create the process-wide tracer. Blocks, call it from a thread.
+
+    The tracer binds the Opik client when it is created, so it must not exist
+    before Opik is configured; turns are not traced until this has run.
+    """
+
+    configure()
+    get_tracer(graph)
+
+
+def tracing_callbacks(endpoint: str) -> list[BaseCallbackHandler]:
+    """Return the callbacks of one traced turn, or none if the turn is not sampled.
+
+    Args:
+        endpoint (str): Name of the endpoint, used to look up its sample rate.
+
+    Returns:
+        list[BaseCallbackHandler]: The shared tracer, or an empty list, also
+        until `init_tracing` has run.
+    """
+
+    sample_rate = settings.TRACING_SAMPLE_RATES.get(endpoint, settings.TRACING_SAMPLE_RATE)
+    if _tracer is None or sample_rate <= 0 or random.random() >= sample_rate:
+        return []
+
+    return [_tracer]
+
+
+def close_tracing() -> None:
+    """Send the queued traces and stop the tracing worker. Blocks, call it from a thread."""
+
+    global _tracer
+
+    with _tracer_lock:
+        tracer, _tracer = _tracer, None
+
+    if tracer is not None:
+        tracer.close()
+
+
+def get_tracing_stats() -> dict | None:
+    return _tracer.stats() if _tracer is not None else None
@@ -0,0 +1,73 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any
+
+
+@dataclass(frozen=True)
+class VectorRecord:
+    """A vector to store, with its identifier and metadata."""
+
+    id: str
+    values: list[float]
+    metadata: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class VectorMatch:
+    """A single search hit."""
+
+    id: str
+    score: float
+    metadata: dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass(frozen=True)
+class VectorQueryResult:
+    """Search hits ordered by decreasing score."""
+
+    matches: list[VectorMatch] = field(default_factory=list)
+    namespace: str = ""
+
+
+class VectorStore(ABC):
+    """Backend-agnostic interface used by the RAG retriever and the ingestion pipeline.
+
+    Implementations are long-lived: `start` is called once before the first
+    request and `close` once on shutdown.
+    """
+
+    async def start(self) -> None:
+        """Open connections and validate the backend. Called once before use."""
+
+        return None
+
+    @abstractmethod
+    async def query(self, vector: list[float], top_k: int, namespace: str) -> VectorQueryResult:
+        """Return the ``top_k`` records closest to ``vector`` in ``namespace``."""
+
+    @abstractmethod
+    async def upsert(self, records: list[VectorRecord], namespace: str) -> None:
+        """Insert or replace records in ``namespace``."""
+
+    @abstractmethod
+    async def existing_ids(self, ids: list[str], namespace: str) -> set[str]:
+        """Return the subset of ``ids`` already stored in ``namespace``."""
+
+    @abstractmethod
+    async def delete(self, ids: list[str], namespace: str) -> None:
+        """Remove records from ``namespace``. Unknown ids are ignored."""
+
+    async def optimize(self, namespace: str) -> None:
+        """Rebuild search structures of ``namespace`` after a bulk write, e.g. an ingestion run."""
+
+        return None
+
+    def reload(self, namespace: str | None = None) -> None:
+        """Drop what is cached of ``namespace``, or of every namespace, so the next call reads the backend again."""
+
+        return None
+
+    async def close(self) -> None:
+        """Release resources held by the backend."""
+
+        return None
@@ -0,0 +1,29 @@
+from mpdagents.config import settings
+
+from .base import VectorStore
+
+
+def create_vector_store(backend: str = settings.VECTOR_STORE_BACKEND) -> VectorStore:
+    """Instantiate the vector store backend selected in settings.
+
+    Args:
+        backend (str, optional): Either "pinecone" or "local".
+
+    Returns:
+        VectorStore: A backend that still needs to be started with `start()`.
+
+    Raises:
+        ValueError: If the backend is unknown.
+    """
+
+    if backend == "pinecone":
+        from .pinecone_store import PineconeVectorStore
+
+        return PineconeVectorStore()
+
+    if backend == "local":
+        from .local_store import LocalVectorStore
+
+        return LocalVectorStore()
+
+    raise ValueError(f"Unknown vector store backend '{backend}'. Available backends: ['pinecone', 'local']")
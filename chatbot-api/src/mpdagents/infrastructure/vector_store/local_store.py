@@ -0,0 +1,481 @@
+import asyncio
+import json
+import math
+import os
+from pathlib import Path
+
+import numpy as np
+
+from mpdagents.config import settings
+
+from .base import VectorMatch, VectorQueryResult, VectorRecord, VectorStore
+
+_POINTER_FILE = "snapshot.json"
+# Files of namespaces written before the versioned layout, read until their next write
+_LEGACY_VECTORS_FILE = "vectors.f32"
+_LEGACY_METADATA_FILE = "metadata.json"
+_LEGACY_IVF_FILE = "ivf.npz"
+
+
+def _empty_pointer(version: int = 1) -> dict:
+    return {
+        "version": version,
+        "vectors": f"vectors.{version}.f32",
+        "metadata": f"metadata.{version}.jsonl",
+        "rows": 0,
+        "metadata_bytes": 0,
+        "dimension": 0,
+        "ivf": None,
+        "ivf_rows": 0,
+    }
+
+
+def _pointer_stamp(directory: Path) -> tuple[int, int, int] | None:
+    """Identity of the current ``snapshot.json``, which changes with every write."""
+
+    try:
+        stat = os.stat(directory / _POINTER_FILE)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _kmeans(vectors: np.ndarray, n_lists: int, iterations: int = 10, seed: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    """Spherical k-means returning (centroids, assignment of each vector)."""
+
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=n_lists, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        for list_id in range(n_lists):
+            members = vectors[assignments == list_id]
+            if len(members):
+                centroids[list_id] = members.mean(axis=0)
+        centroids = _normalize_rows(centroids)
+
+    return centroids, np.argmax(vectors @ centroids.T, axis=1).astype(np.int32)
+
+
+class _Namespace:
+    """Memory-mapped snapshot of one namespace.
+
+    On disk a namespace is a vectors file and a metadata log of one version,
+    plus ``snapshot.json`` naming them and how many rows and log bytes belong
+    to the namespace. Writers append past the end of the files and then
+    replace ``snapshot.json``, the only step that needs to be atomic, so
+    readers and a crash never see half a write: anything past the recorded
+    sizes is ignored and overwritten by the next write. Deletes write the
+    next version and swap the pointer to it.
+
+    Snapshots extending each other share their id and metadata lists, which
+    only grow; each snapshot reads its own prefix of them. ``stamp`` identifies
+    the ``snapshot.json`` a snapshot was read from or written as.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        pointer: dict,
+        ids: list[str],
+        metadata: list[dict],
+        row_by_id: dict[str, int],
+        centroids: np.ndarray | None = None,
+        assignments: np.ndarray | None = None,
+        inverted_lists: list[np.ndarray] | None = None,
+        stamp: tuple[int, int, int] | None = None,
+    ) -> None:
+        self.directory = directory
+        self.stamp = stamp
+        self.pointer = pointer
+        self.ids = ids
+        self.metadata = metadata
+        self.row_by_id = row_by_id
+        self.centroids = centroids
+        self.assignments = assignments
+        self.inverted_lists = inverted_lists or []
+        if centroids is not None and inverted_lists is None:
+            self.inverted_lists = [np.flatnonzero(assignments == list_id) for list_id in range(len(centroids))]
+
+        self.vectors: np.ndarray = np.zeros((0, 0), dtype=np.float32)
+        if pointer["rows"]:
+            self.vectors = np.memmap(
+                directory / pointer["vectors"],
+                dtype=np.float32,
+                mode="r",
+                shape=(pointer["rows"], pointer["dimension"]),
+            )
+
+    @classmethod
+    def load(cls, directory: Path) -> "_Namespace":
+        ids: list[str] = []
+        metadata: list[dict] = []
+        pointer_path = directory / _POINTER_FILE
+        # Taken first: a pointer replaced while loading only causes another reload
+        stamp = _pointer_stamp(directory)
+
+        if pointer_path.exists():
+            pointer = json.loads(pointer_path.read_text(encoding="utf-8"))
+            with open(directory / pointer["metadata"], "rb") as log:
+                entries = log.read(pointer["metadata_bytes"]).splitlines()
+            for entry in entries:
+                row, id_, row_metadata = json.loads(entry)
+                if row == len(ids):
+                    ids.append(id_)
+                    metadata.append(row_metadata)
+                else:
+                    ids[row], metadata[row] = id_, row_metadata
+        elif (directory / _LEGACY_METADATA_FILE).exists():
+            sidecar = json.loads((directory / _LEGACY_METADATA_FILE).read_text(encoding="utf-8"))
+            ids, metadata = sidecar["ids"], sidecar["metadata"]
+            pointer = {
+                **_empty_pointer(0),
+                "vectors": _LEGACY_VECTORS_FILE,
+                # No log to append to: the first write converts the namespace
+                "metadata": None,
+                "rows": len(ids),
+                "dimension": sidecar["dimension"],
+                "ivf": _LEGACY_IVF_FILE if (directory / _LEGACY_IVF_FILE).exists() else None,
+                "ivf_rows": len(ids),
+            }
+        else:
+            pointer = _empty_pointer()
+
+        centroids = assignments = None
+        if pointer["ivf"]:
+            ivf = np.load(directory / pointer["ivf"])
+            centroids, assignments = ivf["centroids"], ivf["assignments"]
+
+        row_by_id = {id_: row for row, id_ in enumerate(ids)}
+        return cls(directory, pointer, ids, metadata, row_by_id, centroids, assignments, stamp=stamp)
+
+    def candidate_rows(self, query: np.ndarray, n_probe: int) -> np.ndarray | None:
+        """Rows from the ``n_probe`` closest IVF lists, or None to scan everything."""
+
+        if self.centroids is None:
+            return None
+
+        n_probe = min(n_probe, len(self.centroids))
+        closest_lists = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+        rows = [self.inverted_lists[list_id] for list_id in closest_lists]
+        # Rows appended since the IVF was built are in no list yet, so they are all scanned
+        if self.pointer["ivf_rows"] < len(self.vectors):
+            rows.append(np.arange(self.pointer["ivf_rows"], len(self.vectors)))
+        return np.concatenate(rows)
+
+    def search(self, query: np.ndarray, top_k: int, n_probe: int) -> list[tuple[int, float]]:
+        if not len(self.vectors) or top_k <= 0:
+            return []
+
+        rows = self.candidate_rows(query, n_probe)
+        scores = (self.vectors if rows is None else self.vectors[rows]) @ query
+
+        top_k = min(top_k, len(scores))
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best])]
+        if rows is not None:
+            return [(int(rows[i]), float(scores[i])) for i in best]
+        return [(int(i), float(scores[i])) for i in best]
+
+
+class LocalVectorStore(VectorStore):
+    """Vector store kept on local disk and queried with vectorized dot products.
+
+    Each namespace is a directory holding a float32 matrix of unit-normalized
+    vectors (memory-mapped for queries) and a log of ids and metadata, see
+    `_Namespace`. Upserts append to them, so ingesting is linear in the
+    number of vectors. Writes from another process, such as the ingestion
+    CLI, are picked up by the next call touching the namespace, which reloads
+    it once its ``snapshot.json`` changed. Scores are cosine similarities. Once a namespace has
+    at least ``ivf_min_vectors`` vectors, `optimize` gives it an IVF
+    partitioning, so a query only scans the ``n_probe`` closest partitions
+    and the vectors added since.
+
+    Args:
+        path (str, optional): Root directory of the store.
+        ivf_min_vectors (int, optional): Size above which an IVF index is built.
+        n_probe (int, optional): Number of IVF partitions scanned per query.
+    """
+
+    def __init__(
+        self,
+        path: str = settings.LOCAL_VECTOR_STORE_PATH,
+        ivf_min_vectors: int = settings.LOCAL_VECTOR_STORE_IVF_MIN_VECTORS,
+        n_probe: int = settings.LOCAL_VECTOR_STORE_IVF_PROBES,
+    ) -> None:
+        self.path = Path(path)
+        self.ivf_min_vectors = ivf_min_vectors
+        self.n_probe = n_probe
+        self.__namespaces: dict[str, _Namespace] = {}
+        self.__write_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def __directory(self, namespace: str) -> Path:
+        return self.path / (namespace or "__default__")
+
+    def __namespace(self, namespace: str) -> _Namespace:
+        directory = self.__directory(namespace)
+        snapshot = self.__namespaces.get(namespace)
+        if snapshot is None or snapshot.stamp != _pointer_stamp(directory):
+            try:
+                snapshot = _Namespace.load(directory)
+            except (OSError, ValueError):
+                # Caught mid-write by another process: the memory map of the
+                # previous snapshot stays readable, the next call retries
+                if snapshot is None:
+                    raise
+            else:
+                self.__namespaces[namespace] = snapshot
+        return snapshot
+
+    def reload(self, namespace: str | None = None) -> None:
+        if namespace is None:
+            self.__namespaces.clear()
+        else:
+            self.__namespaces.pop(namespace, None)
+
+    async def query(self, vector: list[float], top_k: int, namespace: str) -> VectorQueryResult:
+        query = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        snapshot = self.__namespace(namespace)
+        hits = await asyncio.to_thread(snapshot.search, query, top_k, self.n_probe)
+
+        return VectorQueryResult(
+            matches=[
+                VectorMatch(id=snapshot.ids[row], score=score, metadata=snapshot.metadata[row])
+                for row, score in hits
+            ],
+            namespace=namespace,
+        )
+
+    async def existing_ids(self, ids: list[str], namespace: str) -> set[str]:
+        row_by_id = self.__namespace(namespace).row_by_id
+        return {id_ for id_ in ids if id_ in row_by_id}
+
+    async def upsert(self, records: list[VectorRecord], namespace: str) -> None:
+        if not records:
+            return
+
+        async with self.__write_lock:
+            snapshot = self.__namespace(namespace)
+            if snapshot.pointer["metadata"] is None:
+                snapshot = await asyncio.to_thread(self.__compact, namespace, snapshot, list(range(len(snapshot.ids))))
+
+            new_vectors = _normalize_rows(np.asarray([record.values for record in records], dtype=np.float32))
+            if snapshot.pointer["rows"] and snapshot.pointer["dimension"] != new_vectors.shape[1]:
+                raise ValueError(
+                    f"Dimension mismatch in namespace '{namespace}': "
+                    f"expected {snapshot.pointer['dimension']}, got {new_vectors.shape[1]}"
+                )
+
+            rows = snapshot.pointer["rows"]
+            replaced: list[tuple[int, np.ndarray]] = []
+            appended: list[np.ndarray] = []
+            appended_rows: dict[str, int] = {}
+            entries: list[tuple[int, str, dict]] = []
+            for record, vector in zip(records, new_vectors):
+                row = snapshot.row_by_id.get(record.id)
+                if row is None:
+                    row = appended_rows.get(record.id)
+                if row is None:
+                    row = appended_rows[record.id] = rows + len(appended)
+                    appended.append(vector)
+                elif row >= rows:
+                    # Same id twice in one batch: the last occurrence wins
+                    appended[row - rows] = vector
+                else:
+                    replaced.append((row, vector))
+                entries.append((row, record.id, record.metadata))
+
+            await asyncio.to_thread(self.__append, namespace, snapshot, replaced, appended, entries)
+
+    async def delete(self, ids: list[str], namespace: str) -> None:
+        async with self.__write_lock:
+            snapshot = self.__namespace(namespace)
+            to_delete = set(ids)
+            keep = [row for row, id_ in enumerate(snapshot.ids) if id_ not in to_delete]
+            if len(keep) == len(snapshot.ids):
+                return
+
+            await asyncio.to_thread(self.__compact, namespace, snapshot, keep)
+
+    async def optimize(self, namespace: str) -> None:
+        """Build the IVF partitioning once a namespace is large enough, or refresh it with the new vectors."""
+
+        async with self.__write_lock:
+            snapshot = self.__namespace(namespace)
+            rows = snapshot.pointer["rows"]
+            if rows >= self.ivf_min_vectors and (snapshot.centroids is None or snapshot.pointer["ivf_rows"] < rows):
+                await asyncio.to_thread(self.build_ivf, namespace)
+            elif rows < self.ivf_min_vectors and snapshot.centroids is not None:
+                await asyncio.to_thread(self.__swap, namespace, snapshot, {**snapshot.pointer, "ivf": None, "ivf_rows": 0})
+
+    def build_ivf(self, namespace: str, n_lists: int | None = None) -> None:
+        """(Re)build the IVF partitioning of a namespace from its stored vectors."""
+
+        snapshot = self.__namespace(namespace)
+        pointer = snapshot.pointer
+        vectors = np.asarray(snapshot.vectors)
+        n_lists = n_lists or max(1, int(math.sqrt(len(vectors))))
+        centroids, assignments = _kmeans(vectors, min(n_lists, len(vectors)))
+
+        ivf_file = f"ivf.{pointer['version']}.{len(vectors)}.npz"
+        np.savez(snapshot.directory / ivf_file, centroids=centroids, assignments=assignments)
+        self.__swap(
+            namespace,
+            snapshot,
+            {**pointer, "ivf": ivf_file, "ivf_rows": len(vectors)},
+            centroids=centroids,
+            assignments=assignments,
+        )
+
+    def __append(
+        self,
+        namespace: str,
+        snapshot: _Namespace,
+        replaced: list[tuple[int, np.ndarray]],
+        appended: list[np.ndarray],
+        entries: list[tuple[int, str, dict]],
+    ) -> None:
+        pointer = snapshot.pointer
+        directory = self.__directory(namespace)
+        directory.mkdir(parents=True, exist_ok=True)
+        dimension = pointer["dimension"] or len((appended or [vector for _, vector in replaced])[0])
+        row_bytes = dimension * np.dtype(np.float32).itemsize
+
+        vectors_path = directory / pointer["vectors"]
+        with open(vectors_path, "r+b" if vectors_path.exists() else "wb") as file:
+            # Replaced vectors are visible to queries right away; with content-hash
+            # ids this only happens when a namespace is re-embedded
+            for row, vector in replaced:
+                file.seek(row * row_bytes)
+                file.write(vector.astype(np.float32).tobytes())
+            # Drops whatever an interrupted write left past the committed rows
+            file.truncate(pointer["rows"] * row_bytes)
+            file.seek(pointer["rows"] * row_bytes)
+            if appended:
+                file.write(np.asarray(appended, dtype=np.float32).tobytes())
+
+        metadata_path = directory / pointer["metadata"]
+        log = b"".join(json.dumps([row, id_, metadata]).encode("utf-8") + b"\n" for row, id_, metadata in entries)
+        with open(metadata_path, "r+b" if metadata_path.exists() else "wb") as file:
+            file.truncate(pointer["metadata_bytes"])
+            file.seek(pointer["metadata_bytes"])
+            file.write(log)
+
+        new_pointer = {
+            **pointer,
+            "rows": pointer["rows"] + len(appended),
+            "metadata_bytes": pointer["metadata_bytes"] + len(log),
+            "dimension": dimension,
+        }
+        stamp = self.__write_pointer(directory, new_pointer)
+
+        ids, metadata, row_by_id = snapshot.ids, snapshot.metadata, snapshot.row_by_id
+        for row, id_, row_metadata in entries:
+            if row == len(ids):
+                ids.append(id_)
+                metadata.append(row_metadata)
+                row_by_id[id_] = row
+            else:
+                metadata[row] = row_metadata
+        self.__namespaces[namespace] = _Namespace(
+            directory,
+            new_pointer,
+            ids,
+            metadata,
+            row_by_id,
+            snapshot.centroids,
+            snapshot.assignments,
+            snapshot.inverted_lists if snapshot.centroids is not None else None,
+            stamp=stamp,
+        )
+
+    def __compact(self, namespace: str, snapshot: _Namespace, keep: list[int]) -> _Namespace:
+        # Writes the kept rows as the next version, which the pointer then switches to
+        directory = self.__directory(namespace)
+        directory.mkdir(parents=True, exist_ok=True)
+        pointer = _empty_pointer(snapshot.pointer["version"] + 1)
+        ids = [snapshot.ids[row] for row in keep]
+        metadata = [snapshot.metadata[row] for row in keep]
+
+        vectors = np.asarray(snapshot.vectors[keep], dtype=np.float32) if keep else np.zeros((0, 0), np.float32)
+        vectors.tofile(directory / pointer["vectors"])
+        log = b"".join(
+            json.dumps([row, id_, row_metadata]).encode("utf-8") + b"\n"
+            for row, (id_, row_metadata) in enumerate(zip(ids, metadata))
+        )
+        (directory / pointer["metadata"]).write_bytes(log)
+        pointer.update(rows=len(ids), metadata_bytes=len(log), dimension=int(vectors.shape[1]) if keep else 0)
+
+        centroids = assignments = None
+        if snapshot.centroids is not None and keep:
+            # Rows keep their partition; rows appended after the IVF was built stay unpartitioned
+            partitioned = [row for row in keep if row < snapshot.pointer["ivf_rows"]]
+            centroids, assignments = snapshot.centroids, snapshot.assignments[partitioned]
+            pointer["ivf"] = f"ivf.{pointer['version']}.{len(partitioned)}.npz"
+            pointer["ivf_rows"] = len(partitioned)
+            np.savez(directory / pointer["ivf"], centroids=centroids, assignments=assignments)
+
+        return self.__swap(
+            namespace,
+            snapshot,
+            pointer,
+            ids=ids,
+            metadata=metadata,
+            row_by_id={id_: row for row, id_ in enumerate(ids)},
+            centroids=centroids,
+            assignments=assignments,
+        )
+
+    def __swap(
+        self,
+        namespace: str,
+        snapshot: _Namespace,
+        pointer: dict,
+        ids: list[str] | None = None,
+        metadata: list[dict] | None = None,
+        row_by_id: dict[str, int] | None = None,
+        centroids: np.ndarray | None = None,
+        assignments: np.ndarray | None = None,
+    ) -> _Namespace:
+        # Points the namespace to new files, then removes the ones no longer named
+        directory = self.__directory(namespace)
+        stamp = self.__write_pointer(directory, pointer)
+        new_snapshot = _Namespace(
+            directory,
+            pointer,
+            snapshot.ids if ids is None else ids,
+            snapshot.metadata if metadata is None else metadata,
+            snapshot.row_by_id if row_by_id is None else row_by_id,
+            centroids,
+            assignments,
+            stamp=stamp,
+        )
+        self.__namespaces[namespace] = new_snapshot
+
+        old = snapshot.pointer
+        current = {pointer["vectors"], pointer["metadata"], pointer["ivf"]}
+        legacy = [_LEGACY_METADATA_FILE] if old["metadata"] is None else []
+        for name in [old["vectors"], old["metadata"], old["ivf"], *legacy]:
+            if name and name not in current:
+                # Open memory maps of older snapshots keep the data until they are dropped
+                (directory / name).unlink(missing_ok=True)
+        return new_snapshot
+
+    def __write_pointer(self, directory: Path, pointer: dict) -> tuple[int, int, int] | None:
+        pointer_tmp = directory / f"{_POINTER_FILE}.tmp"
+        pointer_tmp.write_text(json.dumps(pointer), encoding="utf-8")
+        os.replace(pointer_tmp, directory / _POINTER_FILE)
+        return _pointer_stamp(directory)
@@ -0,0 +1,89 @@
+from pinecone import NotFoundException, PineconeAsyncio
+
+from mpdagents.config import settings
+
+from .base import VectorMatch, VectorQueryResult, VectorRecord, VectorStore
+
+
+class PineconeVectorStore(VectorStore):
+    """Vector store backed by a serverless Pinecone index, over pooled async HTTP.
+
+    Args:
+        api_key (str | None, optional): Pinecone API key.
+        index_name (str | None, optional): Name of an existing index.
+    """
+
+    def __init__(
+        self,
+        api_key: str | None = settings.PINECONE_API_KEY,
+        index_name: str | None = settings.PINECONE_INDEX_NAME,
+    ) -> None:
+        if not api_key or not index_name:
+            raise ValueError("PINECONE_API_KEY and PINECONE_INDEX_NAME must be set to use Pinecone.")
+
+        self.index_name = index_name
+        self._client = PineconeAsyncio(api_key=api_key)
+        self._index = None
+
+    async def start(self) -> None:
+        """Validate that the index exists and open a pooled connection to it.
+
+        Raises:
+            ValueError: If the index does not exist.
+        """
+
+        try:
+            description = await self._client.describe_index(self.index_name)
+        except NotFoundException as e:
+            raise ValueError(f"Index '{self.index_name}' does not exist. Please create it first.") from e
+
+        self._index = self._client.IndexAsyncio(
+            host=description.host,
+            connection_pool_maxsize=settings.RAG_HTTP_MAX_CONNECTIONS,
+        )
+        print(f"Successfully connected to Pinecone index: '{self.index_name}'")
+
+    async def __get_index(self):
+        if self._index is None:
+            await self.start()
+        return self._index
+
+    async def query(self, vector: list[float], top_k: int, namespace: str) -> VectorQueryResult:
+        index = await self.__get_index()
+        response = await index.query(
+            namespace=namespace,
+            vector=vector,
+            top_k=top_k,
+            include_metadata=True,
+        )
+
+        return VectorQueryResult(
+            matches=[
+                VectorMatch(id=match.id, score=match.score, metadata=match.metadata or {})
+                for match in response.matches
+            ],
+            namespace=namespace,
+        )
+
+    async def upsert(self, records: list[VectorRecord], namespace: str) -> None:
+        index = await self.__get_index()
+        await index.upsert(
+            vectors=[(record.id, record.values, record.metadata) for record in records],
+            namespace=namespace,
+        )
+
+    async def existing_ids(self, ids: list[str], namespace: str) -> set[str]:
+        index = await self.__get_index()
+        response = await index.fetch(ids=ids, namespace=namespace)
+
+        return set(response.vectors.keys())
+
+    async def delete(self, ids: list[str], namespace: str) -> None:
+        index = await self.__get_index()
+        await index.delete(ids=ids, namespace=namespace)
+
+    async def close(self) -> None:
+        if self._index is not None:
+            await self._index.close()
+            self._index = None
+        await self._client.close()
@@ -3,6 +3,7 @@ import requests
 import json
 from datetime import datetime
 from typing import List, Dict
+import uuid
 import numpy as np
 import logging
 
@@ -33,39 +34,58 @@ if "threads" not in st.session_state:
     st.session_state.threads = set()
 if "messages" not in st.session_state:
     st.session_state.messages = {}
+if "user_id" not in st.session_state:
+    # Sent as X-User-Id, so the API rate-limits each browser session on its own
+    st.session_state.user_id = uuid.uuid4().hex
 
 # === Helper Functions ===
-def send_message_to_api(message: str, thread_id: str) -> str:
-    """Send message to the FastAPI backend (Logs thread and character choice)."""
+def stream_message_from_api(message: str, thread_id: str):
+    """Stream the reply from the SSE endpoint, yielding text as it arrives."""
+    charater_id_no = np.random.randint(0, 4)
+    available_character_ids = ["motivator", "comedian", "philosopher", "intelligent"]
+    selected_character_id = available_character_ids[charater_id_no]
+    logging.info(f"Streaming message from API | thread_id='{thread_id}', character_id='{selected_character_id}', message='{message[:50]}'")
     try:
-        charater_id_no = np.random.randint(0, 4)
-        available_character_ids = ["motivator", "comedian", "philosopher", "intelligent"]
-        selected_character_id = available_character_ids[charater_id_no]
-        logging.info(f"Sending message to API | thread_id='{thread_id}', character_id='{selected_character_id}', message='{message[:50]}'")
-        response = requests.post(
-            f"{API_BASE_URL}/chat",
+        # The read timeout applies between events, so long answers are not cut off
+        with requests.post(
+            f"{API_BASE_URL}/chat/stream",
             json={
                 "message": message,
                 "thread_id": thread_id,
                 "character_id": selected_character_id
             },
-            timeout=30
-        )
-        if response.status_code == 200:
-            reply = response.json()["response"]
-            logging.info(f"API response for thread_id='{thread_id}' | character_id='{selected_character_id}' | response='{reply[:50]}'")
-            return reply
-        else:
-            error_detail = (
-                response.json().get("detail", "Unknown error") 
-                if response.headers.get("content-type") == "application/json" 
-                else response.text
-            )
-            logging.error(f"API error {response.status_code} for thread_id='{thread_id}': {error_detail}")
-            return f"Error: {response.status_code} - {error_detail}"
+            headers={"X-User-Id": st.session_state.user_id},
+            stream=True,
+            timeout=(5, 30)
+        ) as response:
+            if response.status_code != 200:
+                error_detail = (
+                    response.json().get("detail", "Unknown error")
+                    if response.headers.get("content-type") == "application/json"
+                    else response.text
+                )
+                logging.error(f"API error {response.status_code} for thread_id='{thread_id}': {error_detail}")
+                yield f"Error: {response.status_code} - {error_detail}"
+                return
+
+            event = None
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[len("event: "):]
+                elif line.startswith("data: "):
+                    data = json.loads(line[len("data: "):])
+                    if event == "token":
+                        yield data["chunk"]
+                    elif event == "error":
+                        logging.error(f"API stream error for thread_id='{thread_id}': {data['error']}")
+                        yield f"\n\nError: {data['error']}"
+                        return
+                    elif event == "done":
+                        logging.info(f"API stream finished for thread_id='{thread_id}' | character_id='{selected_character_id}'")
+                        return
     except requests.exceptions.RequestException as e:
         logging.error(f"Connection error for thread_id='{thread_id}': {str(e)}")
-        return f"Connection error: {str(e)}"
+        yield f"Connection error: {str(e)}"
 
 def load_thread_messages(thread_id: str):
     """Load messages for a thread from local storage."""
@@ -156,9 +176,9 @@ if st.session_state.current_thread:
         with st.chat_message("user"):
             st.write(prompt)
         with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                response = send_message_to_api(prompt, st.session_state.current_thread)
-                st.write(response)
+            response = st.write_stream(
+                stream_message_from_api(prompt, st.session_state.current_thread)
+            )
         add_message_to_thread(st.session_state.current_thread, "assistant", response)
         st.rerun()
 else: